@@ -1,2 +1,16 @@
-def hello() -> str:
-    return "Hello from kvlangtester!"
+"""Pure-Python, incremental parser and symbol index for the Kivy KV language."""
+
+from .index import SymbolIndex, id_scope, references, rule_names
+from .lint import Diagnostic, lint, lint_source
+from .nodes import (
+    CANVAS, CONTAINERS, DIRECTIVE, DOCUMENT, ERROR, HANDLER, ID, INSTRUCTION, PROPERTY, RULE, TEMPLATE,
+    WIDGET, Node,
+)
+from .parser import Document, parse
+
+__all__ = [
+    'CANVAS', 'CONTAINERS', 'DIRECTIVE', 'DOCUMENT', 'ERROR', 'HANDLER', 'ID', 'INSTRUCTION', 'PROPERTY',
+    'RULE', 'TEMPLATE', 'WIDGET',
+    'Diagnostic', 'Document', 'Node', 'SymbolIndex',
+    'id_scope', 'lint', 'lint_source', 'parse', 'references', 'rule_names',
+]
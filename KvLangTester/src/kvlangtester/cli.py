@@ -0,0 +1,326 @@
+"""
+kvlangtester command: lint every .kv file under the given paths.
+
+    kvlangtester [PATH ...] [--format text|json|sarif] [--jobs N]
+    kvlangtester [PATH ...] --benchmark
+
+Files are linted across a process pool and the results are cached by
+content hash (.kvlangtester-cache.json), so an unchanged file is not
+parsed again. Whether a widget class exists is decided over the whole
+run: Kivy's own classes, every rule in the scanned .kv files and every
+class in the scanned .py files. Run it on a project directory rather than
+on single .kv files.
+
+Exit status is 1 when a diagnostic at or above --fail-on is found.
+"""
+
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from .lint import (
+    ERROR_SEVERITY, KIVY_CLASSES, LINT_VERSION, RULES, WARNING_SEVERITY, Diagnostic, lint_source,
+    python_classes, undefined_names, unknown_widgets,
+)
+
+DEFAULT_CACHE = '.kvlangtester-cache.json'
+SKIP_DIRS = frozenset(('__pycache__', 'node_modules', 'venv', 'env', 'build', 'dist', 'site-packages'))
+# Below this many files to parse, starting a pool costs more than it saves
+POOL_MIN_FILES = 32
+# Cache entries not used by the current run are dropped past this size
+CACHE_MAX_ENTRIES = 20000
+
+SARIF_SCHEMA = 'https://json.schemastore.org/sarif-2.1.0.json'
+
+
+def _version() -> str:
+    try:
+        from importlib.metadata import version
+        return version('kvlangtester')
+    except Exception:  # running from a source tree
+        return '0.0.0'
+
+
+def collect(paths: Iterable[str], exclude: Sequence[str] = ()) -> Tuple[List[str], List[str]]:
+    """(.kv files, .py files) under `paths`, skipping hidden and build directories."""
+    kv_files: Set[str] = set()
+    py_files: Set[str] = set()
+
+    def excluded(path: str) -> bool:
+        return any(fnmatch.fnmatch(path, pattern) or fnmatch.fnmatch(os.path.basename(path), pattern)
+                   for pattern in exclude)
+
+    for path in paths:
+        if os.path.isfile(path):
+            # Files named explicitly are linted whatever their extension
+            (py_files if path.endswith('.py') else kv_files).add(os.path.normpath(path))
+            continue
+        for folder, dirs, files in os.walk(path):
+            dirs[:] = sorted(d for d in dirs if not d.startswith('.') and d not in SKIP_DIRS
+                             and not excluded(os.path.join(folder, d)))
+            for name in files:
+                full = os.path.normpath(os.path.join(folder, name))
+                if excluded(full):
+                    continue
+                if name.endswith('.kv'):
+                    kv_files.add(full)
+                elif name.endswith('.py'):
+                    py_files.add(full)
+    return sorted(kv_files), sorted(py_files)
+
+
+class ResultCache:
+    """Lint results keyed by file content hash, stored as one JSON file."""
+
+    def __init__(self, path: Optional[str]) -> None:
+        self.path = path
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.used: Set[str] = set()
+        self.dirty = False
+        self.key = f"{LINT_VERSION}:{_version()}"
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    data = json.load(f)
+                if data.get('key') == self.key:
+                    self.entries = data.get('entries', {})
+            except (OSError, ValueError):
+                pass  # unreadable cache: start over
+
+    def get(self, digest: str) -> Optional[Dict[str, Any]]:
+        facts = self.entries.get(digest)
+        if facts is not None:
+            self.used.add(digest)
+        return facts
+
+    def put(self, digest: str, facts: Dict[str, Any]) -> None:
+        self.entries[digest] = facts
+        self.used.add(digest)
+        self.dirty = True
+
+    def save(self) -> None:
+        if not self.path or not self.dirty:
+            return
+        entries = self.entries
+        if len(entries) > CACHE_MAX_ENTRIES:
+            entries = {digest: entries[digest] for digest in self.used}
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'key': self.key, 'entries': entries}, f, separators=(',', ':'))
+            os.replace(tmp, self.path)
+        except OSError as error:
+            print(f"kvlangtester: cannot write cache {self.path}: {error}", file=sys.stderr, flush=True)
+        self.dirty = False
+
+
+def _read(path: str) -> Tuple[Optional[str], str]:
+    """(text, content hash) of a file; text is None if it can't be read as UTF-8."""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as error:
+        return None, f"unreadable: {error.strerror}"
+    digest = hashlib.blake2b(data, digest_size=16).hexdigest()
+    try:
+        return data.decode('utf-8-sig'), digest
+    except UnicodeDecodeError as error:
+        return None, f"unreadable: not UTF-8 ({error.reason} at byte {error.start})"
+
+
+def lint_files(kv_files: Sequence[str], cache: ResultCache, jobs: int) -> Tuple[Dict[str, Dict[str, Any]], int]:
+    """Facts of each file (see lint_source), parsing only files not in the cache. Returns (facts, cached count)."""
+    results: Dict[str, Dict[str, Any]] = {}
+    pending: Dict[str, List[str]] = {}  # digest -> paths with that content
+    texts: List[str] = []
+    cached = 0
+    for path in kv_files:
+        text, digest = _read(path)
+        if text is None:
+            results[path] = {'diagnostics': [[1, 1, 'unreadable', ERROR_SEVERITY, digest]], 'defines': [], 'uses': [],
+                             'globals': [], 'reads': []}
+            continue
+        facts = cache.get(digest)
+        if facts is not None:
+            results[path] = facts
+            cached += 1
+        elif digest in pending:
+            pending[digest].append(path)
+        else:
+            pending[digest] = [path]
+            texts.append(text)
+
+    if texts:
+        if jobs > 1 and len(texts) >= POOL_MIN_FILES:
+            workers = min(jobs, len(texts) // 8 or 1)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                computed = list(pool.map(lint_source, texts, chunksize=max(1, len(texts) // (workers * 4))))
+        else:
+            computed = [lint_source(text) for text in texts]
+        for (digest, paths), facts in zip(pending.items(), computed):
+            cache.put(digest, facts)
+            for path in paths:
+                results[path] = facts
+    return results, cached
+
+
+def resolve(results: Dict[str, Dict[str, Any]], py_files: Sequence[str], known: Iterable[str] = (),
+            known_globals: Iterable[str] = ()) -> List[Diagnostic]:
+    """
+    All diagnostics, with widget classes and `#:import`/`#:set` names checked
+    against everything the run defines (kivy.lang shares directive names
+    between all loaded files).
+    """
+    classes = set(KIVY_CLASSES) | set(known)
+    names = set(known_globals)
+    for facts in results.values():
+        classes.update(facts['defines'])
+        names.update(facts['globals'])
+    for path in py_files:
+        try:
+            with open(path, encoding='utf-8', errors='replace') as f:
+                classes |= python_classes(f.read())
+        except OSError:
+            continue
+    diagnostics = []
+    for path, facts in sorted(results.items()):
+        found = (facts['diagnostics'] + unknown_widgets(facts['uses'], classes)
+                 + undefined_names(facts['reads'], names))
+        found.sort(key=lambda item: (item[0], item[1]))
+        diagnostics.extend(Diagnostic(path, *item) for item in found)
+    return diagnostics
+
+
+def format_text(diagnostics: Sequence[Diagnostic]) -> str:
+    return ''.join(f"{d.path}:{d.line}:{d.column}: {d.severity} [{d.rule}] {d.message}\n" for d in diagnostics)
+
+
+def format_json(diagnostics: Sequence[Diagnostic], summary: Dict[str, Any]) -> str:
+    return json.dumps({'version': _version(), 'summary': summary,
+                       'diagnostics': [d._asdict() for d in diagnostics]}, indent=2) + '\n'
+
+
+def format_sarif(diagnostics: Sequence[Diagnostic]) -> str:
+    rule_ids = list(RULES)
+    results = [{
+        'ruleId': d.rule,
+        'ruleIndex': rule_ids.index(d.rule),
+        'level': d.severity,
+        'message': {'text': d.message},
+        'locations': [{'physicalLocation': {
+            'artifactLocation': {'uri': d.path.replace(os.sep, '/'), 'uriBaseId': '%SRCROOT%'},
+            'region': {'startLine': d.line, 'startColumn': d.column},
+        }}],
+    } for d in diagnostics]
+    log = {
+        '$schema': SARIF_SCHEMA,
+        'version': '2.1.0',
+        'runs': [{
+            'tool': {'driver': {
+                'name': 'kvlangtester',
+                'version': _version(),
+                'rules': [{'id': rule, 'shortDescription': {'text': text}} for rule, text in RULES.items()],
+            }},
+            'results': results,
+        }],
+    }
+    return json.dumps(log, indent=2) + '\n'
+
+
+def benchmark(kv_files: Sequence[str], py_files: Sequence[str], jobs: int, repeat: int) -> str:
+    """Time a cold run (nothing cached) with `jobs` processes and serially, then a fully cached run."""
+    lines = 0
+    for path in kv_files:
+        text, _ = _read(path)
+        lines += text.count('\n') + 1 if text is not None else 0
+
+    def best(run_jobs: int, warm: Optional[ResultCache]) -> float:
+        times = []
+        for _ in range(repeat):
+            cache = warm if warm is not None else ResultCache(None)
+            started = time.perf_counter()
+            results, _ = lint_files(kv_files, cache, run_jobs)
+            resolve(results, py_files)
+            times.append(time.perf_counter() - started)
+        return min(times)
+
+    warm = ResultCache(None)
+    lint_files(kv_files, warm, jobs)
+    rows = [(f"cold, {jobs} jobs", best(jobs, None))]
+    if jobs > 1:
+        rows.append(('cold, serial', best(1, None)))
+    rows.append(('cached', best(jobs, warm)))
+
+    out = [f"{len(kv_files)} .kv files, {lines} lines, {len(py_files)} .py files scanned for classes (best of {repeat})"]
+    for label, seconds in rows:
+        rate = len(kv_files) / seconds if seconds else float('inf')
+        out.append(f"  {label:<16} {seconds * 1000:9.1f} ms  {rate:10.0f} files/s  {lines / seconds if seconds else 0:12.0f} lines/s")
+    return '\n'.join(out) + '\n'
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog='kvlangtester', description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('paths', nargs='*', default=['.'], help='files or directories (default: .)')
+    parser.add_argument('--format', choices=('text', 'json', 'sarif'), default='text')
+    parser.add_argument('-o', '--output', help='write the report here instead of stdout')
+    parser.add_argument('-j', '--jobs', type=int, default=0, help='worker processes (default: CPU count)')
+    parser.add_argument('--cache', default=DEFAULT_CACHE, help=f"result cache file (default: {DEFAULT_CACHE})")
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--known', action='append', default=[], metavar='NAMES',
+                        help='comma-separated widget classes to accept, e.g. ones registered at runtime')
+    parser.add_argument('--globals', action='append', default=[], metavar='NAMES',
+                        help='comma-separated names to accept in expressions, e.g. ones added to global_idmap')
+    parser.add_argument('--exclude', action='append', default=[], metavar='GLOB', help='skip matching paths')
+    parser.add_argument('--fail-on', choices=(ERROR_SEVERITY, WARNING_SEVERITY, 'never'), default=ERROR_SEVERITY)
+    parser.add_argument('--benchmark', action='store_true', help='report files/s instead of diagnostics')
+    parser.add_argument('--repeat', type=int, default=3, help='benchmark runs per measurement')
+    args = parser.parse_args(argv)
+
+    jobs = args.jobs if args.jobs > 0 else (os.cpu_count() or 1)
+    known = {name.strip() for names in args.known for name in names.split(',') if name.strip()}
+    known_globals = {name.strip() for names in args.globals for name in names.split(',') if name.strip()}
+    kv_files, py_files = collect(args.paths, args.exclude)
+
+    if args.benchmark:
+        sys.stdout.write(benchmark(kv_files, py_files, jobs, max(1, args.repeat)))
+        return 0
+
+    started = time.perf_counter()
+    cache = ResultCache(None if args.no_cache else args.cache)
+    results, cached = lint_files(kv_files, cache, jobs)
+    cache.save()
+    diagnostics = resolve(results, py_files, known, known_globals)
+    errors = sum(1 for d in diagnostics if d.severity == ERROR_SEVERITY)
+    warnings = len(diagnostics) - errors
+    summary = {'files': len(kv_files), 'cached': cached, 'errors': errors, 'warnings': warnings,
+               'seconds': round(time.perf_counter() - started, 4)}
+
+    if args.format == 'json':
+        report = format_json(diagnostics, summary)
+    elif args.format == 'sarif':
+        report = format_sarif(diagnostics)
+    else:
+        report = format_text(diagnostics)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report)
+    else:
+        sys.stdout.write(report)
+    print(f"kvlangtester: {summary['files']} files ({cached} cached), {errors} errors, {warnings} warnings "
+          f"in {summary['seconds']:.2f}s", file=sys.stderr, flush=True)
+
+    if args.fail_on == 'never':
+        return 0
+    return 1 if errors or (args.fail_on == WARNING_SEVERITY and warnings) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
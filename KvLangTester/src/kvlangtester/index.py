@@ -0,0 +1,135 @@
+"""Symbol index of a KV document, updated subtree by subtree as it is re-parsed."""
+
+from __future__ import annotations
+
+import re
+from typing import Dict, FrozenSet, List, Optional, Set
+
+from .nodes import DOCUMENT, ID, PROPERTY, RULE, TEMPLATE, WIDGET, Node
+
+# `name.attr` references Kivy binds a property expression to
+REFERENCE_RE = re.compile(r'(?<![\w.])([A-Za-z_]\w*)\s*\.\s*([A-Za-z_]\w*)')
+STRING_RE = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'')
+
+
+def references(code: str) -> FrozenSet[str]:
+    """The `name.attr` pairs a KV expression reads, e.g. {'self.width', 'btn.text'}."""
+    return frozenset(f"{name}.{attr}" for name, attr in REFERENCE_RE.findall(STRING_RE.sub('""', code)))
+
+
+def rule_names(selector: str) -> List[str]:
+    """Class names a rule selector applies to: `<-A@Button+B, C>` -> ['A', 'C']."""
+    names = []
+    for part in selector.split(','):
+        name = part.strip().lstrip('-').split('@', 1)[0].strip()
+        if name:
+            names.append(name)
+    return names
+
+
+def id_scope(node: Node) -> Optional[Node]:
+    """The rule, template or root widget whose ids `node` can see."""
+    scope = node.parent
+    while scope is not None and scope.kind not in (RULE, TEMPLATE) and not (
+            scope.kind == WIDGET and scope.parent is not None and scope.parent.kind == DOCUMENT):
+        scope = scope.parent
+    return scope
+
+
+def _by_line(nodes: Set[Node]) -> List[Node]:
+    return sorted(nodes, key=lambda node: node.line)
+
+
+class SymbolIndex:
+    """
+    Rules, widget classes, ids and property bindings of a document:
+
+    - rules: class name -> the `<...>` rules applying to it
+    - widgets: class name -> widgets of that class in rule bodies and the root
+    - ids: id -> `id:` nodes
+    - bindings: `name.attr` -> properties whose value reads it
+    """
+
+    def __init__(self) -> None:
+        self.rules: Dict[str, Set[Node]] = {}
+        self.widgets: Dict[str, Set[Node]] = {}
+        self.ids: Dict[str, Set[Node]] = {}
+        self.bindings: Dict[str, Set[Node]] = {}
+        self._references: Dict[Node, FrozenSet[str]] = {}
+
+    def add(self, node: Node) -> None:
+        """Index `node` and everything below it."""
+        for item in node.walk():
+            kind = item.kind
+            if kind == RULE and item.name:
+                for name in rule_names(item.name):
+                    self.rules.setdefault(name, set()).add(item)
+            elif kind == WIDGET:
+                self.widgets.setdefault(item.name or '', set()).add(item)
+            elif kind == ID and item.value:
+                self.ids.setdefault(item.value, set()).add(item)
+            elif kind == PROPERTY and item.value and '.' in item.value:
+                refs = references(item.value)
+                if refs:
+                    self._references[item] = refs
+                    for ref in refs:
+                        self.bindings.setdefault(ref, set()).add(item)
+
+    def remove(self, node: Node) -> None:
+        """Drop `node` and everything below it from the index."""
+        for item in node.walk():
+            kind = item.kind
+            if kind == RULE and item.name:
+                for name in rule_names(item.name):
+                    self._discard(self.rules, name, item)
+            elif kind == WIDGET:
+                self._discard(self.widgets, item.name or '', item)
+            elif kind == ID and item.value:
+                self._discard(self.ids, item.value, item)
+            elif kind == PROPERTY:
+                for ref in self._references.pop(item, ()):
+                    self._discard(self.bindings, ref, item)
+
+    @staticmethod
+    def _discard(table: Dict[str, Set[Node]], key: str, node: Node) -> None:
+        nodes = table.get(key)
+        if nodes is not None:
+            nodes.discard(node)
+            if not nodes:
+                del table[key]
+
+    def rule(self, name: str) -> List[Node]:
+        """Rules applying to class `name`, in document order."""
+        return _by_line(self.rules.get(name, set()))
+
+    def widgets_of(self, name: str) -> List[Node]:
+        return _by_line(self.widgets.get(name, set()))
+
+    def find_id(self, name: str, scope: Optional[Node] = None) -> List[Node]:
+        """`id: name` nodes, only those visible from `scope` if given."""
+        nodes = self.ids.get(name, set())
+        if scope is not None:
+            nodes = {node for node in nodes if id_scope(node) is scope}
+        return _by_line(nodes)
+
+    def bound_to(self, name: str, attr: Optional[str] = None) -> List[Node]:
+        """Properties whose value reads `name.attr` (any attribute of `name` if attr is None)."""
+        if attr is not None:
+            return _by_line(self.bindings.get(f"{name}.{attr}", set()))
+        prefix = f"{name}."
+        found: Set[Node] = set()
+        for key, nodes in self.bindings.items():
+            if key.startswith(prefix):
+                found |= nodes
+        return _by_line(found)
+
+    def dynamic_classes(self) -> Dict[str, List[str]]:
+        """`<Name@Base+Mixin>` rules: {'Name': ['Base', 'Mixin']}."""
+        classes = {}
+        for nodes in self.rules.values():
+            for node in nodes:
+                for part in (node.name or '').split(','):
+                    name, at, bases = part.strip().lstrip('-').partition('@')
+                    if at:
+                        classes[name.strip()] = [base.strip() for base in bases.split('+') if base.strip()]
+        return classes
@@ -0,0 +1,276 @@
+"""
+Checks on KV files: structure, indentation, Python expressions, unknown
+widget classes and broken id references.
+
+lint_source() looks at one file only and returns plain data, so results
+can be cached by content hash and computed in worker processes. Whether a
+widget class exists depends on the whole project (rules in other .kv
+files, classes defined in Python), so unknown_widgets() resolves that
+afterwards from every file's `defines` and `uses`. The same goes for
+`#:import`/`#:set` names: kivy.lang keeps them in one process-wide
+namespace, so a name set in one file (or one it `#:include`s) is readable
+in every file loaded after it. undefined_names() checks every file's `reads`
+against the `globals` of all of them.
+"""
+
+from __future__ import annotations
+
+import ast
+import builtins
+import re
+import warnings
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, NamedTuple, Set, Tuple
+
+from .index import id_scope, rule_names
+from .nodes import (
+    DIRECTIVE, DOCUMENT, ERROR, HANDLER, ID, INSTRUCTION, PROPERTY, RULE, TEMPLATE, WIDGET, Node,
+)
+from .parser import Document
+
+# Bump when checks change, so cached results are recomputed
+LINT_VERSION = 2
+
+ERROR_SEVERITY = 'error'
+WARNING_SEVERITY = 'warning'
+
+# rule id -> short description (SARIF rule metadata)
+RULES: Dict[str, str] = {
+    'syntax': 'Line kivy.lang cannot parse',
+    'indentation': 'Invalid or inconsistent indentation',
+    'invalid-expression': 'Property value or handler is not valid Python',
+    'unknown-widget': 'Widget class or graphics instruction the Factory does not know',
+    'undefined-name': 'Expression reads a name that is not an id, a directive or a KV global',
+    'duplicate-id': 'The same id is declared twice in one rule',
+    'unreadable': 'File could not be read as UTF-8',
+}
+
+# Classes kivy/factory_registers.py registers with the Factory (Kivy 2.3)
+KIVY_CLASSES = frozenset('''
+    Accordion AccordionItem ActionBar ActionButton ActionCheck ActionDropDown ActionGroup ActionItem
+    ActionOverflow ActionSeparator ActionToggleButton ActionView AliasProperty AnchorLayout Animation
+    AnimationTransition AsyncImage Bezier BindTexture BooleanProperty BorderImage BoundedNumericProperty
+    BoxLayout BoxShadow Bubble BubbleButton Button ButtonBehavior Cache Callback Camera Canvas CanvasBase
+    Carousel CheckBox ClockBase CodeInput CodeNavigationBehavior Color ColorPicker ColorProperty ColorWheel
+    CompoundSelectionBehavior ConfigParser ConfigParserProperty ContextInstruction ContextualActionView
+    CoverBehavior DampedScrollEffect DictProperty DragBehavior DropDown EffectWidget Ellipse EmacsBehavior
+    EventDispatcher ExceptionHandler FactoryException FadeTransition Fbo FileChooser FileChooserIconView
+    FileChooserListView FloatLayout FocusBehavior Gesture GestureContainer GestureDatabase GesturePoint
+    GestureStroke GestureSurface GridLayout Image Instruction InstructionGroup KNSpaceBehavior KineticEffect
+    Label Layout LayoutSelectionBehavior Line ListProperty LoaderBase LoggerHistory Matrix MatrixInstruction
+    Mesh ModalView MotionEventFactory MotionEventProvider MultistrokeGesture NumericProperty ObjectProperty
+    Observable OpacityScrollEffect OptionProperty PageLayout Parser Point PopMatrix Popup ProgressBar
+    ProgressTracker Property ProxyImage PushMatrix Quad Recognizer Rectangle RecycleBoxLayout
+    RecycleDataAdapter RecycleDataModel RecycleDataModelBehavior RecycleDataViewBehavior RecycleGridLayout
+    RecycleKVIDsDataViewBehavior RecycleLayout RecycleLayoutManagerBehavior RecycleView RecycleViewBehavior
+    ReferenceListProperty RelativeLayout RenderContext Rotate RoundedRectangle RstDocument SafeList Sandbox
+    Scale Scatter ScatterLayout ScatterPlane ScatterPlaneLayout ScissorPop ScissorPush Screen ScreenManager
+    ScrollEffect ScrollView Settings Shader ShaderTransition Shape ShapeRect SlideTransition Slider
+    SmoothEllipse SmoothLine SmoothQuad SmoothRectangle SmoothRoundedRectangle SmoothTriangle Spinner
+    Splitter StackLayout StencilPop StencilPush StencilUnUse StencilUse StencilView StringProperty Svg
+    SwapTransition Switch TabbedPanel TabbedPanelHeader TextInput Texture TextureRegion ToggleButton
+    ToggleButtonBehavior TouchRippleBehavior TouchRippleButtonBehavior Transform Translate TreeView
+    TreeViewLabel TreeViewNode Triangle UnistrokeTemplate VBO VKeyboard VariableListProperty Vector
+    VertexBatch VertexInstruction Video VideoPlayer VideoPlayerPlayPause VideoPlayerProgressBar
+    VideoPlayerStop VideoPlayerVolume Widget WidgetException WipeTransition
+'''.split())
+
+# Names kivy.lang puts in every expression's namespace (global_idmap), plus
+# the rule's `self` and `root`
+KV_GLOBALS = frozenset(('self', 'root', 'app', 'pt', 'inch', 'cm', 'mm', 'dp', 'sp', 'rgba', '_'))
+BUILTIN_NAMES = frozenset(dir(builtins))
+
+DIRECTIVES = frozenset(('kivy', 'import', 'set', 'include'))
+
+# Python modules defining classes the Factory will know once imported
+PY_CLASS_RE = re.compile(r'^[ \t]*class[ \t]+([A-Za-z_]\w*)|Factory\.register\(\s*[\'"]([A-Za-z_]\w*)', re.M)
+
+
+class Diagnostic(NamedTuple):
+    """One problem found in a file; line and column are 1-based."""
+
+    path: str
+    line: int
+    column: int
+    rule: str
+    severity: str
+    message: str
+
+
+@lru_cache(maxsize=4096)
+def free_names(code: str, mode: str) -> Tuple[str, ...]:
+    """
+    Names `code` reads without binding them itself, in order of appearance.
+    Raises SyntaxError if `code` doesn't compile in `mode` ('eval'/'exec').
+    Memoized: the same expressions (`self.width`, `root.minimum_height`)
+    come back in almost every rule.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        tree = ast.parse(code, mode=mode)
+    bound: Set[str] = set()
+    loaded: List[ast.Name] = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load):
+                loaded.append(node)
+            else:
+                bound.add(node.id)
+        elif isinstance(node, ast.arg):
+            bound.add(node.arg)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            bound.add(node.name)
+        elif isinstance(node, ast.alias):
+            bound.add((node.asname or node.name).split('.', 1)[0])
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            bound.add(node.name)
+    loaded.sort(key=lambda node: (node.lineno, node.col_offset))
+    names: List[str] = []
+    for node in loaded:
+        if node.id not in bound and node.id not in names:
+            names.append(node.id)
+    return tuple(names)
+
+
+def python_classes(source: str) -> Set[str]:
+    """Class names a Python module defines or registers with the Factory."""
+    return {cls or registered for cls, registered in PY_CLASS_RE.findall(source)}
+
+
+def lint_source(text: str) -> Dict[str, Any]:
+    """
+    Lint one KV source. Returns JSON-serialisable facts:
+
+    - diagnostics: [line, column, rule, severity, message] (1-based)
+    - defines: class names the file's rules and templates declare
+    - uses: [name, line, column] of every widget class and instruction used
+    - globals: names the file's `#:import` and `#:set` directives define
+    - reads: [name, line, column] of names expressions read that are not an
+      id in their rule, a KV global or a builtin
+    """
+    document = Document(text)
+    lines = document.lines
+    diagnostics: List[List[Any]] = []
+    defines: List[str] = []
+    uses: List[List[Any]] = []
+    reads: List[List[Any]] = []
+    names: Set[str] = set()  # `#:import` / `#:set` names
+    scope_ids: Dict[Node, Dict[str, Node]] = {}
+    expressions: List[Node] = []
+    roots = 0
+
+    def report(node: Node, rule: str, message: str, severity: str = ERROR_SEVERITY) -> None:
+        diagnostics.append([node.line + 1, node.indent + 1, rule, severity, message])
+
+    for node in document.root.walk():
+        kind = node.kind
+        if kind == ERROR:
+            report(node, node.name or 'syntax', node.value or 'syntax error')
+        elif kind == DIRECTIVE:
+            parts = (node.value or '').split()
+            if node.name not in DIRECTIVES:
+                report(node, 'syntax', f"unknown directive #:{node.name}")
+            elif node.name == 'import':
+                if len(parts) != 2:
+                    report(node, 'syntax', 'invalid import, expected #:import alias package.module')
+                else:
+                    names.add(parts[0])
+            elif node.name == 'set':
+                if len(parts) < 2:
+                    report(node, 'syntax', 'invalid #:set, expected #:set name value')
+                else:
+                    names.add(parts[0])
+        elif kind == RULE:
+            for part in (node.name or '').split(','):
+                bases = part.partition('@')[2]
+                for base in bases.split('+') if bases else ():
+                    if base.strip():
+                        uses.append([base.strip(), node.line + 1, node.indent + 1])
+            defines.extend(rule_names(node.name or ''))
+        elif kind == TEMPLATE:
+            name, _, bases = (node.name or '').partition('@')
+            if name.strip():
+                defines.append(name.strip())
+            for base in bases.split('+') if bases else ():
+                if base.strip():
+                    uses.append([base.strip(), node.line + 1, node.indent + 1])
+        elif kind in (WIDGET, INSTRUCTION):
+            uses.append([node.name, node.line + 1, node.indent + 1])
+            if kind == WIDGET and node.parent is not None and node.parent.kind == DOCUMENT:
+                roots += 1
+                if roots > 1:
+                    report(node, 'syntax', 'only one root widget is allowed per file')
+        elif kind == ID:
+            value = node.value or ''
+            if not value.isidentifier():
+                report(node, 'syntax', f"invalid id {value!r}" if value else 'empty id')
+            elif value in ('self', 'root'):
+                report(node, 'syntax', f"invalid id, cannot be {value!r}")
+            else:
+                scope = id_scope(node)
+                if scope is not None:
+                    seen = scope_ids.setdefault(scope, {})
+                    if value in seen:
+                        report(node, 'duplicate-id', f"id {value!r} is already declared on line {seen[value].line + 1}",
+                               WARNING_SEVERITY)
+                    else:
+                        seen[value] = node
+        elif kind in (PROPERTY, HANDLER) and node.value:
+            expressions.append(node)
+
+    for node in expressions:
+        line = node.line
+        first = lines[line].partition(':')[2].strip()
+        if first and node.span > 1:
+            report(node, 'indentation', f"{node.name} has a value on its line, it can't continue below")
+            continue
+        mode = 'exec' if node.kind == HANDLER else 'eval'
+        try:
+            read = free_names(node.value or '', mode)
+        except SyntaxError as error:
+            report(node, 'invalid-expression', f"{node.name}: {error.msg}")
+            continue
+        scope = id_scope(node)
+        known = scope_ids.get(scope, {}) if scope is not None else {}
+        for name in read:
+            if (name in known or name in KV_GLOBALS or name in BUILTIN_NAMES
+                    or (name == 'args' and node.kind == HANDLER)
+                    or (name == 'ctx' and scope is not None and scope.kind == TEMPLATE)):
+                continue
+            reads.append([name, line + 1, node.indent + 1])
+
+    diagnostics.sort(key=lambda item: (item[0], item[1]))
+    return {'diagnostics': diagnostics, 'defines': sorted(set(defines)), 'uses': uses,
+            'globals': sorted(names), 'reads': reads}
+
+
+def unknown_widgets(uses: Iterable[List[Any]], known: Set[str]) -> List[List[Any]]:
+    """[line, column, rule, severity, message] for each used class not in `known`."""
+    return [[line, column, 'unknown-widget', ERROR_SEVERITY, f"unknown class {name!r}"]
+            for name, line, column in uses if name not in known]
+
+
+def undefined_names(reads: Iterable[List[Any]], known: Set[str]) -> List[List[Any]]:
+    """
+    [line, column, rule, severity, message] for each read name not in `known`
+    (the `#:import`/`#:set` names in scope). A warning: the name may still be
+    set at runtime, e.g. by Python code adding to kivy.lang.global_idmap.
+    """
+    return [[line, column, 'undefined-name', WARNING_SEVERITY,
+             f"{name!r} is not an id in this rule, a #:import/#:set name or a KV global"]
+            for name, line, column in reads if name not in known]
+
+
+def lint(text: str, path: str = '<string>', known: Iterable[str] = (),
+         known_globals: Iterable[str] = ()) -> List[Diagnostic]:
+    """
+    Lint a single file, with `known` extra widget classes besides Kivy's and
+    its own rules, and `known_globals` extra names besides its own directives
+    (e.g. those of the files it `#:include`s).
+    """
+    facts = lint_source(text)
+    classes = set(KIVY_CLASSES) | set(facts['defines']) | set(known)
+    found = (facts['diagnostics'] + unknown_widgets(facts['uses'], classes)
+             + undefined_names(facts['reads'], set(facts['globals']) | set(known_globals)))
+    found.sort(key=lambda item: (item[0], item[1]))
+    return [Diagnostic(path, *item) for item in found]
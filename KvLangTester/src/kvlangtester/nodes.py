@@ -0,0 +1,89 @@
+"""Nodes of a parsed KV document."""
+
+from __future__ import annotations
+
+from typing import Iterator, List, Optional
+
+# Node kinds
+DOCUMENT = 'document'
+DIRECTIVE = 'directive'      # `#:import name module`, `#:set`, `#:kivy`, `#:include`
+RULE = 'rule'                # `<Selector>:` class rule (name: the selector)
+TEMPLATE = 'template'        # `[Name@Base]:` (deprecated templates)
+WIDGET = 'widget'            # root widget or child widget (name: the class)
+CANVAS = 'canvas'            # `canvas`, `canvas.before`, `canvas.after`
+INSTRUCTION = 'instruction'  # graphics instruction inside a canvas block
+PROPERTY = 'property'        # `name: value`
+HANDLER = 'handler'          # `on_event: code`
+ID = 'id'                    # `id: name`
+ERROR = 'error'              # unparseable line (value: the message)
+
+# Kinds whose body is a list of child nodes
+CONTAINERS = frozenset((DOCUMENT, RULE, TEMPLATE, WIDGET, CANVAS, INSTRUCTION))
+
+NO_CHILDREN: List[Node] = []
+
+
+class Node:
+    """
+    One entry of a KV document and the lines below it.
+
+    `offset` is the node's line relative to its parent's line (for the
+    document's children, the line itself), so an edit only shifts the
+    later siblings on the path to the root instead of every node below
+    the edit. `span` is the number of lines from the node's own line to
+    its last non-blank, non-comment line.
+    """
+
+    __slots__ = ('kind', 'name', 'value', 'indent', 'offset', 'span', 'parent', 'children', 'child_indent')
+
+    def __init__(self, kind: str, name: Optional[str], value: Optional[str], indent: int, offset: int,
+                 parent: Optional[Node]) -> None:
+        self.kind = kind
+        self.name = name
+        self.value = value
+        self.indent = indent
+        self.offset = offset
+        self.span = 1
+        self.parent = parent
+        self.children = [] if kind in CONTAINERS else NO_CHILDREN
+        # Indentation of the entries in this node's body, once known
+        self.child_indent: Optional[int] = None
+
+    @property
+    def line(self) -> int:
+        """0-based line of the node in the document."""
+        line = 0
+        node: Optional[Node] = self
+        while node is not None:
+            line += node.offset
+            node = node.parent
+        return line
+
+    @property
+    def end(self) -> int:
+        """Line after the node's last line."""
+        return self.line + self.span
+
+    def walk(self) -> Iterator[Node]:
+        """This node and all nodes below it, in document order."""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def node_at(self, line: int) -> Node:
+        """The innermost node below this one covering `line`."""
+        node, base = self, self.line
+        while True:
+            for child in node.children:
+                start = base + child.offset
+                if start <= line < start + child.span:
+                    node, base = child, start
+                    break
+            else:
+                return node
+
+    def __repr__(self) -> str:
+        label = self.name if self.value is None else f"{self.name}: {self.value!r}"
+        return f"<{self.kind} {label} line {self.line}>"
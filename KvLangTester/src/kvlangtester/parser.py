@@ -0,0 +1,334 @@
+"""
+Incremental KV-language parser.
+
+A Document keeps the source lines and the node tree built from them. An
+edit replaces a range of lines; instead of parsing the file again, the
+document finds the innermost container the edit can't escape (its header
+is above the edit and every new line is indented below it), parses only
+that container's entries that overlap the edit, and reuses the entries
+before and after it as they are.
+
+The grammar follows kivy.lang.parser: entries are `key: value` lines
+nested by indentation, full-line `#` comments are ignored and `#:` lines
+are directives. Errors don't stop parsing; they become ERROR nodes.
+"""
+
+from __future__ import annotations
+
+import re
+from typing import List, Optional, Sequence, Tuple
+
+from .index import SymbolIndex
+from .nodes import (
+    CANVAS, CONTAINERS, DIRECTIVE, DOCUMENT, ERROR, HANDLER, ID, INSTRUCTION, PROPERTY, RULE, TEMPLATE,
+    WIDGET, Node,
+)
+
+IDENTIFIER_RE = re.compile(r'[A-Za-z_][\w.]*$')
+
+CANVAS_KEYS = frozenset(('canvas', 'canvas.before', 'canvas.after'))
+
+# The entries allowed in each container's body
+WIDGET_BODIES = frozenset((RULE, TEMPLATE, WIDGET))
+
+
+def _is_content(line: str) -> bool:
+    """Whether a line takes part in the structure (not blank, not a plain comment)."""
+    stripped = line.strip()
+    return bool(stripped) and (stripped[0] != '#' or stripped.startswith('#:'))
+
+
+def _bisect(children: List[Node], target: int, end: bool = False) -> int:
+    """Number of children that start before offset `target` (with `end`: end at or before it)."""
+    low, high = 0, len(children)
+    while low < high:
+        middle = (low + high) // 2
+        child = children[middle]
+        if (child.offset + child.span <= target) if end else (child.offset < target):
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+class Document:
+    """A KV source and its node tree, kept up to date through edit()."""
+
+    def __init__(self, text: str = '', filename: Optional[str] = None) -> None:
+        self.filename = filename
+        self.lines: List[str] = text.replace('\r\n', '\n').replace('\r', '\n').split('\n')
+        self.root = Node(DOCUMENT, filename, None, -1, 0, None)
+        self.index = SymbolIndex()
+        # Top-level entries start in column 0
+        self.root.children, _ = self._parse_entries(self.root, 0, 0, len(self.lines), 0)
+        self.index.add(self.root)
+
+    @property
+    def text(self) -> str:
+        return '\n'.join(self.lines)
+
+    def errors(self) -> List[Tuple[int, str]]:
+        """(line, message) for every ERROR node, in document order."""
+        return [(node.line, node.value or '') for node in self.root.walk() if node.kind == ERROR]
+
+    def node_at(self, line: int) -> Node:
+        return self.root.node_at(line)
+
+    def edit(self, start: Tuple[int, int], end: Tuple[int, int], text: str) -> Node:
+        """
+        Replace the text between (line, column) positions `start` and `end`
+        (0-based, end exclusive) with `text`, as an editor reports changes.
+        Returns the container that was re-parsed.
+        """
+        (start_line, start_column), (end_line, end_column) = start, end
+        prefix = self.lines[start_line][:start_column]
+        suffix = self.lines[end_line][end_column:]
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+        return self.replace_lines(start_line, end_line + 1, (prefix + text + suffix).split('\n'))
+
+    def replace_lines(self, start: int, stop: int, new_lines: Sequence[str]) -> Node:
+        """Replace lines [start, stop) with `new_lines`; returns the re-parsed container."""
+        delta = len(new_lines) - (stop - start)
+        indents = [len(line) - len(line.lstrip(' ')) for line in new_lines if _is_content(line)]
+        shallowest = min(indents) if indents else None
+
+        # The innermost container whose header is above the edit and whose
+        # body the new lines stay in
+        parent, parent_line = self.root, 0
+        while True:
+            children = parent.children
+            low, high, target = 0, len(children), start - parent_line
+            while low < high:
+                middle = (low + high) // 2
+                if children[middle].offset < target:
+                    low = middle + 1
+                else:
+                    high = middle
+            if not low:
+                break
+            child = children[low - 1]
+            child_line = parent_line + child.offset
+            if (child.kind not in CONTAINERS or stop > child_line + child.span
+                    or (shallowest is not None and shallowest <= child.indent)):
+                break
+            parent, parent_line = child, child_line
+
+        self.lines[start:stop] = new_lines
+        self._reparse(parent, parent_line, start, stop, delta)
+        return parent
+
+    def _reparse(self, parent: Node, parent_line: int, start: int, stop: int, delta: int) -> None:
+        """Parse again the entries of `parent` that overlap old lines [start, stop)."""
+        children = parent.children
+        lines = self.lines
+
+        # Entries that end before the edit and whose end the edit can't move
+        before = _bisect(children, start - parent_line, end=True)
+        if before:
+            last = children[before - 1]
+            last_end = parent_line + last.offset + last.span
+            # A line indented below it right after it would still be its body
+            if not any(_is_content(line) for line in lines[last_end:start]):
+                before -= 1
+        after = max(before, _bisect(children, stop - parent_line))
+
+        region_start = (parent_line + children[before - 1].offset + children[before - 1].span if before
+                        else parent_line + 1 if parent.kind != DOCUMENT else 0)
+        limit = parent_line + children[after].offset + delta if after < len(children) else len(lines)
+        old_indent = parent.child_indent
+        if parent.kind == DOCUMENT:
+            child_indent: Optional[int] = 0
+        elif before:
+            child_indent = old_indent
+        else:
+            # The first entry is parsed again and sets the body's indentation anew
+            child_indent = parent.child_indent = None
+        new_children, next_line = self._parse_entries(parent, parent_line, region_start, limit, child_indent)
+
+        if after < len(children) and (next_line != limit or parent.child_indent != old_indent):
+            # The edit changed how the following entries nest: parse the whole body
+            for child in children:
+                self.index.remove(child)
+            parent.child_indent = None
+            if parent.kind == DOCUMENT:
+                new_children, _ = self._parse_entries(parent, 0, 0, len(lines), 0)
+            else:
+                new_children, _ = self._parse_entries(parent, parent_line, parent_line + 1, len(lines), None)
+            parent.children = new_children
+        else:
+            for child in children[before:after]:
+                self.index.remove(child)
+            if delta:
+                for child in children[after:]:
+                    child.offset += delta
+            parent.children = children[:before] + new_children + children[after:]
+        for child in new_children:
+            self.index.add(child)
+
+        if parent.kind != DOCUMENT:
+            last = parent.children[-1] if parent.children else None
+            parent.span = last.offset + last.span if last else 1
+
+        # Shift what follows on the way up
+        node = parent
+        while node.parent is not None:
+            up = node.parent
+            siblings = up.children
+            position = siblings.index(node)
+            if delta:
+                for sibling in siblings[position + 1:]:
+                    sibling.offset += delta
+            if up.kind != DOCUMENT:
+                if position == len(siblings) - 1:
+                    up.span = node.offset + node.span
+                else:
+                    up.span += delta
+            node = up
+
+    def _parse_entries(self, parent: Node, parent_line: int, start: int, limit: int,
+                       child_indent: Optional[int]) -> Tuple[List[Node], int]:
+        """
+        Parse the entries of `parent`'s body from line `start`, up to `limit`
+        or the first line not indented below `parent`. Returns the entries
+        and the line where parsing stopped.
+        """
+        lines = self.lines
+        kind = parent.kind
+        entries: List[Node] = []
+        i = start
+        while i < limit:
+            line = lines[i]
+            if not _is_content(line):
+                i += 1
+                continue
+            content = line.lstrip(' ')
+            stripped = content.rstrip()
+            indent = len(line) - len(content)
+            if indent <= parent.indent:
+                break
+            if stripped.startswith('#:'):
+                entries.append(self._directive(stripped, indent, i - parent_line, parent))
+                i += 1
+                continue
+            if content[0] == '\t':
+                entries.append(Node(ERROR, 'indentation', 'tabs are not allowed for indentation',
+                                    indent, i - parent_line, parent))
+                i += 1
+                continue
+            if child_indent is None:
+                child_indent = indent
+                parent.child_indent = indent
+            if indent != child_indent:
+                message = ('unexpected indentation' if indent > child_indent else
+                           f"invalid indentation, expected {child_indent} spaces")
+                entries.append(Node(ERROR, 'indentation', message, indent, i - parent_line, parent))
+                i += 1
+                continue
+            node, i = self._entry(kind, stripped, indent, i, parent, parent_line)
+            entries.append(node)
+        return entries, i
+
+    @staticmethod
+    def _directive(stripped: str, indent: int, offset: int, parent: Node) -> Node:
+        command = stripped[2:].strip()
+        name, _, value = command.partition(' ')
+        return Node(DIRECTIVE, name, value.strip(), indent, offset, parent)
+
+    def _entry(self, context: str, stripped: str, indent: int, i: int, parent: Node,
+               parent_line: int) -> Tuple[Node, int]:
+        """Parse the entry on line `i` and its body; returns it and the line after it."""
+        key, colon, value = stripped.partition(':')
+        key, value = key.strip(), value.strip()
+        kind, name, error = None, key, None
+
+        if context == DOCUMENT:
+            if stripped.startswith('<'):
+                close = stripped.find('>')
+                if close < 0 or not stripped.endswith(':') or stripped[close + 1:-1].strip():
+                    error = 'invalid rule, expected <Selector>:'
+                kind, name = RULE, stripped[1:close].strip()
+            elif stripped.startswith('['):
+                close = stripped.find(']')
+                if close < 0 or not stripped.endswith(':'):
+                    error = 'invalid template, expected [Name@Base]:'
+                kind, name = TEMPLATE, stripped[1:close].strip()
+            elif colon and key[:1].isupper() and IDENTIFIER_RE.match(key) and not value:
+                kind = WIDGET
+            else:
+                error = 'expected a <rule>: or a root widget'
+        elif not colon:
+            error = 'invalid data, expected "name: value"'
+        elif context == CANVAS:
+            if key[:1].isupper() and IDENTIFIER_RE.match(key) and not value:
+                kind = INSTRUCTION
+            else:
+                error = 'expected a graphics instruction'
+        elif not IDENTIFIER_RE.match(key):
+            error = f"invalid name {key!r}"
+        elif context in WIDGET_BODIES and key in CANVAS_KEYS:
+            kind = CANVAS
+            if value:
+                error = f"{key} takes no value"
+        elif context in WIDGET_BODIES and key[:1].isupper():
+            kind = WIDGET
+            if value:
+                error = f"widget {key} takes no value"
+        elif key[:1].isupper():
+            error = f"{key} is not allowed here"
+        elif key == 'id' and context != INSTRUCTION:
+            kind = ID
+        elif key.startswith('on_'):
+            kind = HANDLER
+        else:
+            kind = PROPERTY
+
+        if error is not None:
+            node = Node(ERROR, 'syntax', error, indent, i - parent_line, parent)
+            end = self._block_end(i, indent)
+            node.span = end - i
+            return node, end
+        node = Node(kind, name, value if kind in (PROPERTY, HANDLER, ID) else None, indent, i - parent_line, parent)
+        if kind in CONTAINERS:
+            node.children, end = self._parse_entries(node, i, i + 1, len(self.lines), None)
+            last = node.children[-1] if node.children else None
+            node.span = last.offset + last.span if last else 1
+            return node, end
+        end = self._block_end(i, indent)
+        if end > i + 1:
+            node.value = self._multiline(value, i + 1, end)
+        node.span = end - i
+        return node, end
+
+    def _block_end(self, i: int, indent: int) -> int:
+        """Line after the last content line indented below line `i`."""
+        lines = self.lines
+        end = i + 1
+        j = end
+        while j < len(lines):
+            line = lines[j]
+            content = line.lstrip(' ')
+            if _is_content(line):
+                if len(line) - len(content) <= indent:
+                    break
+                end = j + 1
+            j += 1
+        return end
+
+    def _multiline(self, value: str, start: int, end: int) -> str:
+        """A value continued on the lines below, dedented to its first continuation line."""
+        parts = [value] if value else []
+        base = None
+        for line in self.lines[start:end]:
+            if not _is_content(line) or line.lstrip().startswith('#:'):
+                continue
+            content = line.lstrip(' ')
+            indent = len(line) - len(content)
+            if base is None:
+                base = indent
+            parts.append(line[min(base, indent):].rstrip())
+        return '\n'.join(parts)
+
+
+def parse(text: str, filename: Optional[str] = None) -> Document:
+    """Parse KV source into a Document."""
+    return Document(text, filename)
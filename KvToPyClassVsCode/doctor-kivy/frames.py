@@ -0,0 +1,246 @@
+"""
+Binary preview frames.
+
+The JSON contract sends a base64 PNG: a third bigger than the image, an
+encode/decode pass on both sides and a full PNG encode per keystroke.
+Frame mode sends the worker's RGBA pixels instead, behind a fixed header:
+
+    offset  size  field
+    0       4     magic b'KVFR'
+    4       2     header size (bytes, from offset 0; skip unknown fields)
+    6       1     version (1)
+    7       1     kind: 0 key frame, 1 delta frame
+    8       1     encoding: 0 raw, 1 zlib, 2 lz4 frame, 3 zstd, 4 lossless WebP
+    9       1     flags: bit 0 served from the render cache
+    10      2     tile size (delta frames)
+    12      4     width
+    16      4     height
+    20      4     sequence number (per session)
+    24      4     base sequence number (delta frames: the frame they apply to)
+    28      4     request id (echoed from the request)
+    32      4     render time in microseconds
+    36      4     payload size
+    40            payload
+
+All integers are big-endian. A key frame's payload decodes to top-down
+RGBA rows. A delta frame's payload decodes to a u32 tile count, that many
+(u16 column, u16 row) tile indices, then each listed tile's RGBA rows
+(tiles on the right and bottom edges are clipped to the image).
+
+lz4, zstd and WebP are used when their packages (lz4, zstandard, Pillow)
+are installed; raw and zlib always work.
+"""
+
+import io
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:  # pragma: no cover - optional dependency
+    lz4_frame = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+try:
+    from PIL import Image
+except ImportError:  # pragma: no cover - optional dependency
+    Image = None
+
+MAGIC = b'KVFR'
+VERSION = 1
+HEADER = struct.Struct('>4sHBBBBHIIIIIII')
+
+KEY_FRAME = 0
+DELTA_FRAME = 1
+
+FLAG_CACHED = 1
+
+CONTENT_TYPE = 'application/vnd.doctor-kivy.frame'
+
+# Name -> wire id, in order of preference
+ENCODINGS = OrderedDict([
+    ('lz4', 2),
+    ('zstd', 3),
+    ('zlib', 1),
+    ('raw', 0),
+    ('webp', 4),
+])
+
+DEFAULT_TILE = 32
+
+# A delta that changes more tiles than this share is sent as a key frame
+MAX_DELTA_RATIO = 0.5
+
+
+def available_encodings():
+    """Encodings this process can produce, in order of preference."""
+    return [name for name in ENCODINGS
+            if name in ('raw', 'zlib')
+            or (name == 'lz4' and lz4_frame is not None)
+            or (name == 'zstd' and zstandard is not None)
+            or (name == 'webp' and Image is not None)]
+
+
+def choose_encoding(accepted, delta=False):
+    """First encoding the client accepts and we can produce (WebP: key frames only)."""
+    available = available_encodings()
+    for name in accepted or available:
+        if name in available and not (delta and name == 'webp'):
+            return name
+    return 'raw'
+
+
+def compress(payload, encoding, width=0, height=0):
+    if encoding == 'zlib':
+        return zlib.compress(payload, 1)
+    if encoding == 'lz4':
+        return lz4_frame.compress(payload)
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=1).compress(payload)
+    if encoding == 'webp':
+        out = io.BytesIO()
+        Image.frombytes('RGBA', (width, height), payload).save(out, 'WEBP', lossless=True, method=0)
+        return out.getvalue()
+    return payload
+
+
+def decompress(payload, encoding_id, width=0, height=0):
+    if encoding_id == ENCODINGS['zlib']:
+        return zlib.decompress(payload)
+    if encoding_id == ENCODINGS['lz4']:
+        return lz4_frame.decompress(payload)
+    if encoding_id == ENCODINGS['zstd']:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(payload)
+    if encoding_id == ENCODINGS['webp']:
+        return Image.open(io.BytesIO(payload)).convert('RGBA').tobytes()
+    return payload
+
+
+def changed_tiles(old, new, width, height, tile=DEFAULT_TILE):
+    """(column, row) of every tile whose pixels differ between two frames."""
+    stride = width * 4
+    tiles = []
+    for row, y0 in enumerate(range(0, height, tile)):
+        # Most rows of an edit are unchanged: find the changed ones first
+        rows = [y for y in range(y0, min(height, y0 + tile))
+                if old[y * stride:(y + 1) * stride] != new[y * stride:(y + 1) * stride]]
+        if not rows:
+            continue
+        for column, x0 in enumerate(range(0, stride, tile * 4)):
+            x1 = min(stride, x0 + tile * 4)
+            for y in rows:
+                offset = y * stride
+                if old[offset + x0:offset + x1] != new[offset + x0:offset + x1]:
+                    tiles.append((column, row))
+                    break
+    return tiles
+
+
+def delta_payload(frame, width, height, tiles, tile=DEFAULT_TILE):
+    stride = width * 4
+    parts = [struct.pack('>I', len(tiles))]
+    parts.extend(struct.pack('>HH', column, row) for column, row in tiles)
+    for column, row in tiles:
+        x0 = column * tile * 4
+        x1 = min(stride, x0 + tile * 4)
+        for y in range(row * tile, min(height, (row + 1) * tile)):
+            parts.append(frame[y * stride + x0:y * stride + x1])
+    return b''.join(parts)
+
+
+def encode_frame(frame, width, height, seq, base=None, base_seq=0, accepted=None,
+                 request_id=0, render_us=0, cached=False, tile=DEFAULT_TILE):
+    """
+    Encode RGBA `frame` as a key frame, or as a delta against `base`
+    (the frame numbered `base_seq` the client already has) when that is
+    smaller.
+    """
+    kind = KEY_FRAME
+    payload = frame
+    if base is not None and len(base) == len(frame):
+        tiles = changed_tiles(base, frame, width, height, tile)
+        total = -(-width // tile) * -(-height // tile)
+        if len(tiles) <= total * MAX_DELTA_RATIO:
+            kind = DELTA_FRAME
+            payload = delta_payload(frame, width, height, tiles, tile)
+    encoding = choose_encoding(accepted, delta=kind == DELTA_FRAME)
+    payload = compress(payload, encoding, width, height)
+    header = HEADER.pack(
+        MAGIC, HEADER.size, VERSION, kind, ENCODINGS[encoding], FLAG_CACHED if cached else 0,
+        tile if kind == DELTA_FRAME else 0, width, height, seq,
+        base_seq if kind == DELTA_FRAME else 0, request_id & 0xFFFFFFFF, min(render_us, 0xFFFFFFFF), len(payload),
+    )
+    return header + payload
+
+
+def decode_frame(data, base=None):
+    """
+    Parse a frame and return (header dict, RGBA pixels). Delta frames need
+    the pixels of their base frame as `base`.
+    """
+    (magic, header_size, version, kind, encoding, flags, tile, width, height,
+     seq, base_seq, request_id, render_us, size) = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError('not a frame')
+    payload = decompress(bytes(data[header_size:header_size + size]), encoding, width, height)
+    header = {
+        'kind': kind, 'encoding': encoding, 'cached': bool(flags & FLAG_CACHED), 'tile': tile,
+        'width': width, 'height': height, 'seq': seq, 'base_seq': base_seq,
+        'request_id': request_id, 'render_us': render_us,
+    }
+    if kind == KEY_FRAME:
+        return header, payload
+    if base is None:
+        raise ValueError(f"delta frame {seq} needs base frame {base_seq}")
+    pixels = bytearray(base)
+    stride = width * 4
+    count, = struct.unpack_from('>I', payload)
+    offset = 4 + count * 4
+    for index in range(count):
+        column, row = struct.unpack_from('>HH', payload, 4 + index * 4)
+        x0 = column * tile * 4
+        x1 = min(stride, x0 + tile * 4)
+        for y in range(row * tile, min(height, (row + 1) * tile)):
+            pixels[y * stride + x0:y * stride + x1] = payload[offset:offset + x1 - x0]
+            offset += x1 - x0
+    return header, bytes(pixels)
+
+
+class FrameStore:
+    """
+    The last few frames sent for each session, numbered, so a client can
+    ask for a delta against the frame it has.
+    """
+
+    def __init__(self, max_sessions=64, per_session=3):
+        self.max_sessions = max_sessions
+        self.per_session = per_session
+        self._sessions = OrderedDict()
+        self._next_seq = {}
+        self._lock = threading.Lock()
+
+    def add(self, session, frame):
+        """Store a frame and return its sequence number."""
+        with self._lock:
+            frames = self._sessions.pop(session, None) or OrderedDict()
+            seq = self._next_seq.get(session, 0) + 1
+            self._next_seq[session] = seq
+            frames[seq] = frame
+            while len(frames) > self.per_session:
+                frames.popitem(last=False)
+            self._sessions[session] = frames
+            while len(self._sessions) > self.max_sessions:
+                evicted, _ = self._sessions.popitem(last=False)
+                self._next_seq.pop(evicted, None)
+            return seq
+
+    def get(self, session, seq):
+        with self._lock:
+            frames = self._sessions.get(session)
+            return frames.get(seq) if frames else None
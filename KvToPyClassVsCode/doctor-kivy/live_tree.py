@@ -0,0 +1,298 @@
+"""
+Incremental re-rendering of KV previews.
+
+A LiveTree is one built KV snippet kept alive between renders of the same
+session (an editor document). When the session's source changes, the new
+source is parsed and its root rule tree is compared with the one the
+widgets were built from:
+
+- a node whose widget class, id, handlers, canvas instructions or number
+  of children changed, or that lost a property or gained a bound
+  expression (`self.width`, `btn.text`, ...), is rebuilt on its own and
+  swapped into its parent;
+- constant property changes are set on the live widget;
+- anything outside the root rule (class rules, dynamic classes,
+  directives), a rebuilt subtree that refers to `root` or to ids outside
+  it, or whose ids are used elsewhere, or a change the live tree can't be
+  mapped to, rebuilds the whole snippet.
+
+After a patch only the region covered by changed widgets (before and
+after layout) is read back from the GPU and patched into the previous
+frame. When other widgets may be watching a changed one (through its id,
+`root`, `parent` or `children`), the whole frame is read back.
+
+Uses Builder's `_apply_rule` the way Builder.load_string does; any
+failure falls back to a full rebuild.
+"""
+
+import math
+import re
+from types import CodeType
+
+from kivy.factory import Factory
+from kivy.lang import Builder
+from kivy.lang.builder import global_idmap
+from kivy.lang.parser import Parser
+
+# Pixels added around dirty widgets for borders, shadows and antialiasing
+DIRTY_MARGIN = 2
+
+# Past this share of the frame, read everything back
+FULL_READ_RATIO = 0.6
+
+NAME_RE = re.compile(r'[A-Za-z_]\w*')
+
+# Names through which a widget's properties reach other widgets
+LINK_NAMES = {'root', 'parent', 'children'}
+
+
+class FullRebuild(Exception):
+    """The change can't be patched into the live widgets."""
+
+
+def _signature(rule):
+    """Everything that describes a rule, for exact comparison."""
+    if rule is None:
+        return None
+    return (
+        rule.name, rule.id,
+        tuple((name, prop.value) for name, prop in rule.properties.items()),
+        tuple((handler.name, handler.value) for handler in rule.handlers),
+        tuple(_signature(canvas) for canvas in (rule.canvas_before, rule.canvas_root, rule.canvas_after)),
+        tuple(_signature(child) for child in rule.children),
+    )
+
+
+def _shell(rule):
+    """What can't change without rebuilding the node's widget."""
+    return (
+        rule.name, rule.id,
+        tuple((handler.name, handler.value) for handler in rule.handlers),
+        tuple(_signature(canvas) for canvas in (rule.canvas_before, rule.canvas_root, rule.canvas_after)),
+        len(rule.children),
+    )
+
+
+def _preamble(parser):
+    """Everything in a KV source besides its root widget."""
+    return (
+        tuple(command for _, command in parser.directives),
+        tuple((str(getattr(selector, 'key', selector)), _signature(rule)) for selector, rule in parser.rules),
+        tuple(sorted(parser.dynamic_classes.items())),
+        len(parser.templates),
+    )
+
+
+def _is_bound(prop):
+    return isinstance(prop.co_value, CodeType) and bool(prop.watched_keys)
+
+
+def diff_rules(old, new, path=(), ops=None):
+    """
+    List the operations turning the widgets built from `old` into those of
+    `new`: ('set', path, [(name, prop)]) and ('rebuild', path, rule), where
+    path is the chain of child indices from the root rule.
+    """
+    if ops is None:
+        ops = []
+    if _shell(old) != _shell(new) or set(old.properties) - set(new.properties):
+        ops.append(('rebuild', path, new))
+        return ops
+    changes = []
+    for name, prop in new.properties.items():
+        before = old.properties.get(name)
+        if before is not None and before.value == prop.value:
+            continue
+        if _is_bound(prop) or (before is not None and _is_bound(before)):
+            ops.append(('rebuild', path, new))
+            return ops
+        changes.append((name, prop))
+    if changes:
+        ops.append(('set', path, changes))
+    for index, (old_child, new_child) in enumerate(zip(old.children, new.children)):
+        diff_rules(old_child, new_child, path + (index,), ops)
+    return ops
+
+
+def _names(rule, skip=None):
+    """Identifiers used by the expressions of a rule tree, except below `skip`."""
+    names = set()
+    if rule is None or rule is skip:
+        return names
+    for prop in list(rule.properties.values()) + list(rule.handlers):
+        names.update(NAME_RE.findall(prop.value))
+    for child in (rule.canvas_before, rule.canvas_root, rule.canvas_after, *rule.children):
+        names |= _names(child, skip)
+    return names
+
+
+def _rule_ids(rule):
+    ids = [rule.id] if rule.id else []
+    for child in rule.children:
+        ids.extend(_rule_ids(child))
+    return ids
+
+
+class LiveTree:
+    """The widgets of one rendered snippet and the rules they came from."""
+
+    def __init__(self, code, filename):
+        self.filename = filename
+        self.parser = Parser(content=code, filename=filename)
+        try:
+            self.root = Builder.load_string(code, filename=filename)
+        except Exception:
+            Builder.unload_file(filename)
+            raise
+        if self.root is None:
+            Builder.unload_file(filename)
+            raise ValueError('KV source has no root widget to render')
+        # True while live widgets are being changed: an error leaves them half patched
+        self.patching = False
+        # Set by update() when changes may show up outside the touched widgets
+        self.spread = False
+        self.widgets = {}
+        self._map(self.root, self.parser.root, ())
+        self.frame = None
+        self.size = None
+
+    def _map(self, widget, rule, path):
+        """Record which widget each rule node built, where that's unambiguous."""
+        self.widgets[path] = widget
+        count = len(rule.children)
+        if not count:
+            return
+        # Rule children are added last, after children from class rules;
+        # `children` lists the most recently added first
+        built = widget.children[:count][::-1]
+        if len(built) != count:
+            return
+        for index, (child, child_rule) in enumerate(zip(built, rule.children)):
+            if not isinstance(child, Factory.get(child_rule.name)):
+                # A container that keeps its children elsewhere (ScreenManager...)
+                return
+            self._map(child, child_rule, path + (index,))
+
+    def update(self, code):
+        """
+        Patch the live widgets to match `code`. Returns the set of widgets
+        that were changed or rebuilt (for the dirty region); raises
+        FullRebuild when the change needs a new tree.
+        """
+        parser = Parser(content=code, filename=self.filename)
+        if parser.root is None or _preamble(parser) != _preamble(self.parser):
+            raise FullRebuild
+        ops = diff_rules(self.parser.root, parser.root)
+        names = _names(parser.root)
+        all_ids = set(_rule_ids(parser.root))
+        touched = set()
+        self.spread = False
+        self.patching = True
+        for op, path, payload in ops:
+            if op == 'rebuild' and not path:
+                raise FullRebuild
+            widget = self.widgets.get(path)
+            if widget is None:
+                raise FullRebuild
+            if op == 'set':
+                rule = self._rule_at(path, parser.root)
+                if not path or names & LINK_NAMES or (rule.id and rule.id in _names(parser.root, skip=rule)):
+                    self.spread = True
+                self._set(widget, payload)
+                touched.add(widget)
+            else:
+                touched.add(self._rebuild(path, payload, parser.root, all_ids))
+        self.parser = parser
+        self.patching = False
+        return touched
+
+    def _set(self, widget, changes):
+        idmap = dict(global_idmap)
+        idmap.update(self.root.ids)
+        idmap['root'] = self.root.proxy_ref
+        idmap['self'] = widget.proxy_ref
+        for name, prop in changes:
+            if not hasattr(widget, name):
+                raise FullRebuild
+            value = prop.co_value
+            if isinstance(value, CodeType):
+                value = eval(value, idmap)
+            setattr(widget, name, value)
+
+    def _rebuild(self, path, rule, new_root, all_ids):
+        old = self.widgets[path]
+        parent = self.widgets.get(path[:-1])
+        if parent is None or old not in parent.children:
+            raise FullRebuild
+        # The subtree is built as its own rule context: `root` would be the
+        # subtree's top widget, and widgets bound to ids in the old subtree
+        # would keep watching the removed widgets
+        old_ids = set(_rule_ids(self._rule_at(path)))
+        used = _names(rule)
+        if 'root' in used or used & (all_ids - set(_rule_ids(rule))) or old_ids & _names(new_root, skip=rule):
+            raise FullRebuild
+        for widget_id in old_ids:
+            self.root.ids.pop(widget_id, None)
+
+        child = Factory.get(rule.name)(__no_builder=True)
+        rule_children = []
+        child.apply_class_lang_rules(root=child, rule_children=rule_children)
+        Builder._apply_rule(child, rule, rule, rule_children=rule_children)
+        for rule_child in rule_children:
+            rule_child.dispatch('on_kv_post', child)
+        child.dispatch('on_kv_post', child)
+        # Ids in the subtree were registered on its top widget
+        self.root.ids.update({key: child.ids.pop(key) for key in _rule_ids(rule) if key in child.ids})
+
+        index = parent.children.index(old)
+        parent.remove_widget(old)
+        parent.add_widget(child, index=index)
+        for key in [key for key in self.widgets if key[:len(path)] == path]:
+            del self.widgets[key]
+        self._map(child, rule, path)
+        return child
+
+    def _rule_at(self, path, root=None):
+        rule = root or self.parser.root
+        for index in path:
+            rule = rule.children[index]
+        return rule
+
+    def boxes(self):
+        """{widget: (x0, y0, x1, y1)} in root coordinates for every widget."""
+        boxes = {}
+        for widget in self.root.walk():
+            x0, y0 = widget.to_window(widget.x, widget.y)
+            x1, y1 = widget.to_window(widget.right, widget.top)
+            boxes[widget] = (min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1))
+        return boxes
+
+    def dirty_region(self, before, after, touched, width, height):
+        """
+        Top-down pixel rectangle (x, y, w, h) covering everything that may
+        look different, or None if nothing does.
+        """
+        if self.spread:
+            return (0, 0, width, height)
+        boxes = []
+        for widget in set(before) | set(after):
+            if before.get(widget) != after.get(widget) or widget in touched:
+                boxes.extend(box for box in (before.get(widget), after.get(widget)) if box)
+        for widget in touched:
+            # Rebuilt subtrees: everything below the new widget is new
+            boxes.extend(after[child] for child in widget.walk(restrict=True) if child in after)
+        if not boxes:
+            return None
+        x0 = max(0, math.floor(min(box[0] for box in boxes)) - DIRTY_MARGIN)
+        y0 = max(0, math.floor(min(box[1] for box in boxes)) - DIRTY_MARGIN)
+        x1 = min(width, math.ceil(max(box[2] for box in boxes)) + DIRTY_MARGIN)
+        y1 = min(height, math.ceil(max(box[3] for box in boxes)) + DIRTY_MARGIN)
+        if x1 <= x0 or y1 <= y0:
+            return None
+        # Rows are top-down in the frame
+        return (x0, height - y1, x1 - x0, y1 - y0)
+
+    def close(self):
+        Builder.unload_file(self.filename)
+        self.root = None
+        self.widgets = {}
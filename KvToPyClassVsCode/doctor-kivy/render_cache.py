@@ -0,0 +1,226 @@
+"""
+Content-addressed cache of rendered previews.
+
+Every editor window asks for the same snippets again (hovering back and
+forth, several windows on one file), and a burst of keystrokes sends the
+same source several times before the first render returns. RenderCache:
+
+- keys renders by a BLAKE2b hash of the normalized KV source plus render
+  size and density, so formatting-only edits and other clients hit it;
+- keeps results in a byte-bounded LRU;
+- optionally spills evicted results (and, on shutdown, the rest) to a
+  directory, which is also bounded and survives server restarts;
+- runs at most one render per key at a time: requests for a key that is
+  already rendering wait for that render instead of starting another.
+"""
+
+import hashlib
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+
+# Full-line KV comments; `#:` lines are directives and must stay
+COMMENT_RE = re.compile(r'^\s*#(?!:)')
+
+
+def normalize_source(code):
+    """
+    KV source with the differences Kivy ignores removed: line endings,
+    trailing whitespace, blank lines and full-line comments.
+    """
+    lines = []
+    for line in code.replace('\r\n', '\n').replace('\r', '\n').split('\n'):
+        line = line.rstrip()
+        if line and not COMMENT_RE.match(line):
+            lines.append(line)
+    return '\n'.join(lines) + '\n'
+
+
+def render_key(source, width, height, density, output='png'):
+    """Hex digest identifying one render of normalized `source`."""
+    digest = hashlib.blake2b(source.encode('utf-8'), digest_size=20)
+    digest.update(f"\0{width}x{height}@{density:g}".encode())
+    if output != 'png':
+        digest.update(f"/{output}".encode())
+    return digest.hexdigest()
+
+
+def png_size(data):
+    """(width, height) from a PNG's IHDR chunk."""
+    return struct.unpack('>II', data[16:24])
+
+
+class _InFlight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RenderCache:
+    """
+    LRU of render results ({'image': png bytes, 'width', 'height', ...})
+    bounded by image bytes, with an optional disk tier in `spill_dir`.
+    Raw RGBA results are kept in memory only.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, spill_dir=None, max_spill_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self.size = 0
+        self.spill_size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._spill_lock = threading.Lock()
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+            self.spill_size = sum(entry.stat().st_size for entry in os.scandir(spill_dir)
+                                  if entry.name.endswith('.png'))
+
+    def get_or_render(self, key, render):
+        """
+        Return (result, source) for key, calling render() on a miss.
+        source is 'memory', 'disk', 'coalesced' or 'render'. Errors from
+        render() are raised to every waiting caller and not cached.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry, 'memory'
+            pending = self._in_flight.get(key)
+            if pending is None:
+                pending = self._in_flight[key] = _InFlight()
+                owner = True
+            else:
+                self.coalesced += 1
+                owner = False
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.result, 'coalesced'
+
+        source = 'disk'
+        try:
+            result = self._load(key)
+            if result is None:
+                source = 'render'
+                result = render()
+            pending.result = result
+            self._store(key, result, count_miss=source == 'render')
+            return result, source
+        except BaseException as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            pending.done.set()
+
+    def _store(self, key, result, count_miss):
+        spilled = []
+        with self._lock:
+            if count_miss:
+                self.misses += 1
+            else:
+                self.disk_hits += 1
+            if len(result['image']) > self.max_bytes:
+                spilled.append((key, result))
+            else:
+                self._entries[key] = result
+                self.size += len(result['image'])
+            while self.size > self.max_bytes:
+                evicted_key, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted['image'])
+                self.evictions += 1
+                spilled.append((evicted_key, evicted))
+        for evicted_key, evicted in spilled:
+            self._spill(evicted_key, evicted)
+
+    def _path(self, key):
+        return os.path.join(self.spill_dir, f"{key}.png")
+
+    def _load(self, key):
+        if not self.spill_dir:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                image = f.read()
+            # Recently used files survive the disk tier's eviction
+            os.utime(path)
+        except OSError:
+            return None
+        if not image.startswith(b'\x89PNG') or len(image) < 24:
+            return None
+        width, height = png_size(image)
+        return {'image': image, 'width': width, 'height': height, 'render_ms': 0.0}
+
+    def _spill(self, key, result):
+        if (not self.spill_dir or len(result['image']) > self.max_spill_bytes
+                or not result['image'].startswith(b'\x89PNG')):
+            return
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(result['image'])
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"doctor-kivy: Could not spill render to {self.spill_dir}: {e}", flush=True)
+            return
+        with self._spill_lock:
+            self.spill_size += len(result['image'])
+            if self.spill_size > self.max_spill_bytes:
+                self._trim_spill()
+
+    def _trim_spill(self):
+        """Delete least recently used spilled files until under the limit."""
+        entries = sorted((entry for entry in os.scandir(self.spill_dir) if entry.name.endswith('.png')),
+                         key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in entries:
+            if self.spill_size <= self.max_spill_bytes * 0.9:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                continue
+            self.spill_size -= size
+
+    def close(self):
+        """Spill what is still in memory, so the next server starts warm."""
+        with self._lock:
+            entries = list(self._entries.items())
+        for key, result in entries:
+            self._spill(key, result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'spill_bytes': self.spill_size if self.spill_dir else None,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,272 @@
+"""
+Pool of warm Kivy worker processes.
+
+Importing Kivy, initialising SDL/GL and opening a window takes seconds;
+rendering a snippet into an already open window takes milliseconds. The
+pool starts its workers once, keeps them idle in a queue and hands each
+render to the next free one, so concurrent requests render in parallel
+and none of them pays the startup cost.
+
+Requests of one session (an editor document) go to the worker holding
+that session's live widget tree, so they can be rendered incrementally;
+if that worker stays busy, another one renders the session from scratch.
+
+Workers that crash, hang past the request timeout or have rendered
+`max_renders` snippets (Kivy leaks a little per widget tree) are replaced
+in the background.
+"""
+
+import multiprocessing
+import threading
+import time
+from collections import OrderedDict
+
+import render_worker
+
+# Delay before respawning a worker that failed to start, doubled per failure
+RESPAWN_DELAY = 1.0
+MAX_RESPAWN_DELAY = 30.0
+
+# How long a session's request waits for the worker that has its live tree
+AFFINITY_WAIT = 0.25
+
+# Session -> worker assignments remembered
+MAX_SESSIONS = 1024
+
+
+class RenderError(Exception):
+    """The snippet could not be rendered; the message is shown to the user."""
+
+
+class PoolUnavailable(RenderError):
+    """No worker became free in time."""
+
+
+class Worker:
+    """One worker process and the pipe to it."""
+
+    def __init__(self, context, options):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(
+            target=render_worker.main, args=(child_conn, options),
+            name='doctor-kivy-worker', daemon=True,
+        )
+        self.process.start()
+        child_conn.close()
+        self.pid = self.process.pid
+        self.renders = 0
+        self.info = {}
+
+    def wait_ready(self, timeout):
+        if not self.conn.poll(timeout):
+            raise RenderError(f"worker {self.pid} did not start within {timeout:.0f}s")
+        status, payload = self.conn.recv()
+        if status != 'ready':
+            raise RenderError(f"worker {self.pid} failed to start: {payload}")
+        self.info = payload
+
+    def call(self, message, timeout):
+        """Send one request and wait for its reply; raises RenderError."""
+        self.renders += 1
+        try:
+            self.conn.send(message)
+            if not self.conn.poll(timeout):
+                raise TimeoutError
+            status, payload = self.conn.recv()
+        except TimeoutError:
+            self.kill()
+            raise RenderError(f"render timed out after {timeout:.0f}s")
+        except (EOFError, OSError):
+            self.kill()
+            raise RenderError(f"worker {self.pid} died while rendering")
+        if status != 'ok':
+            raise RenderError(payload)
+        return payload
+
+    @property
+    def alive(self):
+        return self.process.is_alive()
+
+    def stop(self, timeout=2.0):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout)
+        self.kill()
+
+    def kill(self):
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class RenderPool:
+    """
+    `size` warm workers rendering at `width`x`height` and `density` by default.
+
+    render() blocks until a worker is free, so the HTTP server can call it
+    from any number of request threads.
+    """
+
+    def __init__(self, size=2, width=800, height=600, density=1.0, max_renders=500, startup_timeout=60.0):
+        self.size = max(1, size)
+        self.width = width
+        self.height = height
+        self.density = density
+        self.max_renders = max_renders
+        self.startup_timeout = startup_timeout
+        self.last_error = None
+        self.renders = 0
+        self._context = multiprocessing.get_context('spawn')
+        self._idle = []
+        self._idle_cond = threading.Condition()
+        self._sessions = OrderedDict()
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def start(self):
+        """Spawn the workers in the background; ready() tells when they're up."""
+        for _ in range(self.size):
+            self._spawn_async()
+
+    def ready(self):
+        """Number of workers started and not shut down."""
+        with self._lock:
+            return len(self._workers)
+
+    def stats(self):
+        return {
+            'size': self.size,
+            'ready': self.ready(),
+            'idle': len(self._idle),
+            'sessions': len(self._sessions),
+            'renders': self.renders,
+            'last_error': self.last_error,
+        }
+
+    def render(self, code, width=None, height=None, density=None, session=None, output='png', timeout=30.0):
+        """
+        Render a KV snippet on the next free worker (for a session,
+        preferably the one that rendered it last); returns the worker's result.
+        output is 'png' or 'rgba' (raw top-down pixels).
+        """
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            preferred = self._sessions.get(session) if session else None
+        worker = self._acquire(deadline, preferred)
+        message = {
+            'code': code,
+            'width': width or self.width,
+            'height': height or self.height,
+            'density': density or self.density,
+            'session': session,
+            'output': output,
+        }
+        try:
+            result = worker.call(message, max(0.1, deadline - time.monotonic()))
+        except RenderError:
+            if not worker.alive:
+                self._retire(worker)
+                self._spawn_async()
+                worker = None
+            raise
+        finally:
+            if worker is not None:
+                self._release(worker)
+        with self._lock:
+            self.renders += 1
+            if session:
+                self._sessions[session] = worker
+                self._sessions.move_to_end(session)
+                while len(self._sessions) > MAX_SESSIONS:
+                    self._sessions.popitem(last=False)
+        result['worker'] = worker.pid
+        return result
+
+    def _acquire(self, deadline, preferred=None):
+        affinity_until = time.monotonic() + AFFINITY_WAIT
+        with self._idle_cond:
+            while True:
+                now = time.monotonic()
+                if preferred is not None and preferred in self._idle:
+                    worker = preferred
+                elif self._idle and (preferred is None or now >= affinity_until or not preferred.alive):
+                    worker = self._idle[-1]
+                elif now >= deadline:
+                    detail = f": {self.last_error}" if self.last_error and not self.ready() else ''
+                    raise PoolUnavailable(f"no render worker available{detail}")
+                else:
+                    wake = deadline if preferred is None or not self._idle else min(affinity_until, deadline)
+                    self._idle_cond.wait(max(0.0, wake - now))
+                    continue
+                self._idle.remove(worker)
+                if worker.alive:
+                    return worker
+                self._retire(worker)
+                self._spawn_async()
+
+    def _release(self, worker):
+        if self._closed:
+            worker.stop()
+        elif self.max_renders and worker.renders >= self.max_renders:
+            self._retire(worker)
+            worker.stop()
+            self._spawn_async()
+        else:
+            self._put_idle(worker)
+
+    def _put_idle(self, worker):
+        with self._idle_cond:
+            self._idle.append(worker)
+            self._idle_cond.notify_all()
+
+    def _retire(self, worker):
+        with self._lock:
+            self._workers.discard(worker)
+            for session in [session for session, owner in self._sessions.items() if owner is worker]:
+                del self._sessions[session]
+
+    def _spawn_async(self):
+        if not self._closed:
+            threading.Thread(target=self._spawn, name='doctor-kivy-spawn', daemon=True).start()
+
+    def _spawn(self):
+        delay = RESPAWN_DELAY
+        worker = None
+        while not self._closed:
+            started = time.perf_counter()
+            worker = Worker(self._context, {'width': self.width, 'height': self.height})
+            try:
+                worker.wait_ready(self.startup_timeout)
+            except (RenderError, EOFError, OSError) as e:
+                worker.kill()
+                self.last_error = str(e)
+                print(f"doctor-kivy: {e}; retrying in {delay:.0f}s", flush=True)
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RESPAWN_DELAY)
+                continue
+            with self._lock:
+                if self._closed:
+                    break
+                self._workers.add(worker)
+            self.last_error = None
+            print(f"doctor-kivy: Worker {worker.pid} ready in {time.perf_counter() - started:.1f}s "
+                  f"(Kivy {worker.info.get('kivy', '?')})", flush=True)
+            self._put_idle(worker)
+            return
+        if worker is not None:
+            worker.stop()
+
+    def close(self):
+        """Stop idle workers; busy ones stop when their render returns."""
+        self._closed = True
+        with self._idle_cond:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.stop()
+        with self._lock:
+            self._workers.clear()
+            self._sessions.clear()
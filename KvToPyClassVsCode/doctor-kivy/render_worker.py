@@ -0,0 +1,254 @@
+"""
+Kivy side of the render pool.
+
+Each worker process imports Kivy, opens one hidden window (and with it the
+GL context) at startup and then renders KV snippets for as long as the
+pool keeps it: the snippet is loaded with `Builder.load_string`, laid out
+at the requested size, drawn into an offscreen Fbo and encoded as PNG.
+Nothing but the widget tree is created per request.
+
+Requests with a `session` keep their widget tree (a LiveTree) and frame
+alive in the worker, so the session's next source is applied as a patch
+to the live widgets and only the changed region is read back.
+
+Kivy is only imported inside the worker, so the HTTP server itself starts
+without it.
+"""
+
+import os
+import struct
+import time
+import traceback
+import zlib
+from collections import OrderedDict
+
+# Frames the clock is ticked after loading, so layouts and label textures settle
+SETTLE_TICKS = 2
+
+# Offscreen buffers kept per worker, keyed by render size
+MAX_FBOS = 4
+
+# Live widget trees kept per worker for incremental renders
+MAX_SESSIONS = 8
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+
+def encode_png(pixels, width, height, level=1):
+    """Encode top-down RGBA bytes as PNG. Level 1 trades size for speed."""
+    stride = width * 4
+    raw = b''.join(b'\x00' + pixels[y * stride:(y + 1) * stride] for y in range(height))
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+    header = struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0)
+    return (PNG_SIGNATURE + chunk(b'IHDR', header)
+            + chunk(b'IDAT', zlib.compress(raw, level)) + chunk(b'IEND', b''))
+
+
+class Renderer:
+    """Owns the worker's window and renders one snippet at a time."""
+
+    def __init__(self, width, height):
+        os.environ.setdefault('KIVY_NO_ARGS', '1')
+        os.environ.setdefault('KIVY_NO_CONSOLELOG', '1')
+        os.environ.setdefault('KIVY_NO_FILELOG', '1')
+
+        from kivy.config import Config
+        Config.set('graphics', 'window_state', 'hidden')
+        Config.set('graphics', 'width', str(width))
+        Config.set('graphics', 'height', str(height))
+        # Don't sleep between ticks to hold a frame rate
+        Config.set('graphics', 'maxfps', '0')
+        Config.set('kivy', 'exit_on_escape', '0')
+
+        import kivy
+        from kivy.base import EventLoop
+        from kivy.clock import Clock
+        from kivy.core.window import Window
+        from kivy.graphics import ClearBuffers, ClearColor, Fbo, Scale, Translate
+        from kivy.graphics.opengl import GL_RGBA, GL_UNSIGNED_BYTE, glReadPixels
+        from kivy.lang import Builder
+        from kivy.metrics import Metrics
+
+        import live_tree
+
+        EventLoop.ensure_window()
+        Window.hide()
+
+        self.kivy_version = kivy.__version__
+        self._clock = Clock
+        self._builder = Builder
+        self._metrics = Metrics
+        self._live_tree = live_tree
+        self._graphics = (ClearBuffers, ClearColor, Fbo, Scale, Translate)
+        self._read_pixels = lambda x, y, w, h: glReadPixels(x, y, w, h, GL_RGBA, GL_UNSIGNED_BYTE)
+        self._fbos = {}
+        self._sessions = OrderedDict()
+        self.renders = 0
+
+    def _fbo(self, width, height):
+        fbo = self._fbos.pop((width, height), None)
+        if fbo is None:
+            ClearBuffers, ClearColor, Fbo, Scale, Translate = self._graphics
+            fbo = Fbo(size=(width, height), with_stencilbuffer=True)
+            with fbo:
+                ClearColor(0, 0, 0, 0)
+                ClearBuffers()
+                # Flip vertically so pixel rows come back top-down, as PNG wants
+                Scale(1, -1, 1)
+                Translate(0, -height, 0)
+            while len(self._fbos) >= MAX_FBOS:
+                self._fbos.pop(next(iter(self._fbos)))
+        self._fbos[(width, height)] = fbo
+        return fbo
+
+    def render(self, code, width, height, density, session=None, output='png'):
+        """
+        Render `code` and return {image, width, height, render_ms, mode,
+        dirty}. image is PNG, or the raw top-down RGBA frame when output is
+        'rgba'. mode is 'full' or 'incremental'; dirty is the top-down
+        (x, y, w, h) that changed since the session's last frame.
+        """
+        started = time.perf_counter()
+        if self._metrics.density != density:
+            # dp()/sp() values are read when widgets are built
+            self._metrics.density = density
+            self._drop_sessions()
+        self.renders += 1
+
+        tree = self._sessions.pop(session, None) if session else None
+        mode = 'full'
+        dirty = (0, 0, width, height)
+        if tree is not None and tree.size == (width, height):
+            try:
+                dirty = self._patch(tree, code, width, height)
+                mode = 'incremental'
+            except self._live_tree.FullRebuild:
+                tree.close()
+                tree = None
+            except Exception:
+                if tree.patching:
+                    # Half patched: a full build tells whether the KV is at fault
+                    tree.close()
+                    tree = None
+                else:
+                    # The new source doesn't parse; keep the live tree for the next edit
+                    self._keep(session, tree)
+                    raise
+        elif tree is not None:
+            tree.close()
+            tree = None
+
+        if mode == 'full':
+            # A unique name per snippet, so its rules can be unloaded again
+            tree = self._live_tree.LiveTree(code, f"<preview-{os.getpid()}-{self.renders}>")
+            try:
+                tree.size = (width, height)
+                tree.root.pos = (0, 0)
+                tree.root.size = (width, height)
+                self._settle()
+                tree.frame = bytearray(self._capture(tree.root, width, height))
+            except Exception:
+                tree.close()
+                raise
+
+        image = bytes(tree.frame) if output == 'rgba' else encode_png(bytes(tree.frame), width, height)
+        if session:
+            self._keep(session, tree)
+        else:
+            tree.close()
+        return {
+            'image': image,
+            'width': width,
+            'height': height,
+            'render_ms': round((time.perf_counter() - started) * 1000, 2),
+            'mode': mode,
+            'dirty': dirty,
+        }
+
+    def _patch(self, tree, code, width, height):
+        """Apply `code` to a live tree and refresh the changed part of its frame."""
+        before = tree.boxes()
+        touched = tree.update(code)
+        self._settle()
+        dirty = tree.dirty_region(before, tree.boxes(), touched, width, height)
+        if dirty is not None:
+            x, y, w, h = dirty
+            if w * h > width * height * self._live_tree.FULL_READ_RATIO:
+                x, y, w, h = dirty = (0, 0, width, height)
+            self._blit(tree.frame, width, self._capture(tree.root, width, height, (x, y, w, h)), (x, y, w, h))
+        return dirty
+
+    def _settle(self):
+        """Run what EventLoop.idle runs between frames, minus input and drawing."""
+        for _ in range(SETTLE_TICKS):
+            self._clock.tick()
+            # Canvas rules bound in KV are applied on sync
+            self._builder.sync()
+            # Layouts run their triggers before the frame
+            self._clock.tick_draw()
+            self._builder.sync()
+
+    def _capture(self, root, width, height, region=None):
+        """Draw `root` and read back `region` (top-down x, y, w, h; default all)."""
+        fbo = self._fbo(width, height)
+        fbo.add(root.canvas)
+        try:
+            fbo.draw()
+            if region is None:
+                return fbo.pixels
+            # Drawing is flipped, so framebuffer rows are already top-down
+            fbo.bind()
+            try:
+                return self._read_pixels(*region)
+            finally:
+                fbo.release()
+        finally:
+            fbo.remove(root.canvas)
+
+    @staticmethod
+    def _blit(frame, width, pixels, region):
+        x, y, w, h = region
+        stride, row = width * 4, w * 4
+        for line in range(h):
+            offset = (y + line) * stride + x * 4
+            frame[offset:offset + row] = pixels[line * row:(line + 1) * row]
+
+    def _keep(self, session, tree):
+        self._sessions[session] = tree
+        while len(self._sessions) > MAX_SESSIONS:
+            _, evicted = self._sessions.popitem(last=False)
+            evicted.close()
+
+    def _drop_sessions(self):
+        while self._sessions:
+            _, tree = self._sessions.popitem()
+            tree.close()
+
+
+def main(conn, options):
+    """Process entry point: initialise Kivy, then serve render requests from `conn`."""
+    try:
+        renderer = Renderer(options['width'], options['height'])
+    except Exception as e:
+        conn.send(('error', f"{type(e).__name__}: {e}"))
+        return
+    conn.send(('ready', {'pid': os.getpid(), 'kivy': renderer.kivy_version}))
+
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            # The server went away
+            return
+        if message is None:
+            return
+        try:
+            result = renderer.render(**message)
+        except Exception as e:
+            detail = traceback.format_exception_only(type(e), e)[-1].strip()
+            conn.send(('error', detail))
+        else:
+            conn.send(('ok', result))
@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+"""
+KV render server for the VS Code widget preview.
+
+KivyRenderService starts this script and talks to it over HTTP on
+127.0.0.1:9876:
+
+    GET  /health  200 once a render worker is warm, 503 while starting
+    POST /render  {"code": "<kv>", "mode": "screenshot", "width"?, "height"?, "density"?,
+                   "session"?}
+                  -> {"success": true, "image": "<base64 png>", "cache": ..., ...}
+                  or {"success": false, "error": "..."}
+                  With "format": "frame" (plus "encodings"?, "base"?, "id"?) the
+                  response is a binary frame instead (see frames.py)
+    GET  /frames  WebSocket: the same JSON requests as text messages, answered
+                  with binary frames, deltas against the previous frame sent
+
+Renders run on a RenderPool of pre-initialised Kivy processes, so only the
+first request after startup waits for Kivy to load. Results are kept in a
+RenderCache shared by all clients; identical concurrent requests share one
+render. Requests naming a `session` (e.g. the document URI) are rendered
+incrementally against that session's previous tree. Without a display
+(CI, SSH, containers) run it under Xvfb: `xvfb-run -a python3 server.py`.
+"""
+
+import argparse
+import base64
+import json
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import frames
+import ws
+from render_cache import RenderCache, normalize_source, render_key
+from render_pool import PoolUnavailable, RenderError, RenderPool
+
+DEFAULT_PORT = 9876
+
+# Largest KV source accepted by /render
+MAX_BODY = 1024 * 1024
+
+MAX_SIZE = 4096
+
+MAX_DENSITY = 8.0
+
+MAX_SESSION_LENGTH = 512
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'doctor-kivy'
+
+    def do_GET(self):
+        if self.path == '/health':
+            stats = self.server.pool.stats()
+            status = 200 if stats['ready'] else 503
+            self._send_json(status, {
+                'status': 'ok' if stats['ready'] else 'starting',
+                'pool': stats,
+                'cache': self.server.cache.stats(),
+                'encodings': frames.available_encodings(),
+            })
+        elif self.path == '/frames':
+            if not ws.is_upgrade(self.headers):
+                self._send_json(400, {'success': False, 'error': '/frames expects a WebSocket upgrade'})
+                return
+            self._serve_frames()
+        else:
+            self._send_json(404, {'success': False, 'error': f"no such endpoint: {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/render':
+            self._send_json(404, {'success': False, 'error': f"no such endpoint: {self.path}"})
+            return
+        try:
+            request = self._parse(self._read_json())
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json(400, {'success': False, 'error': f"bad request: {e}"})
+            return
+
+        started = time.perf_counter()
+        try:
+            result, cache, key = self._render(request)
+        except PoolUnavailable as e:
+            self._send_json(503, {'success': False, 'error': str(e)})
+            return
+        except RenderError as e:
+            # Errors in the user's KV are results, not server failures
+            self._send_json(200, {'success': False, 'error': str(e)})
+            return
+
+        if request['format'] == 'frame':
+            body = self._frame(request, result, cache, request['base'])
+            self.send_response(200)
+            self.send_header('Content-Type', frames.CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.send_header('X-Render-Key', key)
+            self.send_header('X-Cache', cache)
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        response = dict(result, image=base64.b64encode(result['image']).decode('ascii'))
+        response.update(success=True, key=key, cache=cache,
+                        total_ms=round((time.perf_counter() - started) * 1000, 2))
+        self._send_json(200, response)
+
+    def _parse(self, request):
+        """Validate a render request (a decoded JSON object) and fill in defaults."""
+        pool = self.server.pool
+        code = request['code']
+        if not isinstance(code, str):
+            raise ValueError("'code' must be a string")
+        if request.get('mode', 'screenshot') != 'screenshot':
+            raise ValueError(f"unsupported mode {request['mode']!r}")
+        output_format = request.get('format', 'png')
+        if output_format not in ('png', 'frame'):
+            raise ValueError(f"unsupported format {output_format!r}")
+        density = float(request.get('density') or pool.density)
+        if not 0 < density <= MAX_DENSITY:
+            raise ValueError(f"density must be between 0 and {MAX_DENSITY:g}")
+        session = request.get('session')
+        if session is not None and not (isinstance(session, str) and len(session) <= MAX_SESSION_LENGTH):
+            raise ValueError(f"'session' must be a string of at most {MAX_SESSION_LENGTH} characters")
+        encodings = request.get('encodings')
+        if encodings is not None and not (isinstance(encodings, list) and all(isinstance(e, str) for e in encodings)):
+            raise ValueError("'encodings' must be a list of strings")
+        return {
+            'code': code,
+            'width': self._size(request, 'width') or pool.width,
+            'height': self._size(request, 'height') or pool.height,
+            'density': density,
+            'session': session,
+            'format': output_format,
+            'encodings': encodings,
+            'base': int(request.get('base') or 0),
+            'id': int(request.get('id') or 0),
+        }
+
+    def _render(self, request):
+        """Render through the cache; returns (result, cache source, key)."""
+        output = 'rgba' if request['format'] == 'frame' else 'png'
+        source = normalize_source(request['code'])
+        width, height, density = request['width'], request['height'], request['density']
+        key = render_key(source, width, height, density, output)
+        result, cache = self.server.cache.get_or_render(
+            key, lambda: self.server.pool.render(source, width, height, density, session=request['session'],
+                                                 output=output, timeout=self.server.render_timeout))
+        return result, cache, key
+
+    def _frame(self, request, result, cache, base_seq):
+        """Encode an RGBA result as a binary frame, a delta when the client has `base_seq`."""
+        session = request['session']
+        store = self.server.frames
+        base = store.get(session, base_seq) if session and base_seq else None
+        seq = store.add(session, result['image']) if session else 0
+        return frames.encode_frame(
+            result['image'], result['width'], result['height'], seq,
+            base=base, base_seq=base_seq, accepted=request['encodings'], request_id=request['id'],
+            render_us=int(result['render_ms'] * 1000), cached=cache in ('memory', 'disk'),
+        )
+
+    def _serve_frames(self):
+        """
+        Render requests arriving on a WebSocket, answered with binary
+        frames. Each frame is a delta against the last one this connection
+        sent for the session, unless the request names another `base`.
+        A request superseded by a newer one for the same session before
+        its render started is answered with {"id", "skipped": true}.
+        """
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', ws.accept_key(self.headers['Sec-WebSocket-Key']))
+        self.end_headers()
+        self.close_connection = True
+
+        socket = ws.WebSocket(self.rfile, self.wfile, max_message=MAX_BODY)
+        inbox = queue.Queue()
+
+        def read():
+            while True:
+                message = socket.recv()
+                inbox.put(message)
+                if message is None:
+                    return
+
+        threading.Thread(target=read, daemon=True, name='doctor-kivy-ws-reader').start()
+        sent = {}
+        while True:
+            batch = [inbox.get()]
+            while True:
+                try:
+                    batch.append(inbox.get_nowait())
+                except queue.Empty:
+                    break
+            latest = {}
+            for message in batch:
+                if message is None:
+                    break
+                try:
+                    request = json.loads(message[1])
+                    if not isinstance(request, dict):
+                        raise ValueError('expected a JSON object')
+                    request = self._parse(request)
+                except (KeyError, TypeError, ValueError) as e:
+                    self._send_ws(socket, {'success': False, 'error': f"bad request: {e}"})
+                    continue
+                slot = request['session'] or object()
+                if slot in latest:
+                    self._send_ws(socket, {'id': latest[slot]['id'], 'skipped': True})
+                latest[slot] = request
+            try:
+                for request in latest.values():
+                    self._send_frame(socket, request, sent)
+            except (EOFError, OSError):
+                return
+            if None in batch or socket.closed:
+                return
+
+    def _send_frame(self, socket, request, sent):
+        try:
+            result, cache, key = self._render(dict(request, format='frame'))
+        except RenderError as e:
+            self._send_ws(socket, {'id': request['id'], 'success': False, 'error': str(e)})
+            return
+        session = request['session']
+        base_seq = request['base'] or sent.get(session, 0)
+        body = self._frame(request, result, cache, base_seq)
+        if session:
+            sent[session] = frames.HEADER.unpack_from(body)[9]
+        socket.send(ws.OP_BINARY, body)
+
+    @staticmethod
+    def _send_ws(socket, payload):
+        socket.send(ws.OP_TEXT, json.dumps(payload))
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length > MAX_BODY:
+            raise ValueError(f"body larger than {MAX_BODY} bytes")
+        body = self.rfile.read(length)
+        request = json.loads(body or b'{}')
+        if not isinstance(request, dict):
+            raise ValueError('expected a JSON object')
+        return request
+
+    @staticmethod
+    def _size(request, name):
+        value = request.get(name)
+        if value is None:
+            return None
+        value = int(value)
+        if not 0 < value <= MAX_SIZE:
+            raise ValueError(f"{name} must be between 1 and {MAX_SIZE}")
+        return value
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class RenderServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, pool, cache, render_timeout=30.0, verbose=False):
+        super().__init__(address, RenderHandler)
+        self.pool = pool
+        self.cache = cache
+        self.render_timeout = render_timeout
+        self.verbose = verbose
+        self.frames = frames.FrameStore()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('DOCTOR_KIVY_PORT', DEFAULT_PORT)))
+    parser.add_argument('--workers', type=int, default=min(4, max(1, (os.cpu_count() or 2) // 2)),
+                        help='warm Kivy processes rendering in parallel')
+    parser.add_argument('--width', type=int, default=800, help='default render width')
+    parser.add_argument('--height', type=int, default=600, help='default render height')
+    parser.add_argument('--density', type=float, default=1.0, help='default Kivy density (dp/sp scale)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds per render before the worker is killed')
+    parser.add_argument('--max-renders', type=int, default=500,
+                        help='renders before a worker is replaced (0 = never)')
+    parser.add_argument('--cache-mb', type=float, default=64, help='memory for cached renders')
+    parser.add_argument('--cache-dir', default='', help='spill evicted renders here, kept across restarts')
+    parser.add_argument('--cache-disk-mb', type=float, default=256, help='size limit of --cache-dir')
+    parser.add_argument('--verbose', action='store_true', help='log every request')
+    args = parser.parse_args(argv)
+
+    pool = RenderPool(size=args.workers, width=args.width, height=args.height, density=args.density,
+                      max_renders=args.max_renders)
+    cache = RenderCache(max_bytes=int(args.cache_mb * 1024 * 1024), spill_dir=args.cache_dir or None,
+                        max_spill_bytes=int(args.cache_disk_mb * 1024 * 1024))
+    server = RenderServer((args.host, args.port), pool, cache, render_timeout=args.timeout, verbose=args.verbose)
+    # The extension stops us with SIGTERM: leave through the finally below
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    pool.start()
+    print(f"doctor-kivy: Listening on http://{args.host}:{server.server_address[1]} "
+          f"with {pool.size} render worker(s)", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        pool.close()
+        cache.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+"""
+Minimal server side of RFC 6455 WebSockets, enough for the /frames stream:
+handshake, masked client frames, fragmented messages, ping/pong and close.
+No extensions (permessage-deflate would only recompress our frames).
+"""
+
+import base64
+import hashlib
+import struct
+import threading
+
+GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+CLOSE_NORMAL = 1000
+CLOSE_PROTOCOL_ERROR = 1002
+CLOSE_TOO_BIG = 1009
+
+
+class ProtocolError(Exception):
+    def __init__(self, message, code=CLOSE_PROTOCOL_ERROR):
+        super().__init__(message)
+        self.code = code
+
+
+def accept_key(key):
+    """Sec-WebSocket-Accept for a client's Sec-WebSocket-Key."""
+    return base64.b64encode(hashlib.sha1((key + GUID).encode('ascii')).digest()).decode('ascii')
+
+
+def is_upgrade(headers):
+    return ('websocket' in headers.get('Upgrade', '').lower()
+            and 'upgrade' in headers.get('Connection', '').lower()
+            and bool(headers.get('Sec-WebSocket-Key')))
+
+
+class WebSocket:
+    """One accepted connection over a handler's rfile/wfile. send() is thread-safe."""
+
+    def __init__(self, rfile, wfile, max_message=1024 * 1024):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.max_message = max_message
+        self.closed = False
+        self._send_lock = threading.Lock()
+
+    def _read(self, size):
+        data = self.rfile.read(size)
+        if len(data) != size:
+            raise EOFError
+        return data
+
+    def _read_frame(self):
+        first, second = self._read(2)
+        fin, opcode = bool(first & 0x80), first & 0x0F
+        if first & 0x70:
+            raise ProtocolError('unexpected reserved bits')
+        if not second & 0x80:
+            raise ProtocolError('client frames must be masked')
+        length = second & 0x7F
+        if length == 126:
+            length, = struct.unpack('>H', self._read(2))
+        elif length == 127:
+            length, = struct.unpack('>Q', self._read(8))
+        if opcode >= OP_CLOSE and (length > 125 or not fin):
+            raise ProtocolError('bad control frame')
+        if length > self.max_message:
+            raise ProtocolError('message too big', CLOSE_TOO_BIG)
+        mask = self._read(4)
+        payload = self._read(length)
+        # XOR with the repeated mask, as one big integer operation
+        key = (mask * (length // 4 + 1))[:length]
+        payload = (int.from_bytes(payload, 'big') ^ int.from_bytes(key, 'big')).to_bytes(length, 'big')
+        return fin, opcode, payload
+
+    def recv(self):
+        """
+        Next data message as (opcode, payload), answering pings on the way;
+        None once the connection is closed.
+        """
+        message_opcode, parts, size = None, [], 0
+        while not self.closed:
+            try:
+                fin, opcode, payload = self._read_frame()
+            except (EOFError, OSError):
+                self.closed = True
+                return None
+            except ProtocolError as e:
+                self.close(e.code, str(e))
+                return None
+            if opcode == OP_PING:
+                self.send(OP_PONG, payload)
+            elif opcode == OP_PONG:
+                pass
+            elif opcode == OP_CLOSE:
+                code = struct.unpack('>H', payload[:2])[0] if len(payload) >= 2 else CLOSE_NORMAL
+                self.close(code)
+                return None
+            elif opcode not in (OP_CONTINUATION, OP_TEXT, OP_BINARY):
+                self.close(CLOSE_PROTOCOL_ERROR, 'unknown opcode')
+                return None
+            else:
+                if (opcode == OP_CONTINUATION) != (message_opcode is not None):
+                    self.close(CLOSE_PROTOCOL_ERROR, 'bad fragmentation')
+                    return None
+                if message_opcode is None:
+                    message_opcode = opcode
+                parts.append(payload)
+                size += len(payload)
+                if size > self.max_message:
+                    self.close(CLOSE_TOO_BIG, 'message too big')
+                    return None
+                if fin:
+                    return message_opcode, b''.join(parts)
+        return None
+
+    def send(self, opcode, payload):
+        if isinstance(payload, str):
+            payload = payload.encode('utf-8')
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('>BB', 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+        with self._send_lock:
+            if self.closed and opcode != OP_CLOSE:
+                raise EOFError('connection closed')
+            # One write: a separate small header write stalls on Nagle's algorithm
+            self.wfile.write(header + payload)
+            self.wfile.flush()
+
+    def close(self, code=CLOSE_NORMAL, reason=''):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            self.send(OP_CLOSE, struct.pack('>H', code) + reason.encode('utf-8')[:120])
+        except OSError:
+            pass
@@ -1 +1,6 @@
-from .app import main
\ No newline at end of file
+def main():
+    # Imported on call, so `import kvtestsone.kv_cache` or the delta_sync
+    # sender don't start Kivy and kivy_reloader
+    from .app import main
+
+    main()
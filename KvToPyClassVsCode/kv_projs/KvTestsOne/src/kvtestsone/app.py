@@ -1,9 +1,7 @@
-import trio
-from kivy.lang import Builder
 from kivy_reloader.app import App
 from os.path import dirname, join
 
-from kivy.uix.boxlayout import BoxLayout
+from .kv_cache import load_file
 
 kv = """
 Button:
@@ -17,7 +15,15 @@ StackLayout:
 
 class MyApp(App):
     def build(self):
-        return Builder.load_file(join(dirname(__file__), "my.kv"))
+        return load_file(join(dirname(__file__), "my.kv"))
+
+    def on_start(self):
+        # Imported here: only a dev build with delta sync turned on uses it
+        from . import delta_sync
+
+        config = delta_sync.load_config()
+        if delta_sync.enabled(config):
+            self.delta_sync = delta_sync.serve(self, config=config)
 
 
 
@@ -0,0 +1,788 @@
+"""
+Delta hot-reload sync: push only what changed to the app on the device.
+
+kivy-reloader zips the changed files on every save and opens a new
+connection to the device (RELOADER_PORT) without knowing what is there.
+This keeps one connection per device open instead and:
+
+- compares content-hash manifests of both sides (the device sends its own
+  on connect, the desktop keeps it up to date after each push), so only
+  files the device doesn't have are sent;
+- sends rsync-style block deltas for large files: the device sends block
+  signatures of its copy (rolling Adler-32 + blake2b), the desktop answers
+  with copy-block / literal instructions;
+- batches every change of a save into one zlib-compressed message;
+- classifies the batch: a change to FULL_RELOAD_FILES or main.py restarts
+  the app, SERVICE_FILES go through reload_app() so the service is
+  stopped first, and anything else is a module/KV reload through the
+  reloader app's own reload_app().
+
+Device side, from the app, only when enabled (KV_DELTA_SYNC=1, or
+DELTA_SYNC = true in kivy-reloader.toml; keep it off in release builds):
+
+    if delta_sync.enabled(config):
+        delta_sync.serve(app)
+
+The device listens on 127.0.0.1 only, reached through `adb forward`. To
+push over Wi-Fi (PHONE_IPS), set DELTA_SYNC_HOST = "0.0.0.0" and a
+DELTA_SYNC_TOKEN (or KV_DELTA_SYNC_TOKEN) on both sides: the server won't
+listen beyond loopback without one. Each connection proves it knows the
+token by an HMAC of a fresh challenge, so the token never crosses the
+network. Paths from the desktop that would leave the app's directory
+(absolute, `..`, symlinks out) are refused.
+
+Desktop side, from the project directory (where kivy-reloader.toml is):
+
+    python src/kvtestsone/delta_sync.py watch    # push on every save
+    python src/kvtestsone/delta_sync.py push     # push once
+    python src/kvtestsone/delta_sync.py bench    # bytes sent vs whole files
+
+Targets are --host, else PHONE_IPS, else (STREAM_USING = "USB") an
+`adb forward` of the port to 127.0.0.1. The port is DELTA_SYNC_PORT from
+the toml, default RELOADER_PORT + 1 (8051).
+
+Wire format: each message is a 4-byte header length, a 4-byte body length,
+a JSON header with a "type" and an optional binary body.
+"""
+
+import fnmatch
+import hashlib
+import hmac
+import ipaddress
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import threading
+import time
+import zlib
+
+PROTOCOL = 1
+DEFAULT_PORT = 8051
+
+# Files below this size are always sent whole
+DELTA_MIN_SIZE = 32 * 1024
+# A delta larger than this share of the file is not worth it
+DELTA_MAX_RATIO = 0.5
+COMPRESS_LEVEL = 6
+# Seconds a new connection has to answer the challenge
+AUTH_TIMEOUT = 10.0
+
+# Same defaults kivy-reloader keeps off the phone
+DEFAULT_EXCLUDES = (
+    '.DS_Store', '.buildozer', '.dmypy.json', '.env', '.git', '.github', '.gitignore', '.ipynb_checkpoints',
+    '.mypy_cache', '.nomedia', '.pytest_cache', '.python-version', '.venv', '.vscode', '*.bak', '*.db',
+    '*.egg-info', '*.log', '*.npy', '*.orig', '*.pyc', '*.sqlite', 'ENV', 'README.md', '_python_bundle',
+    'app_copy.zip', 'bin', 'build', 'buildozer.spec', 'coverage', 'dist', 'dmypy.json', 'docs', 'env',
+    'env.bak', 'examples', 'htmlcov', 'node_modules', 'poetry.lock', 'private.version', 'pyproject.toml',
+    'screenshots', 'temp', 'tests', 'uv.lock', 'venv', 'venv.bak', '__pycache__',
+    # Device-side files that aren't part of the project
+    '.kivy', 'libpybundle.version', 'p4a_env_vars.txt', '_delta_metadata.json', '.kivy_reloader_state.json',
+    '*.sync-tmp',
+)
+
+HEADER = struct.Struct('>II')
+SIGNATURE = struct.Struct('>I8s')
+COPY = struct.Struct('>cII')
+LITERAL = struct.Struct('>cI')
+
+
+def _log(message):
+    print(f'delta_sync: {message}', flush=True)
+
+
+# -- Config ----------------------------------------------------------------
+
+def load_config(path='kivy-reloader.toml'):
+    """The [kivy_reloader] table of kivy-reloader.toml ({} if missing)."""
+    try:
+        import tomllib
+    except ImportError:  # pragma: no cover - Python < 3.11
+        return {}
+    try:
+        with open(path, 'rb') as f:
+            return tomllib.load(f).get('kivy_reloader', {})
+    except (OSError, ValueError):
+        return {}
+
+
+def enabled(config):
+    """Whether the device side should run: KV_DELTA_SYNC, else DELTA_SYNC in the toml (default off)."""
+    flag = os.environ.get('KV_DELTA_SYNC')
+    if flag is not None:
+        return flag == '1'
+    return config.get('DELTA_SYNC') is True
+
+
+def sync_token(config):
+    return os.environ.get('KV_DELTA_SYNC_TOKEN') or config.get('DELTA_SYNC_TOKEN') or None
+
+
+def _is_loopback(host):
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _proof(token, nonce):
+    return hmac.new(token.encode(), bytes.fromhex(nonce), hashlib.sha256).hexdigest()
+
+
+def sync_port(config):
+    if 'DELTA_SYNC_PORT' in config:
+        return int(config['DELTA_SYNC_PORT'])
+    return int(config['RELOADER_PORT']) + 1 if 'RELOADER_PORT' in config else DEFAULT_PORT
+
+
+# -- Manifests -------------------------------------------------------------
+
+def file_digest(data):
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def excluded(path, patterns):
+    """Whether a relative path, or any folder on it, matches an exclude pattern."""
+    parts = path.split('/')
+    return any(fnmatch.fnmatch(path, pattern) or any(fnmatch.fnmatch(part, pattern) for part in parts)
+               for pattern in patterns)
+
+
+class Manifest:
+    """
+    Relative path -> content hash of the files under a root. Hashes are
+    only recomputed for files whose size or mtime changed since last scan.
+    """
+
+    def __init__(self, root, excludes=DEFAULT_EXCLUDES):
+        self.root = os.path.abspath(root)
+        self._real_root = os.path.realpath(self.root)
+        self.excludes = tuple(excludes)
+        self.files = {}   # path -> digest
+        self._stat = {}   # path -> (size, mtime_ns)
+
+    def scan(self):
+        files, stat = {}, {}
+        for folder, dirs, names in os.walk(self.root):
+            relative = os.path.relpath(folder, self.root).replace(os.sep, '/')
+            prefix = '' if relative == '.' else relative + '/'
+            dirs[:] = [d for d in dirs if not excluded(prefix + d, self.excludes)]
+            for name in names:
+                path = prefix + name
+                if excluded(path, self.excludes):
+                    continue
+                try:
+                    info = os.stat(os.path.join(folder, name))
+                except OSError:
+                    continue
+                key = (info.st_size, info.st_mtime_ns)
+                digest = self.files.get(path) if self._stat.get(path) == key else None
+                if digest is None:
+                    try:
+                        digest = file_digest(self.read(path))
+                    except (OSError, ValueError):
+                        # Unreadable, or a symlink out of the root
+                        continue
+                files[path], stat[path] = digest, key
+        self.files, self._stat = files, stat
+        return files
+
+    def resolve(self, path):
+        """
+        Absolute path of a relative manifest path. ValueError for anything
+        that would land outside the root: absolute paths, `..`, symlinks out.
+        """
+        if not isinstance(path, str):
+            raise ValueError(f'unsafe path {path!r}')
+        parts = path.split('/')
+        if (os.path.isabs(path) or '\\' in path or '\0' in path or os.path.splitdrive(path)[0]
+                or any(part in ('', '.', '..') for part in parts)):
+            raise ValueError(f'unsafe path {path!r}')
+        target = os.path.join(self.root, *parts)
+        real = os.path.realpath(target)
+        if not real.startswith(self._real_root + os.sep):
+            raise ValueError(f'path {path!r} leaves the sync root')
+        return target
+
+    def read(self, path):
+        with open(self.resolve(path), 'rb') as f:
+            return f.read()
+
+    def size(self, path):
+        return self._stat.get(path, (0, 0))[0]
+
+
+# -- Block deltas (rsync) --------------------------------------------------
+
+def block_size(size):
+    """About sqrt(size), between 1 KiB and 16 KiB, as rsync picks it."""
+    block = 1024
+    while block * block < size and block < 16384:
+        block *= 2
+    return block
+
+
+def _weak(block):
+    # Adler-32 is the rsync rolling checksum (mod 65521), computed in C
+    return zlib.adler32(block)
+
+
+def _strong(block):
+    return hashlib.blake2b(block, digest_size=8).digest()
+
+
+def signatures(data, block):
+    """Weak and strong checksums of each whole block of `data`."""
+    return b''.join(SIGNATURE.pack(_weak(data[i:i + block]), _strong(data[i:i + block]))
+                    for i in range(0, len(data) - block + 1, block))
+
+
+def delta(data, sigs, block):
+    """
+    Instructions rebuilding `data` from the file `sigs` describes: copies
+    of its blocks and literal bytes. None when most of it would be literal.
+    """
+    table = {}
+    for index in range(len(sigs) // SIGNATURE.size):
+        weak, strong = SIGNATURE.unpack_from(sigs, index * SIGNATURE.size)
+        table.setdefault(weak, []).append((index, strong))
+    budget = int(len(data) * DELTA_MAX_RATIO)
+    ops, literal = [], 0
+    n, i, start = len(data), 0, 0
+    run = None  # [first block, count] of the copy being extended
+
+    def flush_literal(end):
+        nonlocal literal, run
+        if end > start:
+            if run:
+                ops.append(COPY.pack(b'C', *run))
+                run = None
+            ops.append(LITERAL.pack(b'L', end - start) + data[start:end])
+            literal += end - start
+
+    weak = _weak(data[:block]) if n >= block else 0
+    while i + block <= n:
+        candidates = table.get(weak)
+        if candidates:
+            strong = _strong(data[i:i + block])
+            match = next((index for index, digest in candidates if digest == strong), None)
+            if match is not None:
+                flush_literal(i)
+                if run and run[0] + run[1] == match:
+                    run[1] += 1
+                else:
+                    if run:
+                        ops.append(COPY.pack(b'C', *run))
+                    run = [match, 1]
+                i += block
+                start = i
+                weak = _weak(data[i:i + block])
+                continue
+        if i + block < n:
+            # Slide the window one byte: drop data[i], take data[i + block]
+            a, b = weak & 0xffff, weak >> 16
+            out, new = data[i], data[i + block]
+            a = (a - out + new) % 65521
+            b = (b - block * out + a - 1) % 65521
+            weak = a | (b << 16)
+        i += 1
+        if literal + i - start > budget:
+            return None
+    flush_literal(n)
+    if run:
+        ops.append(COPY.pack(b'C', *run))
+    return b''.join(ops) if literal <= budget else None
+
+
+def patch(base, ops, block):
+    """Apply delta() instructions to `base`."""
+    out, i = [], 0
+    while i < len(ops):
+        if ops[i:i + 1] == b'C':
+            _, first, count = COPY.unpack_from(ops, i)
+            out.append(base[first * block:(first + count) * block])
+            i += COPY.size
+        else:
+            _, length = LITERAL.unpack_from(ops, i)
+            i += LITERAL.size
+            out.append(ops[i:i + length])
+            i += length
+    return b''.join(out)
+
+
+# -- Wire ------------------------------------------------------------------
+
+def send_message(sock, header, body=b''):
+    data = json.dumps(header, separators=(',', ':')).encode()
+    # One write, so the header and body don't wait on each other (Nagle)
+    sock.sendall(HEADER.pack(len(data), len(body)) + data + body)
+
+
+def _recv_exactly(sock, size):
+    chunks, remaining = [], size
+    while remaining:
+        chunk = sock.recv(min(remaining, 1 << 20))
+        if not chunk:
+            raise ConnectionError('connection closed')
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    return b''.join(chunks)
+
+
+def recv_message(sock):
+    header_size, body_size = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+    header = json.loads(_recv_exactly(sock, header_size))
+    return header, _recv_exactly(sock, body_size) if body_size else b''
+
+
+# -- Classification --------------------------------------------------------
+
+def classify(changed, deleted, config):
+    """
+    What the app must do after a batch: 'restart' for FULL_RELOAD_FILES or
+    main.py, 'service' for SERVICE_FILES (kivy-reloader stops the service
+    before restarting), else 'reload' with the modules and KV files that
+    changed, or 'none'.
+    """
+    def normalized(key):
+        return {path.replace(os.sep, '/').removeprefix('./') for path in config.get(key, [])}
+
+    paths = sorted(set(changed) | set(deleted))
+    restart = [path for path in paths if path in normalized('FULL_RELOAD_FILES') | {'main.py'}]
+    if restart:
+        return {'action': 'restart', 'because': restart}
+    services = [path for path in paths if path in normalized('SERVICE_FILES')]
+    if services:
+        return {'action': 'service', 'because': services}
+    modules = []
+    for path in paths:
+        if path.endswith('.py'):
+            parts = path[:-3].split('/')
+            if parts[0] == 'src':
+                parts = parts[1:]
+            if parts[-1] == '__init__':
+                parts = parts[:-1]
+            if parts:
+                modules.append('.'.join(parts))
+    kv = [path for path in paths if path.endswith('.kv')]
+    return {'action': 'reload' if paths else 'none', 'modules': modules, 'kv': kv}
+
+
+# -- Device side -----------------------------------------------------------
+
+class SyncServer(threading.Thread):
+    """
+    Applies pushed batches to `root` and hands each applied batch to
+    `on_applied(result)` (called on the server thread). Listens on loopback
+    unless given a token; with a token, clients must prove they know it.
+    """
+
+    def __init__(self, root, port, on_applied, host='127.0.0.1', token=None):
+        super().__init__(name='delta-sync', daemon=True)
+        if not token and not _is_loopback(host):
+            raise ValueError(f'a DELTA_SYNC_TOKEN is required to listen on {host}')
+        self.root = os.path.abspath(root)
+        self.on_applied = on_applied
+        self.token = token
+        self.manifest = Manifest(self.root)
+        # One thread per connection; batches are applied one at a time
+        self.lock = threading.Lock()
+        self.listener = socket.create_server((host, port))
+        self.port = self.listener.getsockname()[1]
+
+    def run(self):
+        while True:
+            try:
+                sock, address = self.listener.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._connection, args=(sock, address), daemon=True,
+                             name='delta-sync-client').start()
+
+    def _connection(self, sock, address):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            self._serve(sock)
+        except (ConnectionError, OSError, ValueError, KeyError, TypeError, zlib.error) as error:
+            _log(f'{address[0]} disconnected: {error}')
+        finally:
+            sock.close()
+
+    def close(self):
+        self.listener.close()
+
+    def _authenticate(self, sock):
+        """Challenge the client; its hello must carry the HMAC of the nonce with the token."""
+        nonce = os.urandom(16).hex()
+        sock.settimeout(AUTH_TIMEOUT)
+        send_message(sock, {'type': 'challenge', 'protocol': PROTOCOL, 'nonce': nonce})
+        header, _ = recv_message(sock)
+        sock.settimeout(None)
+        if header.get('type') != 'hello':
+            raise ValueError('expected hello')
+        if self.token and not hmac.compare_digest(str(header.get('proof', '')), _proof(self.token, nonce)):
+            raise ValueError('authentication failed')
+        return header
+
+    def _serve(self, sock):
+        hello = self._authenticate(sock)
+        with self.lock:
+            if hello.get('excludes'):
+                self.manifest.excludes = tuple(hello['excludes'])
+            files = self.manifest.scan()
+        send_message(sock, {'type': 'manifest', 'protocol': PROTOCOL, 'files': files})
+        while True:
+            header, body = recv_message(sock)
+            kind = header.get('type')
+            if kind == 'signatures':
+                sigs, blocks = [], {}
+                for path, block in header['files'].items():
+                    try:
+                        if not 1 <= int(block) <= 1 << 20:
+                            raise ValueError(f'bad block size {block!r}')
+                        sigs.append(signatures(self.manifest.read(path), int(block)))
+                        blocks[path] = len(sigs[-1])
+                    except (OSError, ValueError):
+                        blocks[path] = 0
+                send_message(sock, {'type': 'signatures', 'sizes': blocks}, b''.join(sigs))
+            elif kind == 'push':
+                with self.lock:
+                    result = self.apply(header, zlib.decompress(body) if body else b'')
+                send_message(sock, dict(result, type='applied'))
+                if result['applied'] or result['deleted']:
+                    self.on_applied(result)
+            else:
+                raise ValueError(f'unexpected message {kind!r}')
+
+    def apply(self, header, body):
+        """
+        Write every file of a batch (whole or patched), verified against its
+        hash. Paths outside the root are rejected, not written.
+        """
+        applied, failed, deleted, rejected = [], [], [], []
+        for entry in header.get('files', ()):
+            path = entry['path']
+            try:
+                target = self.manifest.resolve(path)
+            except ValueError:
+                rejected.append(path)
+                continue
+            data = body[entry['offset']:entry['offset'] + entry['length']]
+            try:
+                if entry['op'] == 'delta':
+                    data = patch(self.manifest.read(path), data, entry['block'])
+                if file_digest(data) != entry['digest']:
+                    failed.append(path)
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                tmp = target + '.sync-tmp'
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp, target)
+                applied.append(path)
+            except OSError:
+                failed.append(path)
+        for path in header.get('deleted', ()):
+            try:
+                os.remove(self.manifest.resolve(path))
+                deleted.append(path)
+            except ValueError:
+                rejected.append(path)
+            except FileNotFoundError:
+                deleted.append(path)
+            except OSError:
+                failed.append(path)
+        self.manifest.scan()
+        if rejected:
+            _log(f'rejected paths outside {self.root}: {rejected}')
+        return {'applied': applied, 'deleted': deleted, 'failed': failed, 'rejected': rejected,
+                'action': header.get('action', {})}
+
+
+def serve(app, root=None, config=None):
+    """
+    Start the device side for a kivy-reloader app: apply pushes in the
+    background, then restart or reload the app on the Kivy thread.
+    Returns None unless enabled() (it is off by default).
+    """
+    from kivy.clock import Clock
+    from kivy.logger import Logger
+
+    root = root or os.getcwd()
+    if config is None:
+        config = load_config(os.path.join(root, 'kivy-reloader.toml'))
+    if not enabled(config):
+        return None
+
+    def reload(result):
+        action = result['action'].get('action')
+        Logger.info(f"DeltaSync: {len(result['applied'])} updated, {len(result['deleted'])} deleted, "
+                    f"{len(result['failed'])} failed -> {action}")
+        if action == 'restart' and hasattr(app, 'restart_app_on_android'):
+            app.restart_app_on_android()
+        elif action in ('reload', 'service', 'restart') and hasattr(app, 'reload_app'):
+            # reload_app() rechecks the files it restarts for, and stops
+            # changed services first
+            app.reload_app()
+
+    host = config.get('DELTA_SYNC_HOST', '127.0.0.1')
+    try:
+        server = SyncServer(root, sync_port(config), lambda result: Clock.schedule_once(lambda dt: reload(result)),
+                            host=host, token=sync_token(config))
+    except (OSError, ValueError) as error:
+        Logger.warning(f'DeltaSync: not started: {error}')
+        return None
+    server.start()
+    Logger.info(f'DeltaSync: listening on {host}:{server.port}, root {root}')
+    return server
+
+
+# -- Desktop side ----------------------------------------------------------
+
+class SyncClient:
+    """One persistent connection to a device, and what that device has."""
+
+    def __init__(self, host, port, manifest, config):
+        self.address = (host, port)
+        self.manifest = manifest
+        self.config = config
+        self.token = sync_token(config)
+        self.sock = None
+        self.remote = {}
+        self.stats = {'pushes': 0, 'files': 0, 'raw_bytes': 0, 'sent_bytes': 0}
+
+    def connect(self):
+        self.sock = socket.create_connection(self.address, timeout=10)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        challenge, _ = recv_message(self.sock)
+        hello = {'type': 'hello', 'protocol': PROTOCOL, 'excludes': list(self.manifest.excludes)}
+        if self.token:
+            hello['proof'] = _proof(self.token, challenge['nonce'])
+        send_message(self.sock, hello)
+        header, _ = recv_message(self.sock)
+        self.remote = header['files']
+        _log(f'connected to {self.address[0]}:{self.address[1]}, device has {len(self.remote)} files')
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def push(self):
+        """Send what changed since the device's manifest; returns the device's result (None if in sync)."""
+        if self.sock is None:
+            self.connect()
+        try:
+            return self._push()
+        except (ConnectionError, OSError, ValueError):
+            # Device restarted or network dropped: reconnect once, starting from its manifest
+            self.close()
+            self.connect()
+            return self._push()
+
+    def _push(self, retry=True):
+        local = self.manifest.scan()
+        changed = [path for path, digest in local.items() if self.remote.get(path) != digest]
+        deleted = [path for path in self.remote if path not in local]
+        if not changed and not deleted:
+            return None
+
+        # Signatures of the device's copy of each large changed file, in one round trip
+        blocks = {path: block_size(self.manifest.size(path)) for path in changed
+                  if path in self.remote and self.manifest.size(path) >= DELTA_MIN_SIZE}
+        sigs = {}
+        if blocks:
+            send_message(self.sock, {'type': 'signatures', 'files': blocks})
+            header, body = recv_message(self.sock)
+            offset = 0
+            for path, size in header['sizes'].items():
+                sigs[path] = body[offset:offset + size]
+                offset += size
+
+        entries, parts, offset, raw = [], [], 0, 0
+        for path in changed:
+            data = self.manifest.read(path)
+            raw += len(data)
+            entry = {'path': path, 'digest': local[path], 'op': 'put'}
+            ops = delta(data, sigs[path], blocks[path]) if sigs.get(path) else None
+            if ops is not None:
+                entry.update(op='delta', block=blocks[path])
+                data = ops
+            entry.update(offset=offset, length=len(data))
+            entries.append(entry)
+            parts.append(data)
+            offset += len(data)
+        body = zlib.compress(b''.join(parts), COMPRESS_LEVEL) if parts else b''
+        action = classify(changed, deleted, self.config)
+        send_message(self.sock, {'type': 'push', 'files': entries, 'deleted': deleted, 'action': action}, body)
+        result, _ = recv_message(self.sock)
+
+        for path in result['applied']:
+            self.remote[path] = local[path]
+        for path in result['deleted']:
+            self.remote.pop(path, None)
+        for path in result['failed']:
+            # Unknown now: sent whole next time
+            self.remote.pop(path, None)
+        self.stats['pushes'] += 1
+        self.stats['files'] += len(entries)
+        self.stats['raw_bytes'] += raw
+        self.stats['sent_bytes'] += len(body)
+        _log(f"{self.address[0]}: {len(result['applied'])} files ({sum(e['op'] == 'delta' for e in entries)} as deltas), "
+             f"{len(result['deleted'])} deleted, {raw} -> {len(body)} bytes, {action['action']}")
+        if result.get('rejected'):
+            _log(f"{self.address[0]}: device refused {result['rejected']}")
+        if result['failed'] and retry:
+            _log(f"{self.address[0]}: failed {result['failed']}, resending whole")
+            return self._push(retry=False)
+        return result
+
+
+def _targets(args, config, port):
+    if args.host:
+        return args.host
+    if config.get('PHONE_IPS'):
+        return list(config['PHONE_IPS'])
+    if config.get('STREAM_USING', 'USB') == 'USB':
+        try:
+            subprocess.run(['adb', 'forward', f'tcp:{port}', f'tcp:{port}'], check=True, capture_output=True)
+        except (OSError, subprocess.CalledProcessError) as error:
+            _log(f'adb forward failed ({error}); pass --host')
+            return []
+        return ['127.0.0.1']
+    return []
+
+
+def _watch(clients, manifest, interval):
+    """Poll for changes and push each settled change to every device."""
+    last = dict(manifest.scan())
+    while True:
+        time.sleep(interval)
+        current = dict(manifest.scan())
+        if current == last:
+            continue
+        # Editors write in several steps: wait until the tree is quiet
+        while True:
+            time.sleep(interval)
+            settled = dict(manifest.scan())
+            if settled == current:
+                break
+            current = settled
+        last = current
+        for client in clients:
+            try:
+                client.push()
+            except (ConnectionError, OSError) as error:
+                _log(f'{client.address[0]}: {error}')
+
+
+def _bench(root, excludes, config):
+    """
+    Bytes a typical edit costs: whole files zipped (what kivy-reloader
+    sends) vs this delta sync, through a local server on a copy of the tree.
+    """
+    import random
+    import shutil
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as scratch:
+        source = os.path.join(scratch, 'desktop')
+        device = os.path.join(scratch, 'device')
+        shutil.copytree(root, source, ignore=lambda folder, names: [
+            name for name in names
+            if excluded(os.path.relpath(os.path.join(folder, name), root).replace(os.sep, '/'), excludes)])
+        shutil.copytree(source, device)
+        asset = os.path.join(source, 'bench_asset.bin')
+        with open(asset, 'wb') as f:
+            f.write(random.Random(0).randbytes(2 * 1024 * 1024))
+        shutil.copy(asset, os.path.join(device, 'bench_asset.bin'))
+
+        server = SyncServer(device, 0, lambda result: None, host='127.0.0.1')
+        server.start()
+        client = SyncClient('127.0.0.1', server.port, Manifest(source, excludes), config)
+        client.connect()
+
+        def edit(label, change):
+            change()
+            touched = [path for path, digest in client.manifest.scan().items() if client.remote.get(path) != digest]
+            whole = sum(len(zlib.compress(client.manifest.read(path), COMPRESS_LEVEL)) for path in touched)
+            started = time.perf_counter()
+            before = client.stats['sent_bytes']
+            client.push()
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f'  {label:<38} whole files {whole:>9} B   delta sync {client.stats["sent_bytes"] - before:>7} B'
+                  f'   {elapsed:6.1f} ms', flush=True)
+
+        def append(path, text):
+            with open(os.path.join(source, path), 'a', encoding='utf-8') as f:
+                f.write(text)
+
+        def poke(path, at, data):
+            with open(os.path.join(source, path), 'r+b') as f:
+                f.seek(at)
+                f.write(data)
+
+        def insert(path, at, data):
+            full = os.path.join(source, path)
+            with open(full, 'rb') as f:
+                content = f.read()
+            with open(full, 'wb') as f:
+                f.write(content[:at] + data + content[at:])
+
+        client.manifest.scan()
+        kv = next((path for path in client.manifest.files if path.endswith('.kv')), None)
+        print(f'{len(client.manifest.files)} files, {sum(client.manifest.size(p) for p in client.manifest.files)} bytes',
+              flush=True)
+        if kv:
+            edit(f'append to {kv}', lambda: append(kv, '\n# edited\n'))
+        edit('overwrite 16 bytes of a 2 MiB asset', lambda: poke('bench_asset.bin', 1_000_000, b'x' * 16))
+        edit('insert 100 bytes into the 2 MiB asset', lambda: insert('bench_asset.bin', 500_000, b'y' * 100))
+        client.close()
+        server.close()
+        mismatched = [path for path, digest in Manifest(source, excludes).scan().items()
+                      if Manifest(device, excludes).scan().get(path) != digest]
+        print(f'  device tree {"matches" if not mismatched else "differs: " + ", ".join(mismatched)}', flush=True)
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('command', choices=('watch', 'push', 'bench'))
+    parser.add_argument('--root', default='.', help='project directory (default: .)')
+    parser.add_argument('--config', help='kivy-reloader.toml (default: ROOT/kivy-reloader.toml)')
+    parser.add_argument('--host', action='append', help='device address, repeatable')
+    parser.add_argument('--port', type=int, help='device port (default: DELTA_SYNC_PORT or RELOADER_PORT + 1)')
+    parser.add_argument('--interval', type=float, default=0.25, help='watch polling interval in seconds')
+    args = parser.parse_args(argv)
+
+    config = load_config(args.config or os.path.join(args.root, 'kivy-reloader.toml'))
+    excludes = DEFAULT_EXCLUDES + tuple(config.get('FOLDERS_AND_FILES_TO_EXCLUDE_FROM_PHONE', []))
+    if args.command == 'bench':
+        _bench(args.root, excludes, config)
+        return 0
+
+    port = args.port or sync_port(config)
+    manifest = Manifest(args.root, excludes)
+    clients = [SyncClient(host, port, manifest, config) for host in _targets(args, config, port)]
+    if not clients:
+        _log('no device to sync with')
+        return 1
+    for client in clients:
+        client.connect()
+    if args.command == 'push':
+        for client in clients:
+            client.push()
+        return 0
+    try:
+        _watch(clients, manifest, args.interval)
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,281 @@
+"""
+Cached Builder.load_file: reuse the parsed and compiled KV rules of a file
+that hasn't changed.
+
+Builder.load_file tokenizes the file, builds the rule tree and compiles
+every property and handler expression on each launch and each hot reload.
+The first time a file is loaded here, the Parser's result is written to
+disk with marshal: the rule tree, the compiled code objects and the
+values of constant expressions. Later loads rebuild the Parser from that
+file and skip all of that work; only the `#:` directives are run again
+(imports, `#:set`, `#:include`), since they act on the running process.
+
+Cache entries are keyed by the file's path and content, the Kivy version
+and the interpreter's bytecode magic number, so an edited file, a Kivy
+upgrade or another Python never sees a stale entry. Everything after
+parsing (rule registration, dynamic classes, building the root widget) is
+Kivy's own Builder.load_string.
+
+    KV_CACHE=0       always parse (the plain Builder.load_file)
+    KV_CACHE_DIR     where entries are stored (default: the app's
+                     user_data_dir/kv_cache, else ~/.cache/kv_cache)
+
+Compare with `python -m kvtestsone.kv_cache [file.kv]`.
+"""
+
+import hashlib
+import importlib.util
+import marshal
+import os
+import sys
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import kivy
+import kivy.lang.builder as kv_builder
+from kivy.lang import Builder
+from kivy.lang.parser import (
+    Parser, ParserRule, ParserRuleProperty, ParserSelectorClass, ParserSelectorName,
+)
+from kivy.logger import Logger
+from kivy.resources import resource_find
+
+# Bump when the entry layout changes
+FORMAT = 1
+
+stats = {'hits': 0, 'misses': 0, 'errors': 0}
+
+
+def cache_dir():
+    path = os.environ.get('KV_CACHE_DIR')
+    if path:
+        return path
+    from kivy.app import App
+    app = App.get_running_app()
+    if app is not None:
+        return os.path.join(app.user_data_dir, 'kv_cache')
+    return os.path.join(os.path.expanduser('~'), '.cache', 'kv_cache')
+
+
+def cache_key(data):
+    digest = hashlib.sha256()
+    for part in (f'{FORMAT}', kivy.__version__, importlib.util.MAGIC_NUMBER.hex()):
+        digest.update(part.encode())
+        digest.update(b'\0')
+    digest.update(data)
+    return digest.hexdigest()[:32]
+
+
+def _entry_prefix(filename):
+    # One entry per source file: same-named files elsewhere keep their own
+    path = hashlib.sha256(os.path.abspath(filename).encode()).hexdigest()[:12]
+    return f'{os.path.basename(filename)}-{path}-'
+
+
+def _entry_path(directory, filename, key):
+    return os.path.join(directory, f'{_entry_prefix(filename)}{key}.kvc')
+
+
+# -- Parser <-> marshal-able tuples -----------------------------------------
+
+def _dump_property(prop):
+    return (prop.line, prop.name, prop.value, prop.co_value, prop.mode, prop.watched_keys, prop.ignore_prev)
+
+
+def _dump_rule(rule):
+    return (
+        rule.line, rule.name, rule.level, rule.id, rule.avoid_previous_rules,
+        [_dump_property(prop) for prop in rule.properties.values()],
+        [_dump_property(prop) for prop in rule.handlers],
+        [_dump_rule(child) for child in rule.children],
+        _dump_rule(rule.canvas_before) if rule.canvas_before else None,
+        _dump_rule(rule.canvas_root) if rule.canvas_root else None,
+        _dump_rule(rule.canvas_after) if rule.canvas_after else None,
+    )
+
+
+def dump_parser(parser):
+    """A parsed file as plain tuples, lists and code objects."""
+    tops, index = [], {}
+
+    def ref(rule):
+        if id(rule) not in index:
+            index[id(rule)] = len(tops)
+            tops.append(_dump_rule(rule))
+        return index[id(rule)]
+
+    rules = [(isinstance(selector, ParserSelectorClass), selector.key, ref(rule))
+             for selector, rule in parser.rules]
+    templates = [(name, cls, ref(rule)) for name, cls, rule in parser.templates]
+    root = ref(parser.root) if parser.root is not None else None
+    return (FORMAT, tops, rules, templates, root, list(parser.directives), dict(parser.dynamic_classes))
+
+
+def _load_property(ctx, data):
+    prop = ParserRuleProperty.__new__(ParserRuleProperty)
+    prop.ctx = ctx
+    prop.line, prop.name, prop.value, prop.co_value, prop.mode, prop.watched_keys, prop.ignore_prev = data
+    prop.count = 0
+    return prop
+
+
+def _load_rule(ctx, data):
+    # Built field by field: ParserRule.__init__ would register the rule
+    # with the parser again
+    rule = ParserRule.__new__(ParserRule)
+    (rule.line, rule.name, rule.level, rule.id, rule.avoid_previous_rules,
+     properties, handlers, children, before, canvas, after) = data
+    rule.ctx = ctx
+    rule.properties = OrderedDict((prop[1], _load_property(ctx, prop)) for prop in properties)
+    rule.handlers = [_load_property(ctx, prop) for prop in handlers]
+    rule.children = [_load_rule(ctx, child) for child in children]
+    rule.canvas_before = _load_rule(ctx, before) if before else None
+    rule.canvas_root = _load_rule(ctx, canvas) if canvas else None
+    rule.canvas_after = _load_rule(ctx, after) if after else None
+    rule.cache_marked = []
+    return rule
+
+
+def load_parser(data, content, filename):
+    """Rebuild the Parser dump_parser() saved, then run its directives."""
+    _, tops, rules, templates, root, directives, dynamic_classes = data
+    parser = Parser.__new__(Parser)  # Parser(...) insists on parsing content
+    parser.filename = filename
+    parser.sourcecode = list(enumerate(content.splitlines()))
+    parser.directives = [tuple(directive) for directive in directives]
+    parser.dynamic_classes = dynamic_classes
+    objects = [_load_rule(parser, rule) for rule in tops]
+    parser.rules = [((ParserSelectorClass if is_class else ParserSelectorName)(key), objects[i])
+                    for is_class, key, i in rules]
+    parser.templates = [(name, cls, objects[i]) for name, cls, i in templates]
+    parser.root = objects[root] if root is not None else None
+    parser.execute_directives()
+    return parser
+
+
+# -- Loading -------------------------------------------------------------
+
+@contextmanager
+def _parser_factory(factory):
+    """Have Builder.load_string create its Parser with `factory` during one load."""
+    original = kv_builder.Parser
+    kv_builder.Parser = factory
+    try:
+        yield
+    finally:
+        kv_builder.Parser = original
+
+
+def _read_entry(path):
+    try:
+        with open(path, 'rb') as f:
+            # loads() on the whole file is several times faster than load(f)
+            data = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return data if isinstance(data, tuple) and data and data[0] == FORMAT else None
+
+
+def _write_entry(directory, filename, key, parser):
+    try:
+        payload = marshal.dumps(dump_parser(parser))
+    except ValueError as error:
+        # A constant value marshal can't store: this file is parsed every time
+        Logger.warning(f'KvCache: not caching {filename}: {error}')
+        stats['errors'] += 1
+        return
+    try:
+        os.makedirs(directory, exist_ok=True)
+        path = _entry_path(directory, filename, key)
+        tmp = f'{path}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(payload)
+        os.replace(tmp, path)
+        # Older entries of the same file are dead once it changed
+        prefix = _entry_prefix(filename)
+        for name in os.listdir(directory):
+            if name.startswith(prefix) and name.endswith('.kvc') and name != os.path.basename(path):
+                os.remove(os.path.join(directory, name))
+    except OSError as error:
+        Logger.warning(f'KvCache: cannot write cache for {filename}: {error}')
+        stats['errors'] += 1
+
+
+def load_file(filename, encoding='utf8', directory=None, **kwargs):
+    """Builder.load_file, served from the KV cache when the file is unchanged."""
+    filename = resource_find(filename) or filename
+    if os.environ.get('KV_CACHE', '1') == '0':
+        return Builder.load_file(filename, encoding=encoding, **kwargs)
+    with open(filename, 'rb') as f:
+        data = f.read()
+    content = data.decode(encoding)
+    directory = directory or cache_dir()
+    key = cache_key(data)
+    cached = _read_entry(_entry_path(directory, filename, key))
+
+    def factory(**parser_kwargs):
+        # Widget modules imported while the root is built may load their own
+        # KV strings through the Builder meanwhile: parse those as usual
+        if parser_kwargs.get('content') is not content or parser_kwargs.get('filename') != filename:
+            return Parser(**parser_kwargs)
+        if cached is not None:
+            stats['hits'] += 1
+            return load_parser(cached, content, parser_kwargs.get('filename'))
+        stats['misses'] += 1
+        parser = Parser(**parser_kwargs)
+        _write_entry(directory, filename, key, parser)
+        return parser
+
+    kwargs['filename'] = filename
+    with _parser_factory(factory):
+        return Builder.load_string(content, **kwargs)
+
+
+def reload_file(filename, **kwargs):
+    """Unload a file's rules and load it again, as a hot reload does."""
+    Builder.unload_file(resource_find(filename) or filename)
+    return load_file(filename, **kwargs)
+
+
+def _measure(filename, runs):
+    """
+    Median ms of parsing only (Parser vs cache entry) and of a whole
+    Builder.load_file with its root widget (plain vs cache hit).
+    """
+    import statistics
+    import tempfile
+
+    def timed(*variants, reset=None):
+        # Interleaved, so warm-up and garbage collection hit every variant alike
+        times = [[] for _ in variants]
+        for _ in range(runs):
+            for run, samples in zip(variants, times):
+                if reset:
+                    reset()
+                started = time.perf_counter()
+                run()
+                samples.append((time.perf_counter() - started) * 1000)
+        return [statistics.median(samples) for samples in times]
+
+    with open(filename, 'rb') as f:
+        data = f.read()
+    content = data.decode('utf8')
+    with tempfile.TemporaryDirectory() as directory:
+        entry = _entry_path(directory, filename, cache_key(data))
+        load_file(filename, directory=directory)
+        Builder.unload_file(filename)
+        parse, cached_parse = timed(lambda: Parser(content=content, filename=filename),
+                                    lambda: load_parser(_read_entry(entry), content, filename))
+        plain, hit = timed(lambda: Builder.load_file(filename), lambda: load_file(filename, directory=directory),
+                           reset=lambda: Builder.unload_file(filename))
+        Builder.unload_file(filename)
+    return parse, cached_parse, plain, hit
+
+
+if __name__ == '__main__':
+    paths = sys.argv[1:] or [os.path.join(os.path.dirname(os.path.abspath(__file__)), 'my.kv')]
+    for path in paths:
+        parse, cached_parse, plain, hit = _measure(os.path.abspath(path), 30)
+        print(f'{path}: parse {parse:.2f} ms -> {cached_parse:.2f} ms from cache ({parse / cached_parse:.1f}x); '
+              f'load_file + root widget {plain:.2f} ms -> {hit:.2f} ms', flush=True)
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+Startup profiler for the Kivy apps: where the time goes from interpreter
+start to the first frame on screen.
+
+    python3 kivy_startup.py test-kivy-app.py
+    python3 kivy_startup.py --runs 5 --json startup.json test-kivy-app2.py
+    python3 kivy_startup.py -m kvtestsone          # with KvTestsOne/src on PYTHONPATH
+
+The app runs in a child interpreter started with `-X importtime` and
+instrumented through kivy.app.App (nothing in the app needs to change),
+and is stopped after its first frame unless --keep-running is given.
+Startup is split into phases:
+
+    interpreter   process start until the app script starts running
+    imports       the app's imports and module-level code, up to App.load_config()
+    config_kv     load_config() and load_kv()
+    build         App.build()
+    window        adding the root to the window (and creating it), until on_start
+    first_frame   the first clock tick: layout and drawing, until the first flip
+
+and every import is timed and attributed to the phase it ran in. With
+SDL_VIDEODRIVER unset and no DISPLAY, the app is run with
+SDL_VIDEODRIVER=offscreen. benchmarks/bench_startup.py builds on
+profile() to catch time-to-first-frame regressions.
+"""
+
+import os
+import sys
+import time
+
+PHASES = ('interpreter', 'imports', 'config_kv', 'build', 'window', 'first_frame')
+# Mark that ends each phase
+PHASE_END = dict(zip(PHASES, ('start', 'prepare', 'build', 'built', 'on_start', 'first_frame')))
+MARK = 'kivy_startup:mark:'
+DEFAULT_TIMEOUT = 60.0
+
+
+# -- Child: runs the app, instrumented --------------------------------------
+#
+# Only os, sys and time are imported before the app, so the profiler itself
+# adds next to nothing to the phases it measures.
+
+_marks = set()
+_exit_after_first_frame = True
+
+
+def _mark(name):
+    if name in _marks:
+        return
+    _marks.add(name)
+    # Straight to fd 2, in order with -X importtime's lines
+    os.write(2, f'{MARK}{name}:{time.monotonic_ns()}\n'.encode())
+
+
+class _AppHook:
+    """Meta path finder instrumenting kivy.app.App as soon as it is imported."""
+
+    def find_spec(self, name, path, target=None):
+        if name != 'kivy.app':
+            return None
+        sys.meta_path.remove(self)
+        import importlib.util
+
+        spec = importlib.util.find_spec(name)
+        exec_module = spec.loader.exec_module
+
+        def exec_and_instrument(module):
+            exec_module(module)
+            _instrument(module.App)
+
+        spec.loader.exec_module = exec_and_instrument
+        return spec
+
+
+def _instrument(App):
+    # load_config() opens every way an app starts (run, async_run and the
+    # reloader apps' own _run_prepare), and build() is wrapped per instance
+    # since apps override it
+    init, load_config = App.__init__, App.load_config
+
+    def profiled_init(self, **kwargs):
+        init(self, **kwargs)
+        build = self.build
+
+        def profiled_build(*args, **kwargs):
+            _mark('build')
+            try:
+                return build(*args, **kwargs)
+            finally:
+                _mark('built')
+
+        self.build = profiled_build
+        self.fbind('on_start', _on_start)
+
+    def profiled_load_config(self):
+        _mark('prepare')
+        return load_config(self)
+
+    App.__init__ = profiled_init
+    App.load_config = profiled_load_config
+
+
+def _on_start(app):
+    from kivy.core.window import Window
+
+    _mark('on_start')
+    Window.fbind('on_flip', _on_flip)
+
+
+def _on_flip(window):
+    if 'first_frame' in _marks:
+        return
+    _mark('first_frame')
+    if _exit_after_first_frame:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(0)
+
+
+def _child(argv):
+    global _exit_after_first_frame
+
+    _mark('start')
+    if argv[0] == '--keep-running':
+        _exit_after_first_frame = False
+        argv = argv[1:]
+    sys.meta_path.insert(0, _AppHook())
+    import runpy
+
+    if argv[0] == '-m':
+        sys.argv = argv[1:]
+        sys.path[0] = os.getcwd()
+        runpy.run_module(argv[1], run_name='__main__', alter_sys=True)
+    else:
+        sys.argv = argv
+        sys.path[0] = os.path.dirname(os.path.abspath(argv[0]))
+        runpy.run_path(argv[0], run_name='__main__')
+
+
+# -- Parent: runs the child and reads its marks and import times -------------
+
+def _parse(lines, started):
+    """Marks (ns) and per-import timings out of the child's stderr."""
+    import re
+
+    import_line = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)')
+    marks, imports, other = {'spawn': started}, {}, []
+    phase = PHASES[0]
+    for line in lines:
+        if line.startswith(MARK):
+            name, ns = line[len(MARK):].rsplit(':', 1)
+            marks[name] = int(ns)
+            phase = next((p for p in PHASES if PHASE_END[p] not in marks), PHASES[-1])
+            continue
+        match = import_line.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            imports[name] = {'self_ms': int(self_us) / 1000, 'cumulative_ms': int(cumulative_us) / 1000,
+                             'depth': len(indent) // 2, 'phase': phase}
+        elif not line.startswith('import time: self'):
+            other.append(line)
+    return marks, imports, other
+
+
+def _phases(marks):
+    phases, previous = {}, marks['spawn']
+    for phase in PHASES:
+        end = marks.get(PHASE_END[phase])
+        if end is not None:
+            phases[phase] = (end - previous) / 1e6
+            previous = end
+    return phases
+
+
+def _child_env(env=None):
+    env = dict(os.environ if env is None else env)
+    env.setdefault('KIVY_NO_ARGS', '1')
+    env.setdefault('KIVY_NO_FILELOG', '1')
+    if not env.get('SDL_VIDEODRIVER') and not env.get('DISPLAY') and sys.platform.startswith('linux'):
+        env['SDL_VIDEODRIVER'] = 'offscreen'
+    return env
+
+
+def _drain(process, echo):
+    for line in process.stderr:
+        if echo:
+            print(line, end='', file=sys.stderr, flush=True)
+
+
+def profile_once(target, module=False, args=(), env=None, timeout=DEFAULT_TIMEOUT, keep_running=False,
+                 echo=False):
+    """
+    Start the app once and time its startup: {'first_frame_ms', 'phases',
+    'phase_imports', 'imports'}. Raises RuntimeError if the app exits or
+    times out before drawing a frame.
+    """
+    import subprocess
+    import threading
+
+    command = [sys.executable, '-X', 'importtime', os.path.abspath(__file__), '--child']
+    if keep_running:
+        command.append('--keep-running')
+    command += (['-m', target] if module else [target]) + list(args)
+    started = time.monotonic_ns()
+    process = subprocess.Popen(command, env=_child_env(env), stderr=subprocess.PIPE, text=True, errors='replace')
+    timer = threading.Timer(timeout, process.kill)
+    timer.start()
+    lines = []
+    try:
+        for line in process.stderr:
+            line = line.rstrip('\n')
+            lines.append(line)
+            if echo and not line.startswith(('import time:', MARK)):
+                print(line, file=sys.stderr, flush=True)
+            if line.startswith(f'{MARK}first_frame:'):
+                break
+        timer.cancel()
+        if keep_running:
+            # Report now; the app goes on until it is closed
+            threading.Thread(target=_drain, args=(process, echo), daemon=True).start()
+        else:
+            process.stderr.read()
+            process.wait()
+    finally:
+        timer.cancel()
+    marks, imports, other = _parse(lines, started)
+    if 'first_frame' not in marks:
+        tail = '\n'.join(other[-20:])
+        raise RuntimeError(f'{target} exited (status {process.poll()}) before its first frame:\n{tail}')
+
+    phases = _phases(marks)
+    phase_imports = {phase: 0.0 for phase in phases}
+    for timing in imports.values():
+        if timing['depth'] == 0 and timing['phase'] in phase_imports:
+            phase_imports[timing['phase']] += timing['cumulative_ms']
+    return {
+        'target': target,
+        'first_frame_ms': (marks['first_frame'] - started) / 1e6,
+        'phases': phases,
+        'phase_imports': phase_imports,
+        'imports': imports,
+        'process': process,
+    }
+
+
+def profile(target, runs=1, **kwargs):
+    """profile_once() `runs` times; medians of every timing."""
+    import statistics
+
+    results = [profile_once(target, **kwargs) for _ in range(runs)]
+    names = {name for result in results for name in result['imports']}
+    imports = {}
+    for name in names:
+        samples = [result['imports'][name] for result in results if name in result['imports']]
+        imports[name] = {
+            'self_ms': statistics.median(s['self_ms'] for s in samples),
+            'cumulative_ms': statistics.median(s['cumulative_ms'] for s in samples),
+            'depth': samples[0]['depth'],
+            'phase': samples[0]['phase'],
+        }
+    return {
+        'target': target,
+        'runs': runs,
+        'first_frame_ms': statistics.median(result['first_frame_ms'] for result in results),
+        'phases': {phase: statistics.median(result['phases'].get(phase, 0.0) for result in results)
+                   for phase in PHASES if any(phase in result['phases'] for result in results)},
+        'phase_imports': {phase: statistics.median(result['phase_imports'].get(phase, 0.0) for result in results)
+                          for phase in PHASES if any(phase in result['phase_imports'] for result in results)},
+        'imports': imports,
+    }
+
+
+def format_report(result, top=15):
+    runs = f", median of {result['runs']} runs" if result.get('runs', 1) > 1 else ''
+    out = [f"{result['target']}: first frame after {result['first_frame_ms']:.1f} ms{runs}",
+           f"  {'phase':<14} {'ms':>8} {'imports ms':>11}"]
+    for phase, ms in result['phases'].items():
+        out.append(f"  {phase:<14} {ms:>8.1f} {result['phase_imports'].get(phase, 0.0):>11.1f}")
+    imports = result['imports']
+    top_level = sorted((item for item in imports.items() if item[1]['depth'] == 0),
+                       key=lambda item: -item[1]['cumulative_ms'])
+    out.append("  slowest imports (with what they import, ms):")
+    for name, timing in top_level[:top]:
+        out.append(f"    {timing['cumulative_ms']:>8.1f}  {name}  [{timing['phase']}]")
+    out.append("  slowest modules (own time only, ms):")
+    for name, timing in sorted(imports.items(), key=lambda item: -item[1]['self_ms'])[:top]:
+        out.append(f"    {timing['self_ms']:>8.1f}  {name}  [{timing['phase']}]")
+    return '\n'.join(out)
+
+
+def main(argv=None):
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('target', help='app script, or module with -m')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help="arguments for the app")
+    parser.add_argument('-m', dest='module', action='store_true', help='target is a module (python -m)')
+    parser.add_argument('--runs', type=int, default=1, help='launches to take the median of')
+    parser.add_argument('--top', type=int, default=15, help='imports to list')
+    parser.add_argument('--json', help='also write the results to this file')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='seconds to wait for a frame')
+    parser.add_argument('--keep-running', action='store_true', help="leave the app running after its first frame")
+    parser.add_argument('-v', '--verbose', action='store_true', help="show the app's own output")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.keep_running:
+            result = profile_once(args.target, module=args.module, args=args.args, timeout=args.timeout,
+                                  keep_running=True, echo=args.verbose)
+        else:
+            result = profile(args.target, runs=max(1, args.runs), module=args.module, args=args.args,
+                             timeout=args.timeout, echo=args.verbose)
+    except RuntimeError as e:
+        print(f"kivy_startup: {e}", flush=True)
+        return 1
+    print(format_report(result, args.top), flush=True)
+    process = result.pop('process', None)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    if process is not None:
+        return process.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 2 and sys.argv[1] == '--child':
+        _child(sys.argv[2:])
+    else:
+        sys.exit(main())
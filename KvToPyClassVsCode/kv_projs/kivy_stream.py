@@ -0,0 +1,528 @@
+"""
+Built-in streaming for the Kivy test apps, instead of Xvfb + x11vnc + websockify.
+
+After each frame Kivy draws, the window's pixels are read back with
+glReadPixels, compared with the previous frame in 32x32 tiles, and only
+the changed tiles (merged into rectangles) are sent to viewers over a
+WebSocket, compressed with a fast codec. Viewers that fall behind skip
+intermediate frames: each one collects the tiles changed since its last
+update and always gets their latest pixels. Mouse input from viewers is
+fed back into the app.
+
+Enable it with environment variables (Kivy owns the command line):
+
+    KIVY_STREAM=1            turn streaming on
+    KIVY_STREAM_HOST         address to listen on (default 127.0.0.1)
+    KIVY_STREAM_PORT         port (default 8765; 0 picks a free one)
+    KIVY_STREAM_FPS          frames per second sent at most (default 30)
+    KIVY_STREAM_CODEC        zlib, lz4, zstd, jpeg or webp (default zlib)
+    KIVY_STREAM_QUALITY      jpeg/webp quality, 1-100 (default 80)
+
+Open http://HOST:PORT/ for the built-in viewer (GET /stats has frame
+counters and the window size, for kivy_supervisor.py); the stream itself is at
+ws://HOST:PORT/stream, where `?codec=...&quality=...&fps=...` override the
+defaults for one viewer. Each app only needs its own port, so any number
+of instances run side by side on one host, without a display server when
+started with SDL_VIDEODRIVER=offscreen.
+
+Messages to the viewer: a JSON text message {"type": "hello", "width",
+"height", "codec"} on connect and whenever the window is resized, then
+binary updates:
+
+    4s  magic b'KVST'
+    B   version (1)
+    B   codec: 0 raw, 1 zlib, 2 lz4, 3 zstd, 4 jpeg, 5 webp
+    H   window width
+    H   window height
+    H   number of rectangles
+    then per rectangle: H x, H y (from the top), H width, H height,
+    I payload size, payload (top-down RGBA rows for raw/zlib/lz4/zstd,
+    an image for jpeg/webp)
+
+Messages from the viewer: {"type": "mouse_down" | "mouse_move" |
+"mouse_up", "x", "y" (window pixels from the top-left), "button"}.
+"""
+
+import base64
+import hashlib
+import importlib
+import io
+import json
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+from urllib.parse import parse_qs, urlparse
+
+DEFAULT_PORT = 8765
+TILE = 32
+MAGIC = b'KVST'
+CODECS = {'raw': 0, 'zlib': 1, 'lz4': 2, 'zstd': 3, 'jpeg': 4, 'webp': 5}
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+_streamer = None
+
+
+# Optional codec modules, imported on first use so an app that doesn't
+# stream (KIVY_STREAM unset) doesn't pay for them at startup
+_CODEC_MODULES = {'lz4': 'lz4.frame', 'zstd': 'zstandard', 'jpeg': 'PIL.Image', 'webp': 'PIL.Image'}
+_codec_modules = {}
+
+
+def _codec_module(codec):
+    """The module behind an optional codec, or None if it isn't installed."""
+    name = _CODEC_MODULES[codec]
+    if name not in _codec_modules:
+        try:
+            _codec_modules[name] = importlib.import_module(name)
+        except ImportError:  # pragma: no cover - optional dependency
+            _codec_modules[name] = None
+    return _codec_modules[name]
+
+
+def available_codecs():
+    return [name for name in CODECS if name in ('raw', 'zlib') or _codec_module(name) is not None]
+
+
+def encode_rect(pixels, width, height, codec, quality):
+    """Compress top-down RGBA pixels of one rectangle."""
+    if codec == 'zlib':
+        return zlib.compress(pixels, 1)
+    if codec == 'lz4':
+        return _codec_module('lz4').compress(pixels)
+    if codec == 'zstd':
+        return _codec_module('zstd').ZstdCompressor(level=1).compress(pixels)
+    if codec in ('jpeg', 'webp'):
+        image = _codec_module(codec).frombytes('RGBA', (width, height), pixels)
+        out = io.BytesIO()
+        if codec == 'jpeg':
+            image.convert('RGB').save(out, 'JPEG', quality=quality)
+        else:
+            image.save(out, 'WEBP', quality=quality, method=0)
+        return out.getvalue()
+    return pixels
+
+
+def changed_tiles(old, new, width, height):
+    """(column, row) of the tiles that differ; rows count from the bottom (GL order)."""
+    stride = width * 4
+    tiles = set()
+    for row, y0 in enumerate(range(0, height, TILE)):
+        rows = [y for y in range(y0, min(height, y0 + TILE))
+                if old[y * stride:(y + 1) * stride] != new[y * stride:(y + 1) * stride]]
+        if not rows:
+            continue
+        for column, x0 in enumerate(range(0, stride, TILE * 4)):
+            x1 = min(stride, x0 + TILE * 4)
+            if any(old[y * stride + x0:y * stride + x1] != new[y * stride + x0:y * stride + x1] for y in rows):
+                tiles.add((column, row))
+    return tiles
+
+
+def all_tiles(width, height):
+    return {(column, row) for column in range(-(-width // TILE)) for row in range(-(-height // TILE))}
+
+
+def tile_rects(tiles, width, height):
+    """Merge tiles into runs per tile row: (x, y_bottom, w, h) in pixels."""
+    rects = []
+    for row in sorted({row for _, row in tiles}):
+        columns = sorted(column for column, r in tiles if r == row)
+        start = previous = columns[0]
+        for column in columns[1:] + [None]:
+            if column == previous + 1:
+                previous = column
+                continue
+            x, y = start * TILE, row * TILE
+            rects.append((x, y, min(width, (previous + 1) * TILE) - x, min(height, y + TILE) - y))
+            if column is not None:
+                start = previous = column
+    return rects
+
+
+def encode_update(frame, width, height, tiles, codec, quality):
+    """One binary update with the current pixels of `tiles`."""
+    stride = width * 4
+    rects = tile_rects(tiles, width, height)
+    parts = [struct.pack('>4sBBHHH', MAGIC, 1, CODECS[codec], width, height, len(rects))]
+    for x, y, w, h in rects:
+        # GL rows are bottom-up: emit them top-down
+        pixels = b''.join(frame[row * stride + x * 4:row * stride + (x + w) * 4]
+                          for row in range(y + h - 1, y - 1, -1))
+        data = encode_rect(pixels, w, h, codec, quality)
+        parts.append(struct.pack('>HHHHI', x, height - y - h, w, h, len(data)))
+        parts.append(data)
+    return b''.join(parts)
+
+
+class _Viewer:
+    """One connected viewer: its settings and the tiles it hasn't seen yet."""
+
+    def __init__(self, codec, quality, fps):
+        self.codec = codec
+        self.quality = quality
+        self.interval = 1.0 / fps
+        self.dirty = set()
+        self.size = None
+        self.closed = False
+
+
+class Streamer:
+    def __init__(self, host, port, fps, codec, quality):
+        self.host = host
+        self.port = port
+        self.fps = fps
+        self.codec = codec
+        self.quality = quality
+        self.interval = 1.0 / fps
+        self.frame = None
+        self.size = (0, 0)
+        self.viewers = []
+        self.cond = threading.Condition()
+        self._last_capture = 0.0
+        self._trailing = None
+        self._server = None
+        self._window = None
+        # Counters for /stats
+        self.frames_drawn = 0
+        self.updates_sent = 0
+
+    def start(self):
+        """Start serving viewers; frames are captured once the window exists."""
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from kivy.clock import Clock
+
+        self._clock = Clock
+        handler = type('StreamHandler', (_StreamHandler, BaseHTTPRequestHandler), {'streamer': self})
+        self._server = ThreadingHTTPServer((self.host, self.port), handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True, name='kivy-stream').start()
+        Clock.schedule_once(self._attach, 0)
+        print(f"kivy_stream: Streaming on http://{self.host}:{self.port}/ "
+              f"({self.codec}, up to {self.fps:g} fps)", flush=True)
+
+    def _attach(self, dt):
+        from kivy.core.window import Window
+        from kivy.graphics.opengl import GL_RGBA, GL_UNSIGNED_BYTE, glReadPixels
+
+        self._window = Window
+        self._read_pixels = lambda w, h: glReadPixels(0, 0, w, h, GL_RGBA, GL_UNSIGNED_BYTE)
+        Window.bind(on_flip=self._on_flip)
+        Window.canvas.ask_update()
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        with self.cond:
+            for viewer in self.viewers:
+                viewer.closed = True
+            self.cond.notify_all()
+
+    def _on_flip(self, window):
+        """Called after Kivy drew a frame, before the buffers are swapped."""
+        self.frames_drawn += 1
+        if not self.viewers:
+            return
+        now = time.monotonic()
+        wait = self._last_capture + self.interval - now
+        if wait > 0:
+            # Too soon: make sure the latest frame is still captured later
+            if self._trailing is None:
+                self._trailing = self._clock.schedule_once(self._redraw, wait)
+            return
+        self._last_capture = now
+        width, height = (int(v) for v in window.size)
+        frame = self._read_pixels(width, height)
+        with self.cond:
+            if self.frame is not None and self.size == (width, height):
+                tiles = changed_tiles(self.frame, frame, width, height)
+            else:
+                tiles = all_tiles(width, height)
+            self.frame, self.size = frame, (width, height)
+            if tiles:
+                for viewer in self.viewers:
+                    viewer.dirty |= tiles
+                self.cond.notify_all()
+
+    def _redraw(self, dt):
+        self._trailing = None
+        if self._window is not None:
+            self._window.canvas.ask_update()
+
+    def add_viewer(self, viewer):
+        with self.cond:
+            self.viewers.append(viewer)
+            if self.frame is not None:
+                viewer.dirty = all_tiles(*self.size)
+        # A frame for the new viewer
+        self._clock.schedule_once(self._redraw, 0)
+
+    def remove_viewer(self, viewer):
+        with self.cond:
+            viewer.closed = True
+            if viewer in self.viewers:
+                self.viewers.remove(viewer)
+            self.cond.notify_all()
+
+    def next_update(self, viewer):
+        """Block until the viewer has something to see; (frame, size, tiles) or None."""
+        with self.cond:
+            while not viewer.dirty and not viewer.closed:
+                self.cond.wait()
+            if viewer.closed:
+                return None
+            tiles, viewer.dirty = viewer.dirty, set()
+            return self.frame, self.size, tiles
+
+    def inject(self, event):
+        """Feed a viewer's mouse event to the app, on the Kivy thread."""
+        kind = event.get('type')
+        if kind not in ('mouse_down', 'mouse_move', 'mouse_up'):
+            return
+        x, y = float(event['x']), float(event['y'])
+        button = str(event.get('button', 'left'))
+
+        def dispatch(dt):
+            if kind == 'mouse_move':
+                self._window.dispatch('on_mouse_move', x, y, [])
+            else:
+                self._window.dispatch(f"on_{kind}", x, y, button, [])
+
+        self._clock.schedule_once(dispatch, 0)
+
+
+class _StreamHandler:
+    """Request handling, mixed into http.server's handler by Streamer.start()."""
+
+    protocol_version = 'HTTP/1.1'
+    streamer = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/':
+            body = VIEWER_HTML.encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif url.path == '/stats':
+            streamer = self.streamer
+            body = json.dumps({
+                'frames': streamer.frames_drawn,
+                'updates': streamer.updates_sent,
+                'viewers': len(streamer.viewers),
+                'clock_fps': round(streamer._clock.get_fps(), 2),
+                'size': [int(v) for v in streamer._window.size] if streamer._window is not None else None,
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif url.path == '/stream' and self.headers.get('Sec-WebSocket-Key'):
+            self._stream(parse_qs(url.query))
+        else:
+            self.send_error(404)
+
+    def _stream(self, query):
+        streamer = self.streamer
+        codec = query.get('codec', [streamer.codec])[0]
+        if codec not in available_codecs():
+            codec = 'zlib'
+        try:
+            quality = min(100, max(1, int(query.get('quality', [streamer.quality])[0])))
+            fps = min(streamer.fps, max(0.1, float(query.get('fps', [streamer.fps])[0])))
+        except ValueError:
+            self.send_error(400)
+            return
+
+        key = self.headers['Sec-WebSocket-Key']
+        self.send_response(101, 'Switching Protocols')
+        self.send_header('Upgrade', 'websocket')
+        self.send_header('Connection', 'Upgrade')
+        self.send_header('Sec-WebSocket-Accept', base64.b64encode(
+            hashlib.sha1((key + WS_GUID).encode('ascii')).digest()).decode('ascii'))
+        self.end_headers()
+        self.close_connection = True
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        viewer = _Viewer(codec, quality, fps)
+        self._send_lock = threading.Lock()
+        threading.Thread(target=self._read_input, args=(viewer,), daemon=True).start()
+        streamer.add_viewer(viewer)
+        try:
+            while True:
+                started = time.monotonic()
+                update = streamer.next_update(viewer)
+                if update is None:
+                    return
+                frame, size, tiles = update
+                if size != viewer.size:
+                    viewer.size = size
+                    self._send(0x1, json.dumps({'type': 'hello', 'width': size[0], 'height': size[1],
+                                                'codec': codec}).encode())
+                self._send(0x2, encode_update(frame, size[0], size[1], tiles, codec, quality))
+                streamer.updates_sent += 1
+                # Tiles that change meanwhile are merged into the next update
+                time.sleep(max(0.0, viewer.interval - (time.monotonic() - started)))
+        except OSError:
+            pass
+        finally:
+            streamer.remove_viewer(viewer)
+
+    def _send(self, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = struct.pack('>BB', 0x80 | opcode, length)
+        elif length < 1 << 16:
+            header = struct.pack('>BBH', 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack('>BBQ', 0x80 | opcode, 127, length)
+        with self._send_lock:
+            self.wfile.write(header + payload)
+
+    def _read_input(self, viewer):
+        """Read the viewer's (masked) messages until it goes away."""
+        try:
+            while True:
+                first, second = self.rfile.read(2)
+                length = second & 0x7F
+                if length == 126:
+                    length, = struct.unpack('>H', self.rfile.read(2))
+                elif length == 127:
+                    length, = struct.unpack('>Q', self.rfile.read(8))
+                if length > 64 * 1024:
+                    break
+                mask = self.rfile.read(4) if second & 0x80 else b'\0\0\0\0'
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self.rfile.read(length)))
+                opcode = first & 0x0F
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    self._send(0xA, payload)
+                elif opcode == 0x1:
+                    try:
+                        self.streamer.inject(json.loads(payload))
+                    except (ValueError, KeyError, TypeError):
+                        pass
+        except (ValueError, OSError):
+            # ValueError: the connection closed mid-frame
+            pass
+        self.streamer.remove_viewer(viewer)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def enable():
+    """
+    Start streaming with the app if KIVY_STREAM is set. Call before
+    App.run(); returns the Streamer, or None when streaming is off.
+    Calling it again returns the running Streamer.
+    """
+    global _streamer
+    if _streamer is not None:
+        return _streamer
+    if os.environ.get('KIVY_STREAM', '') in ('', '0'):
+        return None
+    codec = os.environ.get('KIVY_STREAM_CODEC', 'zlib')
+    if codec not in available_codecs():
+        print(f"kivy_stream: Codec {codec!r} is not available, using zlib", flush=True)
+        codec = 'zlib'
+    _streamer = Streamer(
+        host=os.environ.get('KIVY_STREAM_HOST', '127.0.0.1'),
+        port=int(os.environ.get('KIVY_STREAM_PORT', DEFAULT_PORT)),
+        fps=max(0.1, float(os.environ.get('KIVY_STREAM_FPS', 30))),
+        codec=codec,
+        quality=min(100, max(1, int(os.environ.get('KIVY_STREAM_QUALITY', 80)))),
+    )
+    _streamer.start()
+    return _streamer
+
+
+def describe(default):
+    """Status text for the apps: how this instance is being streamed."""
+    if _streamer is None:
+        return default
+    return f"Streaming on port {_streamer.port} ({_streamer.codec}, {_streamer.fps:g} fps)"
+
+
+VIEWER_HTML = """<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>Kivy stream</title>
+<style>body { margin: 0; background: #222; } canvas { display: block; margin: auto; }</style>
+</head>
+<body>
+<canvas id="screen"></canvas>
+<script>
+const canvas = document.getElementById('screen');
+const ctx = canvas.getContext('2d');
+const codecs = ['raw', 'zlib', 'lz4', 'zstd', 'jpeg', 'webp'];
+const url = `ws://${location.host}/stream${location.search}`;
+let queue = Promise.resolve();
+
+async function inflate(data) {
+  const stream = new Blob([data]).stream().pipeThrough(new DecompressionStream('deflate'));
+  return new Uint8ClampedArray(await new Response(stream).arrayBuffer());
+}
+
+async function apply(buffer) {
+  const view = new DataView(buffer);
+  const codec = codecs[view.getUint8(5)];
+  const count = view.getUint16(10);
+  let offset = 12;
+  for (let i = 0; i < count; i++) {
+    const x = view.getUint16(offset), y = view.getUint16(offset + 2);
+    const w = view.getUint16(offset + 4), h = view.getUint16(offset + 6);
+    const size = view.getUint32(offset + 8);
+    const data = new Uint8Array(buffer, offset + 12, size);
+    offset += 12 + size;
+    if (codec === 'jpeg' || codec === 'webp') {
+      const bitmap = await createImageBitmap(new Blob([data], {type: `image/${codec}`}));
+      ctx.drawImage(bitmap, x, y);
+    } else {
+      const pixels = codec === 'zlib' ? await inflate(data) : new Uint8ClampedArray(data);
+      ctx.putImageData(new ImageData(pixels, w, h), x, y);
+    }
+  }
+}
+
+function connect() {
+  const socket = new WebSocket(url);
+  socket.binaryType = 'arraybuffer';
+  socket.onmessage = (event) => {
+    if (typeof event.data === 'string') {
+      const hello = JSON.parse(event.data);
+      queue = queue.then(() => { canvas.width = hello.width; canvas.height = hello.height; });
+    } else {
+      queue = queue.then(() => apply(event.data));
+    }
+  };
+  socket.onclose = () => setTimeout(connect, 1000);
+  let down = false;
+  const send = (type, event) => {
+    const rect = canvas.getBoundingClientRect();
+    socket.readyState === 1 && socket.send(JSON.stringify({
+      type, button: ['left', 'middle', 'right'][event.button] || 'left',
+      x: (event.clientX - rect.left) * canvas.width / rect.width,
+      y: (event.clientY - rect.top) * canvas.height / rect.height,
+    }));
+  };
+  canvas.onmousedown = (event) => { down = true; send('mouse_down', event); };
+  canvas.onmouseup = (event) => { down = false; send('mouse_up', event); };
+  canvas.onmousemove = (event) => down && send('mouse_move', event);
+  canvas.oncontextmenu = (event) => event.preventDefault();
+}
+
+connect();
+</script>
+</body>
+</html>
+"""
@@ -0,0 +1,633 @@
+#!/usr/bin/env python3
+"""
+Supervisor for many streamed Kivy app instances on one host.
+
+Instead of one hand-configured display, VNC server and port per app copy,
+the supervisor starts app instances on demand and streams each one with
+kivy_stream.py on a port it allocates:
+
+- a "zygote" process imports Kivy and the common widgets once; instances
+  are forked from it, so they skip the Python + Kivy cold start (the
+  window and GL context are still created per instance, after the fork);
+- each instance gets a free port from --ports and, with --display xvfb,
+  its own Xvfb display (the default, offscreen, needs no display server);
+- released instances stay warm and are handed to the next session of the
+  same app, until --idle-timeout;
+- instances above --max-rss-mb are stopped, and new ones are refused
+  while the instances together use more than --max-total-rss-mb (idle
+  ones are stopped first);
+- CPU, RSS and frame rate of every instance are sampled every few
+  seconds.
+
+Control API (JSON over HTTP, default 127.0.0.1:8700):
+
+    GET    /health
+    GET    /instances        every instance with its metrics
+    POST   /instances        {"app": "test-kivy-app.py", "session"?, "width"?, "height"?}
+                             -> the instance: {"id", "port", "url", ...}
+    DELETE /instances/<id>   release (kept warm for reuse); ?kill=1 stops it
+    GET    /metrics          Prometheus text format
+
+Apps are scripts in --apps-dir (default: this directory).
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# Imported by the zygote before forking, so instances start with them loaded.
+# Nothing here may import kivy.core.window (kivy.uix.textinput does): the
+# window and GL context must be created in each instance, after the fork.
+PRELOAD = (
+    'kivy.app', 'kivy.lang', 'kivy.clock', 'kivy.graphics', 'kivy.properties',
+    'kivy.uix.widget', 'kivy.uix.label', 'kivy.uix.button', 'kivy.uix.boxlayout',
+    'kivy.uix.floatlayout', 'kivy.uix.gridlayout',
+    'kivy.uix.image', 'kivy.uix.scrollview', 'kivy_stream',
+    # kivy_stream imports its server only once streaming starts
+    'http.server',
+)
+
+# Seconds an instance has to draw its first frame
+STARTUP_TIMEOUT = 30.0
+
+# Seconds between SIGTERM and SIGKILL
+STOP_GRACE = 3.0
+
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+
+def _zygote(conn, preload):
+    """Warm process: import Kivy once, then fork one instance per request."""
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    os.environ.setdefault('KIVY_NO_FILELOG', '1')
+    # Instances are reaped by the kernel; the supervisor watches their pids
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    for name in preload:
+        try:
+            __import__(name)
+        except Exception as e:
+            print(f"kivy_supervisor: Could not preload {name}: {e}", flush=True)
+    if 'kivy.core.window' in sys.modules:
+        # Every instance would inherit this one window and its GL context
+        conn.send(('error', 'preloading created the Kivy window before forking'))
+        return
+    conn.send(('ready', None))
+
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            return
+        if request is None:
+            return
+        try:
+            pid = os.fork()
+        except OSError as e:
+            conn.send(('error', str(e)))
+            continue
+        if pid:
+            conn.send(('ok', pid))
+            continue
+        # Instance
+        code = 1
+        try:
+            conn.close()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            os.setsid()
+            _die_with_parent()
+            code = _run_instance(**request)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else 0
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+
+def _die_with_parent():
+    """Have Linux stop the instance if the zygote goes away."""
+    try:
+        import ctypes
+        ctypes.CDLL(None).prctl(1, signal.SIGTERM)  # PR_SET_PDEATHSIG
+    except (OSError, AttributeError):
+        pass
+
+
+def _run_instance(script, env, width, height):
+    import runpy
+
+    os.environ.update(env)
+    from kivy.config import Config
+    Config.set('graphics', 'width', str(width))
+    Config.set('graphics', 'height', str(height))
+
+    directory = os.path.dirname(script)
+    os.chdir(directory)
+    sys.path.insert(0, directory)
+    sys.argv = [script]
+    # Stream apps that don't call kivy_stream.enable() themselves too
+    import kivy_stream
+    kivy_stream.enable()
+    runpy.run_path(script, run_name='__main__')
+    return 0
+
+
+class Zygote:
+    def __init__(self, preload=PRELOAD):
+        context = multiprocessing.get_context('spawn')
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_zygote, args=(child_conn, preload),
+                                       name='kivy-zygote', daemon=True)
+        self._lock = threading.Lock()
+        self.process.start()
+        child_conn.close()
+
+    def wait_ready(self, timeout=120.0):
+        if not self._conn.poll(timeout):
+            raise RuntimeError('zygote did not start')
+        try:
+            status, value = self._conn.recv()
+        except EOFError:
+            raise RuntimeError('zygote exited during startup') from None
+        if status != 'ready':
+            raise RuntimeError(f"zygote did not start: {value}")
+
+    def fork(self, script, env, width, height):
+        with self._lock:
+            self._conn.send({'script': script, 'env': env, 'width': width, 'height': height})
+            status, value = self._conn.recv()
+        if status != 'ok':
+            raise RuntimeError(f"fork failed: {value}")
+        return value
+
+    def close(self):
+        try:
+            self._conn.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _cpu_ticks(pid):
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rpartition(')')[2].split()
+    # utime and stime, fields 14 and 15 of stat(5)
+    return int(fields[11]) + int(fields[12])
+
+
+def _rss_bytes(pid):
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def _port_free(host, port):
+    with socket.socket() as s:
+        try:
+            s.bind((host, port))
+        except OSError:
+            return False
+    return True
+
+
+class Instance:
+    def __init__(self, instance_id, app, port, display, width, height):
+        self.id = instance_id
+        self.app = app
+        self.port = port
+        self.display = display
+        self.width = width
+        self.height = height
+        self.pid = None
+        self.xvfb = None
+        self.state = 'starting'
+        self.session = None
+        self.started = time.time()
+        self.startup_ms = None
+        self.last_used = time.monotonic()
+        self.cpu_percent = None
+        self.rss = None
+        self.fps = None
+        self.viewers = None
+        self._sample = None
+
+    def info(self, host):
+        return {
+            'id': self.id,
+            'app': self.app,
+            'pid': self.pid,
+            'port': self.port,
+            'display': self.display,
+            'url': f"http://{host}:{self.port}/",
+            'state': self.state,
+            'session': self.session,
+            'uptime_s': round(time.time() - self.started, 1),
+            'startup_ms': self.startup_ms,
+            'cpu_percent': self.cpu_percent,
+            'rss_mb': round(self.rss / (1024 * 1024), 1) if self.rss is not None else None,
+            'fps': self.fps,
+            'viewers': self.viewers,
+        }
+
+
+class Supervisor:
+    def __init__(self, apps_dir, host='127.0.0.1', ports=(6100, 6199), display='offscreen',
+                 display_base=100, max_instances=16, idle_timeout=300.0, max_rss_mb=0,
+                 max_total_rss_mb=0, width=1024, height=768, fps=30, codec='zlib', sample_interval=2.0):
+        self.apps_dir = os.path.abspath(apps_dir)
+        self.host = host
+        self.ports = ports
+        self.display = display
+        self.display_base = display_base
+        self.max_instances = max_instances
+        self.idle_timeout = idle_timeout
+        self.max_rss = max_rss_mb * 1024 * 1024
+        self.max_total_rss = max_total_rss_mb * 1024 * 1024
+        self.width = width
+        self.height = height
+        self.stream_env = {'KIVY_STREAM': '1', 'KIVY_STREAM_HOST': host,
+                           'KIVY_STREAM_FPS': str(fps), 'KIVY_STREAM_CODEC': codec}
+        self.sample_interval = sample_interval
+        self.instances = {}
+        self._next_id = 1
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self.zygote = Zygote()
+        self._monitor = threading.Thread(target=self._monitor_loop, daemon=True, name='kivy-supervisor-monitor')
+
+    def start(self):
+        self.zygote.wait_ready()
+        self._monitor.start()
+
+    def _script(self, app):
+        script = os.path.abspath(os.path.join(self.apps_dir, app))
+        if os.path.dirname(script) != self.apps_dir or not script.endswith('.py') or not os.path.isfile(script):
+            raise ValueError(f"no app {app!r} in {self.apps_dir}")
+        return script
+
+    def allocate(self, app, session=None, width=None, height=None):
+        """Hand out an instance of `app`: the session's, an idle one or a new one."""
+        script = self._script(app)
+        width, height = width or self.width, height or self.height
+        with self._lock:
+            for instance in self.instances.values():
+                if session and instance.session == session and instance.app == app and instance.state == 'busy':
+                    instance.last_used = time.monotonic()
+                    return instance
+            idle = [instance for instance in self.instances.values()
+                    if instance.app == app and instance.state == 'idle'
+                    and (instance.width, instance.height) == (width, height)]
+            if idle:
+                instance = max(idle, key=lambda i: i.last_used)
+                instance.state, instance.session, instance.last_used = 'busy', session, time.monotonic()
+                return instance
+            instance = self._reserve(app, width, height)
+        try:
+            self._launch(instance, script)
+        except BaseException:
+            self._stop(instance)
+            raise
+        instance.state, instance.session = 'busy', session
+        return instance
+
+    def _reserve(self, app, width, height):
+        """Pick a port and display for a new instance (under the lock)."""
+        if len(self.instances) >= self.max_instances:
+            self._evict_idle() or self._full(f"{self.max_instances} instances running")
+        if self.max_total_rss and sum(i.rss or 0 for i in self.instances.values()) >= self.max_total_rss:
+            self._evict_idle() or self._full('memory limit reached')
+        used_ports = {i.port for i in self.instances.values()}
+        port = next((p for p in range(self.ports[0], self.ports[1] + 1)
+                     if p not in used_ports and _port_free(self.host, p)), None)
+        if port is None:
+            self._full('no free port')
+        display = None
+        if self.display == 'xvfb':
+            used = {i.display for i in self.instances.values()}
+            display = next(n for n in range(self.display_base, self.display_base + 1000)
+                           if n not in used and not os.path.exists(f"/tmp/.X{n}-lock"))
+        instance = Instance(self._next_id, app, port, display, width, height)
+        self._next_id += 1
+        self.instances[instance.id] = instance
+        return instance
+
+    @staticmethod
+    def _full(reason):
+        raise CapacityError(reason)
+
+    def _evict_idle(self):
+        """Stop the least recently used idle instance (under the lock). False if none."""
+        idle = [instance for instance in self.instances.values() if instance.state == 'idle']
+        if not idle:
+            return False
+        instance = min(idle, key=lambda i: i.last_used)
+        instance.state = 'stopping'
+        threading.Thread(target=self._stop, args=(instance,), daemon=True).start()
+        del self.instances[instance.id]
+        return True
+
+    def _launch(self, instance, script):
+        started = time.monotonic()
+        env = dict(self.stream_env, KIVY_STREAM_PORT=str(instance.port))
+        if instance.display is None:
+            env['SDL_VIDEODRIVER'] = 'offscreen'
+        else:
+            instance.xvfb = subprocess.Popen(
+                ['Xvfb', f":{instance.display}", '-screen', '0', f"{instance.width}x{instance.height}x24",
+                 '-ac', '+extension', 'GLX', '+render', '-noreset'],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            while not os.path.exists(f"/tmp/.X11-unix/X{instance.display}"):
+                if instance.xvfb.poll() is not None or time.monotonic() - started > 10:
+                    raise RuntimeError(f"Xvfb :{instance.display} did not start")
+                time.sleep(0.05)
+            env.update(DISPLAY=f":{instance.display}", SDL_VIDEODRIVER='x11')
+        instance.pid = self.zygote.fork(script, env, instance.width, instance.height)
+
+        deadline = started + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if not _alive(instance.pid):
+                raise RuntimeError(f"{instance.app} exited during startup")
+            try:
+                # Ready once the first frame was drawn
+                stats = self._stats(instance)
+                if stats['frames']:
+                    break
+            except (OSError, ValueError, KeyError):
+                pass
+            time.sleep(0.05)
+        else:
+            raise RuntimeError(f"{instance.app} did not start streaming within {STARTUP_TIMEOUT:g}s")
+        if tuple(stats.get('size') or ()) != (instance.width, instance.height):
+            raise RuntimeError(f"{instance.app} opened a {stats.get('size')} window instead of "
+                               f"{instance.width}x{instance.height}")
+        instance.startup_ms = round((time.monotonic() - started) * 1000, 1)
+        print(f"kivy_supervisor: Started {instance.app} as instance {instance.id} (pid {instance.pid}, "
+              f"port {instance.port}) in {instance.startup_ms:g} ms", flush=True)
+
+    def _stats(self, instance):
+        with urllib.request.urlopen(f"http://127.0.0.1:{instance.port}/stats", timeout=1) as response:
+            return json.loads(response.read())
+
+    def release(self, instance_id, kill=False):
+        with self._lock:
+            instance = self.instances.get(instance_id)
+            if instance is None:
+                raise KeyError(instance_id)
+            if not kill and instance.state == 'busy':
+                instance.state, instance.session, instance.last_used = 'idle', None, time.monotonic()
+                return
+            instance.state = 'stopping'
+            del self.instances[instance_id]
+        self._stop(instance)
+
+    def _stop(self, instance):
+        with self._lock:
+            self.instances.pop(instance.id, None)
+        if instance.pid is not None and _alive(instance.pid):
+            self._signal(instance.pid, signal.SIGTERM)
+            deadline = time.monotonic() + STOP_GRACE
+            while _alive(instance.pid) and time.monotonic() < deadline:
+                time.sleep(0.05)
+            if _alive(instance.pid):
+                self._signal(instance.pid, signal.SIGKILL)
+        if instance.xvfb is not None:
+            instance.xvfb.terminate()
+            try:
+                instance.xvfb.wait(STOP_GRACE)
+            except subprocess.TimeoutExpired:
+                instance.xvfb.kill()
+
+    @staticmethod
+    def _signal(pid, signum):
+        # Instances lead their own process group
+        try:
+            os.killpg(pid, signum)
+        except (ProcessLookupError, PermissionError):
+            pass
+
+    def _monitor_loop(self):
+        while not self._closed.wait(self.sample_interval):
+            self.sample()
+
+    def sample(self):
+        """Update every instance's metrics; stop dead, oversized and long-idle ones."""
+        with self._lock:
+            instances = [i for i in self.instances.values() if i.state in ('busy', 'idle')]
+        now = time.monotonic()
+        for instance in instances:
+            try:
+                ticks, rss = _cpu_ticks(instance.pid), _rss_bytes(instance.pid)
+            except (OSError, ValueError, IndexError):
+                if not _alive(instance.pid):
+                    print(f"kivy_supervisor: Instance {instance.id} ({instance.app}) exited", flush=True)
+                    self._stop(instance)
+                continue
+            try:
+                stats = self._stats(instance)
+            except (OSError, ValueError):
+                stats = None
+            previous = instance._sample
+            instance._sample = (now, ticks, stats['frames'] if stats else None)
+            instance.rss = rss
+            instance.viewers = stats['viewers'] if stats else None
+            if previous is not None and now > previous[0]:
+                elapsed = now - previous[0]
+                instance.cpu_percent = round((ticks - previous[1]) / CLOCK_TICKS / elapsed * 100, 1)
+                if stats and previous[2] is not None:
+                    instance.fps = round((stats['frames'] - previous[2]) / elapsed, 1)
+
+            if self.max_rss and rss > self.max_rss:
+                print(f"kivy_supervisor: Stopping instance {instance.id} ({instance.app}): "
+                      f"{rss // (1024 * 1024)} MB is over --max-rss-mb", flush=True)
+                self._stop(instance)
+            elif instance.state == 'idle' and self.idle_timeout and now - instance.last_used > self.idle_timeout:
+                self._stop(instance)
+
+    def list(self):
+        with self._lock:
+            return [instance.info(self.host) for instance in self.instances.values()]
+
+    def metrics(self):
+        """Prometheus text format."""
+        lines = []
+        instances = self.list()
+        for name, key, help_text in (
+            ('kivy_instance_cpu_percent', 'cpu_percent', 'CPU use of the instance'),
+            ('kivy_instance_rss_bytes', 'rss_mb', 'Resident memory of the instance'),
+            ('kivy_instance_fps', 'fps', 'Frames drawn per second'),
+            ('kivy_instance_viewers', 'viewers', 'Connected stream viewers'),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for info in instances:
+                value = info[key]
+                if value is None:
+                    continue
+                if key == 'rss_mb':
+                    value = int(value * 1024 * 1024)
+                lines.append(f'{name}{{id="{info["id"]}",app="{info["app"]}",state="{info["state"]}"}} {value}')
+        lines.append('# TYPE kivy_instances gauge')
+        lines.append(f"kivy_instances {len(instances)}")
+        return '\n'.join(lines) + '\n'
+
+    def close(self):
+        self._closed.set()
+        with self._lock:
+            instances = list(self.instances.values())
+        for instance in instances:
+            self._stop(instance)
+        self.zygote.close()
+
+
+class CapacityError(Exception):
+    """No room for another instance."""
+
+
+class ControlHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'kivy-supervisor'
+
+    def do_GET(self):
+        supervisor = self.server.supervisor
+        path = urlparse(self.path).path
+        if path == '/health':
+            self._send_json(200, {'status': 'ok', 'instances': len(supervisor.instances)})
+        elif path == '/instances':
+            self._send_json(200, {'instances': supervisor.list()})
+        elif path == '/metrics':
+            body = supervisor.metrics().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self._send_json(404, {'error': f"no such endpoint: {path}"})
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/instances':
+            self._send_json(404, {'error': f"no such endpoint: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            request = json.loads(self.rfile.read(length) or b'{}')
+            app = request['app']
+            session = request.get('session')
+            width = int(request['width']) if request.get('width') else None
+            height = int(request['height']) if request.get('height') else None
+            if not isinstance(app, str) or (session is not None and not isinstance(session, str)):
+                raise ValueError("'app' and 'session' must be strings")
+            instance = self.server.supervisor.allocate(app, session, width, height)
+        except (KeyError, TypeError, ValueError) as e:
+            self._send_json(400, {'error': f"bad request: {e}"})
+        except CapacityError as e:
+            self._send_json(503, {'error': str(e)})
+        except RuntimeError as e:
+            self._send_json(500, {'error': str(e)})
+        else:
+            self._send_json(201, instance.info(self.server.supervisor.host))
+
+    def do_DELETE(self):
+        url = urlparse(self.path)
+        prefix, _, instance_id = url.path.rpartition('/')
+        try:
+            if prefix != '/instances':
+                raise KeyError(url.path)
+            kill = parse_qs(url.query).get('kill', ['0'])[0] not in ('', '0')
+            self.server.supervisor.release(int(instance_id), kill=kill)
+        except (KeyError, ValueError):
+            self._send_json(404, {'error': f"no such instance: {url.path}"})
+        else:
+            self._send_json(200, {'released': int(instance_id)})
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def _port_range(value):
+    first, _, last = value.partition('-')
+    return int(first), int(last or first)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--control-host', default='127.0.0.1')
+    parser.add_argument('--control-port', type=int, default=8700)
+    parser.add_argument('--host', default='127.0.0.1', help='address the instances stream on')
+    parser.add_argument('--ports', type=_port_range, default=(6100, 6199), help='stream ports, e.g. 6100-6199')
+    parser.add_argument('--apps-dir', default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument('--display', choices=('offscreen', 'xvfb'), default='offscreen',
+                        help='SDL offscreen rendering, or one Xvfb display per instance')
+    parser.add_argument('--display-base', type=int, default=100, help='first Xvfb display number')
+    parser.add_argument('--max-instances', type=int, default=16)
+    parser.add_argument('--idle-timeout', type=float, default=300, help='seconds a released instance stays warm')
+    parser.add_argument('--max-rss-mb', type=float, default=0, help='stop instances above this (0 = no limit)')
+    parser.add_argument('--max-total-rss-mb', type=float, default=0,
+                        help='refuse new instances above this total (0 = no limit)')
+    parser.add_argument('--width', type=int, default=1024)
+    parser.add_argument('--height', type=int, default=768)
+    parser.add_argument('--fps', type=float, default=30, help='stream frame rate cap')
+    parser.add_argument('--codec', default='zlib', help='stream codec, see kivy_stream.py')
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    supervisor = Supervisor(
+        args.apps_dir, host=args.host, ports=args.ports, display=args.display, display_base=args.display_base,
+        max_instances=args.max_instances, idle_timeout=args.idle_timeout, max_rss_mb=args.max_rss_mb,
+        max_total_rss_mb=args.max_total_rss_mb, width=args.width, height=args.height, fps=args.fps,
+        codec=args.codec,
+    )
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        supervisor.start()
+        server = ThreadingHTTPServer((args.control_host, args.control_port), ControlHandler)
+        server.daemon_threads = True
+        server.supervisor = supervisor
+        server.verbose = args.verbose
+        print(f"kivy_supervisor: Listening on http://{args.control_host}:{server.server_address[1]} "
+              f"(apps in {supervisor.apps_dir})", flush=True)
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -9,6 +9,8 @@ from kivy.uix.button import Button
 from kivy.uix.label import Label
 import time
 
+import kivy_stream
+
 
 class TestApp(App):
     def build(self):
@@ -42,7 +44,7 @@ class TestApp(App):
         
         # Status label
         self.status_label = Label(
-            text='Status: Ready\nStreaming via VNC (no compression)',
+            text=kivy_stream.describe('Status: Ready\nStreaming via VNC (no compression)'),
             font_size='16sp',
             size_hint=(1, 0.3)
         )
@@ -60,4 +62,6 @@ class TestApp(App):
 
 
 if __name__ == '__main__':
+    # KIVY_STREAM=1 streams the app itself, see kivy_stream.py
+    kivy_stream.enable()
     TestApp().run()
@@ -9,6 +9,8 @@ from kivy.uix.button import Button
 from kivy.uix.label import Label
 import time
 
+import kivy_stream
+
 
 class TestApp2(App):
     def build(self):
@@ -44,7 +46,7 @@ class TestApp2(App):
         
         # Status label
         self.status_label = Label(
-            text='Status: Ready on :100\nInstance 2 - Port 6081',
+            text=kivy_stream.describe('Status: Ready on :100\nInstance 2 - Port 6081'),
             font_size='16sp',
             size_hint=(1, 0.3)
         )
@@ -62,4 +64,6 @@ class TestApp2(App):
 
 
 if __name__ == '__main__':
+    # KIVY_STREAM=1 streams the app itself, see kivy_stream.py
+    kivy_stream.enable()
     TestApp2().run()
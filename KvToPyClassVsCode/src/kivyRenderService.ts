@@ -2,8 +2,12 @@ import * as vscode from 'vscode';
 import * as path from 'path';
 import * as fs from 'fs';
 import * as http from 'http';
+import * as crypto from 'crypto';
 import { ChildProcess, spawn } from 'child_process';
 
+// Rendered previews kept in memory; the server keeps the full cache
+const MAX_CACHE_ENTRIES = 64;
+
 export class KivyRenderService {
     private static instance: KivyRenderService;
     private serverProcess: ChildProcess | null = null;
@@ -103,11 +107,15 @@ export class KivyRenderService {
         });
     }
     
-    async renderKivyCode(code: string): Promise<string | null> {
+    async renderKivyCode(code: string, session?: string): Promise<string | null> {
         // Check cache first
         const cacheKey = this.hashCode(code);
-        if (this.cache.has(cacheKey)) {
-            return this.cache.get(cacheKey)!;
+        const cached = this.cache.get(cacheKey);
+        if (cached !== undefined) {
+            // Map keeps insertion order: re-insert to mark as recently used
+            this.cache.delete(cacheKey);
+            this.cache.set(cacheKey, cached);
+            return cached;
         }
         
         if (!this.isReady) {
@@ -117,7 +125,8 @@ export class KivyRenderService {
         return new Promise((resolve) => {
             const postData = JSON.stringify({
                 code: code,
-                mode: 'screenshot'
+                mode: 'screenshot',
+                session: session
             });
             
             const options = {
@@ -145,6 +154,9 @@ export class KivyRenderService {
                         if (response.success && response.image) {
                             // Cache the result
                             this.cache.set(cacheKey, response.image);
+                            if (this.cache.size > MAX_CACHE_ENTRIES) {
+                                this.cache.delete(this.cache.keys().next().value!);
+                            }
                             resolve(response.image);
                         } else {
                             console.error('[KivyRender] Render failed:', response.error);
@@ -174,13 +186,7 @@ export class KivyRenderService {
     }
     
     private hashCode(str: string): string {
-        let hash = 0;
-        for (let i = 0; i < str.length; i++) {
-            const char = str.charCodeAt(i);
-            hash = ((hash << 5) - hash) + char;
-            hash = hash & hash; // Convert to 32bit integer
-        }
-        return hash.toString();
+        return crypto.createHash('sha256').update(str).digest('hex');
     }
     
     stop(): void {
@@ -29,12 +29,9 @@ export class KvWidgetHoverProvider implements vscode.HoverProvider {
             return undefined;
         }
         
-        // Create the complete Kivy app code
-        const kivyCode = this.createKivyApp(widgetCode.code);
-        
         try {
-            // Render the widget
-            const imageBase64 = await this.renderService.renderKivyCode(kivyCode);
+            // Render the widget; the document is the session, so edits re-render incrementally
+            const imageBase64 = await this.renderService.renderKivyCode(widgetCode.code, document.uri.toString());
             
             if (!imageBase64) {
                 return undefined;
@@ -73,7 +70,8 @@ export class KvWidgetHoverProvider implements vscode.HoverProvider {
         // Extract the entire widget block (all lines with greater indentation)
         const startLine = position.line;
         let endLine = startLine;
-        const lines: string[] = [lineText];
+        // The render server expects the widget as a root rule at column 0
+        const lines: string[] = [lineText.slice(baseIndent)];
         
         // Find all child lines
         for (let i = startLine + 1; i < document.lineCount; i++) {
@@ -92,7 +90,7 @@ export class KvWidgetHoverProvider implements vscode.HoverProvider {
                 break;
             }
             
-            lines.push(currentText);
+            lines.push(currentText.slice(baseIndent));
             endLine = i;
         }
         
@@ -101,23 +99,4 @@ export class KvWidgetHoverProvider implements vscode.HoverProvider {
         
         return { code, range, lineCount: lines.length };
     }
-    
-    private createKivyApp(kvCode: string): string {
-        // Wrap the KV code in a minimal Kivy app
-        return `from kivy.app import App
-from kivy.uix.widget import Widget
-from kivy.lang import Builder
-
-KV = '''
-${kvCode}
-'''
-
-class MyApp(App):
-    def build(self):
-        return Builder.load_string(KV)
-
-if __name__ == '__main__':
-    MyApp().run()
-`;
-    }
 }
@@ -7,8 +7,14 @@ from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.uix.label import Label
+import os
+import sys
 import time
 
+# kivy_stream lives next to the copies of these apps in kv_projs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kv_projs'))
+import kivy_stream  # noqa: E402
+
 
 class TestApp(App):
     def build(self):
@@ -42,7 +48,7 @@ class TestApp(App):
         
         # Status label
         self.status_label = Label(
-            text='Status: Ready\nStreaming via VNC (no compression)',
+            text=kivy_stream.describe('Status: Ready\nStreaming via VNC (no compression)'),
             font_size='16sp',
             size_hint=(1, 0.3)
         )
@@ -60,4 +66,6 @@ class TestApp(App):
 
 
 if __name__ == '__main__':
+    # KIVY_STREAM=1 streams the app itself, see kivy_stream.py
+    kivy_stream.enable()
     TestApp().run()
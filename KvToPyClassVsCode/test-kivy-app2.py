@@ -7,8 +7,14 @@ from kivy.app import App
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.button import Button
 from kivy.uix.label import Label
+import os
+import sys
 import time
 
+# kivy_stream lives next to the copies of these apps in kv_projs
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kv_projs'))
+import kivy_stream  # noqa: E402
+
 
 class TestApp2(App):
     def build(self):
@@ -44,7 +50,7 @@ class TestApp2(App):
         
         # Status label
         self.status_label = Label(
-            text='Status: Ready on :100\nInstance 2 - Port 6081',
+            text=kivy_stream.describe('Status: Ready on :100\nInstance 2 - Port 6081'),
             font_size='16sp',
             size_hint=(1, 0.3)
         )
@@ -62,4 +68,6 @@ class TestApp2(App):
 
 
 if __name__ == '__main__':
+    # KIVY_STREAM=1 streams the app itself, see kivy_stream.py
+    kivy_stream.enable()
     TestApp2().run()
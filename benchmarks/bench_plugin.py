@@ -0,0 +1,366 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the pyswiftkit_demo MkDocs plugin.
+
+Builds a synthetic project in a temporary directory (a copy of
+mkdocs_plugin/ next to generated demo bundles and pages, since the plugin
+resolves its demo directories relative to its own location) and measures:
+
+- build:  a cold `mkdocs build` (empty caches) and repeated warm builds,
+          reported as builds/s, with the on_post_build and on_page_content
+          totals taken from the plugin's own trace (see instrument.py);
+- serve:  `mkdocs serve` under a local HTTP load generator fetching demo
+          assets over keep-alive connections, reported as requests/s and
+          p50/p99 latency;
+- peak RSS of the build and serve processes.
+
+Results are compared against a stored baseline (benchmarks/baseline.json)
+and the exit status is 1 when a metric regressed by more than the
+tolerance, so the script can gate CI. Baselines are machine-specific and
+not committed: record one on the reference commit first. Without one the
+exit status is 2, unless --no-baseline asks for a report only:
+
+    python benchmarks/bench_plugin.py --save-baseline
+    python benchmarks/bench_plugin.py --demo-files 40 --file-kb 256 --pages 200
+    python benchmarks/bench_plugin.py --no-baseline
+"""
+
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import report
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'baseline.json'
+
+# (demo_path, wasm_name) as configured in the plugin's on_config
+DEMO_DIRS = [
+    ('demo', 'PySwiftKitDemo'),
+    ('docs/swift-to-python', 'SwiftToPythonDemo'),
+    ('docs/python-to-swift', 'PythonToSwiftDemo'),
+    ('docs/python-datamodel', 'PyDataModelDemo'),
+    ('docs/kv-ast-tree', 'KvAstTree'),
+    ('docs/kv-swiftui', 'KvSwiftUIDemo'),
+    ('docs/kv-datamodel', 'KvToDataModelDemo'),
+    ('docs/kv-to-pyclass', 'KvToPyClassDemo'),
+]
+
+# Metric -> True if higher is better
+METRICS = {
+    'cold_build_s': False,
+    'warm_builds_per_s': True,
+    'post_build_ms': False,
+    'page_content_ms': False,
+    'build_peak_rss_mb': False,
+    'serve_requests_per_s': True,
+    'serve_p50_ms': False,
+    'serve_p99_ms': False,
+    'serve_peak_rss_mb': False,
+}
+
+# Runs mkdocs with the copied plugin registered, like an installed entry point
+RUNNER = '''
+import json, os, resource, sys, time
+sys.path.insert(0, os.getcwd())
+from importlib.metadata import EntryPoint
+import mkdocs.plugins
+
+_get_plugins = mkdocs.plugins.get_plugins
+def get_plugins():
+    plugins = dict(_get_plugins())
+    plugins['pyswiftkit_demo'] = EntryPoint(
+        'pyswiftkit_demo', 'mkdocs_plugin:PySwiftKitDemoPlugin', 'mkdocs.plugins')
+    return plugins
+mkdocs.plugins.get_plugins = get_plugins
+
+def peak_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / 1024 if sys.platform == 'darwin' else rss / 1024
+
+mode = sys.argv[1]
+if mode == 'build':
+    from mkdocs.commands.build import build
+    from mkdocs.config import load_config
+    durations = []
+    for _ in range(int(sys.argv[2])):
+        config = load_config('mkdocs.yml', site_dir='site')
+        started = time.perf_counter()
+        build(config)
+        durations.append(time.perf_counter() - started)
+    print(json.dumps({'durations': durations, 'peak_rss_mb': peak_rss_mb()}))
+else:
+    from mkdocs.commands.serve import serve
+    serve('mkdocs.yml', dev_addr=sys.argv[2])
+'''
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--demo-files', type=int, default=20, help='asset files per demo bundle')
+    parser.add_argument('--file-kb', type=int, default=128, help='size of each asset file in KB')
+    parser.add_argument('--wasm-mb', type=float, default=1.0, help='size of each demo WASM module in MB')
+    parser.add_argument('--pages', type=int, default=50, help='extra Markdown pages')
+    parser.add_argument('--embed-every', type=int, default=5,
+                        help='every Nth page embeds a demo and gets the editor snippet')
+    parser.add_argument('--warm-builds', type=int, default=3)
+    parser.add_argument('--requests', type=int, default=2000, help='total serve requests')
+    parser.add_argument('--concurrency', type=int, default=16, help='parallel keep-alive clients')
+    parser.add_argument('--plugin-option', action='append', default=[], metavar='KEY=VALUE',
+                        help='extra pyswiftkit_demo option (YAML value), repeatable')
+    parser.add_argument('--skip-serve', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    report.add_arguments(parser, DEFAULT_BASELINE)
+    parser.add_argument('--keep', action='store_true', help='keep the synthetic project')
+    return parser.parse_args(argv)
+
+
+def make_project(root, args):
+    """Lay out the plugin, demo bundles and pages under root."""
+    rng = random.Random(args.seed)
+    shutil.copytree(REPO_ROOT / 'mkdocs_plugin', root / 'mkdocs_plugin',
+                    ignore=shutil.ignore_patterns('__pycache__'))
+    docs = root / 'docs'
+    docs.mkdir()
+
+    # Half-compressible filler: random words, like minified JS
+    words = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 9)))
+             for _ in range(2000)]
+
+    def text(size):
+        out = []
+        length = 0
+        while length < size:
+            word = rng.choice(words)
+            out.append(word)
+            length += len(word) + 1
+        return ' '.join(out)[:size]
+
+    for demo_path, wasm_name in DEMO_DIRS:
+        demo_dir = root / demo_path
+        (demo_dir / 'platforms').mkdir(parents=True)
+        (demo_dir / 'index.html').write_text(
+            f'<html><body><script type="module" src="./index.js"></script>{text(2048)}</body></html>')
+        (demo_dir / 'index.js').write_text(
+            f'import "./instantiate.js";\nfetch("./{wasm_name}.wasm");\n// {text(4096)}\n')
+        (demo_dir / 'instantiate.js').write_text(f'export const name = "{wasm_name}";\n// {text(8192)}\n')
+        for index in range(args.demo_files):
+            (demo_dir / 'platforms' / f'chunk{index}.js').write_text(text(args.file_kb * 1024))
+        # WASM modules are mostly incompressible
+        wasm = b'\0asm\x01\0\0\0' + os.urandom(int(args.wasm_mb * 1024 * 1024))
+        (demo_dir / f'{wasm_name}.wasm').write_bytes(wasm)
+
+    nav = ['  - Home: index.md']
+    (docs / 'index.md').write_text('# Benchmark\n\n' + text(2000))
+    (docs / 'demo.md').write_text('# Demo\n\n<div id="app"></div>\n')
+    nav.append('  - Demo: demo.md')
+    for index in range(args.pages):
+        body = f'# Page {index}\n\n' + '\n\n'.join(text(400) for _ in range(5))
+        if args.embed_every and index % args.embed_every == 0:
+            demo_path, _ = DEMO_DIRS[1 + index % (len(DEMO_DIRS) - 1)]
+            body += f'\n\n<iframe src="../{demo_path[5:]}/index.html"></iframe>\n'
+            name = f'playground-{index}.md'
+        else:
+            name = f'page-{index}.md'
+        (docs / name).write_text(body)
+        nav.append(f'  - Page {index}: {name}')
+
+    options = ''.join(f'\n      {option.partition("=")[0]}: {option.partition("=")[2]}'
+                      for option in args.plugin_option)
+    (root / 'mkdocs.yml').write_text(
+        'site_name: Benchmark\n'
+        'theme:\n  name: readthedocs\n'
+        'plugins:\n  - pyswiftkit_demo:\n      wasm_path: demo\n      instrument: true' + options + '\n'
+        'nav:\n' + '\n'.join(nav) + '\n'
+    )
+    (root / 'run_mkdocs.py').write_text(RUNNER)
+
+
+def run_builds(root, args):
+    """Cold build, then warm builds, each in one fresh process."""
+    cold = _run_build_process(root, 1)
+    warm = _run_build_process(root, args.warm_builds)
+    trace = json.loads((root / '.cache' / 'pyswiftkit' / 'trace.json').read_text())['summary']
+    calls = max(args.warm_builds, 1)
+    return {
+        'cold_build_s': round(cold['durations'][0], 3),
+        'warm_builds_per_s': round(len(warm['durations']) / sum(warm['durations']), 3),
+        'post_build_ms': round(trace['on_post_build']['total_ms'] / calls, 2),
+        'page_content_ms': round(trace['on_page_content']['total_ms'] / calls, 2),
+        'build_peak_rss_mb': round(max(cold['peak_rss_mb'], warm['peak_rss_mb']), 1),
+    }
+
+
+def _run_build_process(root, rounds):
+    result = subprocess.run([sys.executable, 'run_mkdocs.py', 'build', str(rounds)], cwd=root,
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.exit(f"mkdocs build failed:\n{result.stdout[-3000:]}\n{result.stderr[-3000:]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def run_serve(root, args):
+    """Start `mkdocs serve` and fetch demo assets from `concurrency` clients."""
+    port = free_port()
+    process = subprocess.Popen([sys.executable, 'run_mkdocs.py', 'serve', f'127.0.0.1:{port}'],
+                               cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        _wait_until_up(port, process)
+        paths = []
+        for demo_path, wasm_name in DEMO_DIRS:
+            rel = demo_path[5:] if demo_path.startswith('docs/') else demo_path
+            paths += [f'/{rel}/index.js', f'/{rel}/instantiate.js', f'/{rel}/{wasm_name}.wasm',
+                      f'/{rel}/platforms/chunk0.js']
+        latencies, errors, elapsed = load(port, paths, args.requests, args.concurrency)
+        peak_rss = _peak_rss_mb(process.pid)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    latencies.sort()
+    results = {
+        'serve_requests_per_s': round(len(latencies) / elapsed, 1),
+        'serve_p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'serve_p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'serve_errors': errors,
+    }
+    if peak_rss is not None:
+        results['serve_peak_rss_mb'] = peak_rss
+    return results
+
+
+def _wait_until_up(port, process, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit("mkdocs serve exited during startup")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/')
+            connection.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    sys.exit("mkdocs serve did not start")
+
+
+def _peak_rss_mb(pid):
+    """VmHWM of a running process (Linux only)."""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+def load(port, paths, total, concurrency):
+    """
+    Fetch `total` requests round-robin over paths from `concurrency`
+    keep-alive connections. Returns (latencies, errors, elapsed seconds).
+    """
+    encodings = ['br, gzip', 'gzip', 'zstd, gzip', '']
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    counter = iter(range(total))
+
+    def client(index):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        local = []
+        while True:
+            with lock:
+                number = next(counter, None)
+            if number is None:
+                break
+            path = paths[number % len(paths)]
+            started = time.perf_counter()
+            try:
+                connection.request('GET', path, headers={
+                    'Accept-Encoding': encodings[(number + index) % len(encodings)]})
+                response = connection.getresponse()
+                response.read()
+                # The optional async server answers .wasm with a redirect
+                if response.status == 307:
+                    location = response.getheader('Location')
+                    redirected = http.client.HTTPConnection(*location.split('/')[2].split(':'), timeout=30)
+                    redirected.request('GET', '/' + location.split('/', 3)[3])
+                    response = redirected.getresponse()
+                    response.read()
+                    redirected.close()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                ok = False
+            if ok:
+                local.append(time.perf_counter() - started)
+            else:
+                with lock:
+                    errors[0] += 1
+        connection.close()
+        with lock:
+            latencies.extend(local)
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0], time.perf_counter() - started
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    root = Path(tempfile.mkdtemp(prefix='pyswiftkit-bench-'))
+    try:
+        make_project(root, args)
+        results = {'parameters': {
+            'demo_files': args.demo_files, 'file_kb': args.file_kb, 'wasm_mb': args.wasm_mb,
+            'pages': args.pages, 'requests': args.requests, 'concurrency': args.concurrency,
+            'plugin_options': args.plugin_option,
+        }}
+        results.update(run_builds(root, args))
+        if not args.skip_serve:
+            results.update(run_serve(root, args))
+    finally:
+        if args.keep:
+            print(f"Synthetic project kept at {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    return report.report(args, results, METRICS)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Time-to-first-frame benchmark for the Kivy test apps.
+
+Launches each app a few times under kivy_startup.py (the startup profiler
+in KvToPyClassVsCode/kv_projs, which stops the app after its first frame)
+and reports the median time from process start to the first frame, with
+the time spent importing modules before it and in the app's own build().
+
+Results are compared against a stored baseline
+(benchmarks/startup_baseline.json) and the exit status is 1 when the time
+to first frame grew by more than the tolerance, so the script can gate CI.
+As with bench_plugin.py, baselines are not committed and a missing one
+exits 2 unless --no-baseline asks for a report only:
+
+    python benchmarks/bench_startup.py --save-baseline
+    python benchmarks/bench_startup.py --runs 9 --tolerance 0.15
+    python benchmarks/bench_startup.py --module kvtestsone --pythonpath KvToPyClassVsCode/kv_projs/KvTestsOne/src
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import report
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+KV_PROJS = REPO_ROOT / 'KvToPyClassVsCode' / 'kv_projs'
+
+DEFAULT_BASELINE = Path(__file__).resolve().parent / 'startup_baseline.json'
+DEFAULT_APPS = ['test-kivy-app.py', 'test-kivy-app2.py']
+
+sys.path.insert(0, str(KV_PROJS))
+import kivy_startup  # noqa: E402
+
+# Metric suffix -> its value in a kivy_startup.profile() result (lower is better)
+METRICS = {
+    'first_frame_ms': lambda result: result['first_frame_ms'],
+    'imports_ms': lambda result: sum(result['phase_imports'].values()),
+    'build_ms': lambda result: result['phases'].get('build', 0.0),
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--app', action='append', default=[], metavar='SCRIPT',
+                        help=f"app script to launch, relative to kv_projs (default: {', '.join(DEFAULT_APPS)})")
+    parser.add_argument('--module', action='append', default=[], help='app module to launch (python -m)')
+    parser.add_argument('--pythonpath', action='append', default=[], help='extra sys.path entry for the apps')
+    parser.add_argument('--runs', type=int, default=5, help='launches per app (medians are compared)')
+    parser.add_argument('--timeout', type=float, default=kivy_startup.DEFAULT_TIMEOUT)
+    report.add_arguments(parser, DEFAULT_BASELINE)
+    return parser.parse_args(argv)
+
+
+def run_apps(args):
+    env = dict(os.environ)
+    if args.pythonpath:
+        paths = [str(Path(path).resolve()) for path in args.pythonpath]
+        env['PYTHONPATH'] = os.pathsep.join(paths + ([env['PYTHONPATH']] if env.get('PYTHONPATH') else []))
+    targets = [(str(KV_PROJS / app), Path(app).stem, False) for app in args.app or
+               ([] if args.module else DEFAULT_APPS)]
+    targets += [(module, module, True) for module in args.module]
+
+    results = {}
+    for target, name, module in targets:
+        result = kivy_startup.profile(target, runs=args.runs, module=module, env=env, timeout=args.timeout)
+        for suffix, value in METRICS.items():
+            results[f'{name}.{suffix}'] = round(value(result), 1)
+        slowest = sorted(((timing['cumulative_ms'], module_name) for module_name, timing in result['imports'].items()
+                          if timing['depth'] == 0), reverse=True)[:5]
+        print(f"{name}: " + ', '.join(f'{module_name} {ms:.0f} ms' for ms, module_name in slowest))
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {'parameters': {'runs': args.runs, 'python': sys.version.split()[0]}}
+    try:
+        results.update(run_apps(args))
+    except RuntimeError as e:
+        print(f"kivy_startup: {e}")
+        return 1
+
+    # Only time to first frame gates; the others show where it went
+    metrics = {metric: False for metric in results if metric != 'parameters'}
+    return report.report(args, results, metrics, gated=lambda metric: metric.endswith('.first_frame_ms'))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
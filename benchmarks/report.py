@@ -0,0 +1,74 @@
+"""
+Baseline comparison shared by the benchmark scripts.
+
+add_arguments() adds the --baseline, --save-baseline, --no-baseline,
+--tolerance and --json options, and report() prints a run next to the
+stored baseline and returns the exit status: 0, 1 when a gated metric
+regressed by more than the tolerance, or 2 when there is no baseline to
+compare to (baselines depend on the machine and are not committed).
+"""
+
+import json
+import sys
+from pathlib import Path
+
+
+def add_arguments(parser, default_baseline):
+    parser.add_argument('--baseline', type=Path, default=default_baseline)
+    parser.add_argument('--save-baseline', action='store_true', help='store this run as the baseline')
+    parser.add_argument('--no-baseline', action='store_true', help='only report, without a baseline to compare to')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed relative regression before failing (default 0.25)')
+    parser.add_argument('--json', type=Path, help='also write the results to this file')
+
+
+def compare(results, baseline, tolerance, metrics, gated=None):
+    """
+    Print results next to the baseline. `metrics` maps the metrics to show,
+    in order, to True if higher is better; `gated(metric)` says whether a
+    metric can fail the run (default: all). Returns the regressed metrics.
+    """
+    width = max([22] + [len(metric) + 2 for metric in metrics])
+    regressions = []
+    print(f"{'metric':<{width}} {'value':>12} {'baseline':>12} {'change':>9}")
+    for metric, higher_is_better in metrics.items():
+        if metric not in results:
+            continue
+        value = results[metric]
+        base = baseline.get(metric)
+        if not base:
+            print(f"{metric:<{width}} {value:>12} {'-':>12}")
+            continue
+        change = (value - base) / base
+        worse = -change if higher_is_better else change
+        flag = '  REGRESSION' if worse > tolerance and (gated is None or gated(metric)) else ''
+        if flag:
+            regressions.append(metric)
+        print(f"{metric:<{width}} {value:>12} {base:>12} {change:>+8.1%}{flag}")
+    return regressions
+
+
+def report(args, results, metrics, gated=None):
+    """Compare `results` with the baseline and save them as asked. Returns the exit status."""
+    baseline = {}
+    missing = not args.no_baseline and not args.baseline.exists()
+    if not args.no_baseline and not missing:
+        baseline = json.loads(args.baseline.read_text())
+        if baseline.get('parameters') != results['parameters']:
+            print(f"Note: baseline was recorded with different parameters: {baseline.get('parameters')}")
+    regressions = compare(results, baseline, args.tolerance, metrics, gated)
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        args.baseline.write_text(json.dumps(results, indent=2) + '\n')
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+    if missing:
+        print(f"No baseline at {args.baseline}, nothing was checked. Record one with --save-baseline "
+              f"on the reference commit, or pass --no-baseline to only report.", file=sys.stderr)
+        return 2
+    if regressions:
+        print(f"Regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
@@ -0,0 +1,350 @@
+"""
+Async asset server for `mkdocs serve`.
+
+LiveReloadServer is a threaded WSGI server that hands every response to
+wsgiref as one bytes object, so a multi-megabyte WASM bundle is held in
+memory and written by one thread per download. With `async_server`, the
+plugin also starts an asyncio server on its own port and redirects
+`.wasm` requests to it:
+
+- AssetApp is a plain ASGI application serving the site directory with
+  the same negotiation, caching and COOP/COEP headers as serve.py. Bodies
+  are sent from the file with the `http.response.zerocopysend` extension
+  when the server offers it, and in chunks otherwise, so it also runs
+  under any ASGI server (e.g. `uvicorn`).
+- AsyncAssetServer is a small HTTP/1.1 server on asyncio streams that
+  offers zerocopysend through `loop.sendfile()` (os.sendfile on Linux and
+  macOS), keeps connections alive and handles downloads concurrently on a
+  single thread.
+"""
+
+import asyncio
+import mimetypes
+import os
+import posixpath
+import threading
+from email.utils import formatdate
+from urllib.parse import unquote
+
+from .serve import (
+    CONTENT_TYPES,
+    CROSS_ORIGIN_HEADERS,
+    ENCODINGS,
+    FINGERPRINT_RE,
+    IMMUTABLE,
+    RANGE_NOT_SATISFIABLE,
+    REVALIDATE,
+    decompress,
+    file_signature,
+    negotiate,
+    not_modified,
+    parse_range,
+)
+
+ZEROCOPY = 'http.response.zerocopysend'
+
+CHUNK_SIZE = 256 * 1024
+
+# Pages on the dev server's origin load these assets cross-origin
+CORS_HEADERS = [
+    ("Access-Control-Allow-Origin", "*"),
+    ("Cross-Origin-Resource-Policy", "cross-origin"),
+]
+
+MAX_HEADER_BYTES = 64 * 1024
+
+KEEP_ALIVE_TIMEOUT = 15
+
+REASONS = {
+    200: 'OK', 206: 'Partial Content', 304: 'Not Modified', 400: 'Bad Request',
+    404: 'Not Found', 405: 'Method Not Allowed', 416: 'Range Not Satisfiable',
+}
+
+
+class AssetApp:
+    """
+    ASGI application serving files below `root` at `mount_path`.
+
+    wait_ready, if given, is a blocking callable run before each response
+    (e.g. waiting for a site rebuild to finish); it runs in a thread.
+    """
+
+    def __init__(self, root, mount_path='/', wait_ready=None):
+        self.root = os.path.abspath(root)
+        self.mount_path = mount_path
+        self.wait_ready = wait_ready
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while (await receive())['type'] != 'lifespan.shutdown':
+                pass
+            return
+        if scope['type'] != 'http':
+            return
+        if scope['method'] not in ('GET', 'HEAD'):
+            return await self._error(send, 405)
+
+        file_path = self._file_path(scope['path'])
+        if file_path is None:
+            return await self._error(send, 404)
+        if self.wait_ready is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.wait_ready)
+
+        headers = {name.decode('latin-1').lower(): value.decode('latin-1')
+                   for name, value in scope.get('headers', [])}
+        environ = {
+            'HTTP_' + name.upper().replace('-', '_'): value
+            for name, value in headers.items()
+            if name in ('if-none-match', 'if-modified-since', 'range', 'if-range')
+        }
+        selected = self._select(file_path, headers.get('accept-encoding', ''))
+        if selected is None:
+            return await self._error(send, 404)
+        path, signature, encoding, body = selected
+        mtime_ns, size, _ = signature
+        if body is not None:
+            size = len(body)
+
+        ext = posixpath.splitext(file_path)[1]
+        etag = f'"{mtime_ns:x}-{size:x}{"-" + encoding if encoding else ""}"'
+        response_headers = [
+            ("Content-Type", CONTENT_TYPES.get(ext) or mimetypes.guess_type(file_path)[0]
+             or 'application/octet-stream'),
+            ("Vary", "Accept-Encoding"),
+            ("ETag", etag),
+            ("Last-Modified", formatdate(mtime_ns / 1e9, usegmt=True)),
+            ("Cache-Control", IMMUTABLE if FINGERPRINT_RE.search(file_path) else REVALIDATE),
+            ("Accept-Ranges", "bytes"),
+        ] + CROSS_ORIGIN_HEADERS + CORS_HEADERS
+        if encoding:
+            response_headers.insert(1, ("Content-Encoding", encoding))
+
+        if not_modified(environ, etag, mtime_ns):
+            return await self._start(send, 304, [h for h in response_headers
+                                                 if h[0] not in ('Content-Type', 'Content-Encoding',
+                                                                 'Accept-Ranges')], body=b'')
+
+        status, start, end = 200, 0, size
+        byte_range = parse_range(environ, etag, mtime_ns, size)
+        if byte_range is RANGE_NOT_SATISFIABLE:
+            return await self._start(send, 416, response_headers + [
+                ("Content-Range", f"bytes */{size}"), ("Content-Length", "0")], body=b'')
+        if byte_range is not None:
+            status, (start, end) = 206, byte_range
+            response_headers.append(("Content-Range", f"bytes {start}-{end - 1}/{size}"))
+
+        response_headers.append(("Content-Length", str(end - start)))
+        if scope['method'] == 'HEAD':
+            return await self._start(send, status, response_headers, body=b'')
+        if body is not None:
+            return await self._start(send, status, response_headers, body=body[start:end])
+
+        await self._start(send, status, response_headers)
+        with open(path, 'rb') as f:
+            if ZEROCOPY in scope.get('extensions', {}):
+                await send({'type': ZEROCOPY, 'file': f, 'offset': start, 'count': end - start,
+                            'more_body': False})
+                return
+            f.seek(start)
+            remaining = end - start
+            while remaining:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': remaining > 0})
+            if remaining:
+                await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    def _file_path(self, path):
+        if not (path + '/').startswith(self.mount_path):
+            return None
+        rel_path = path[len(self.mount_path):]
+        if path.endswith('/'):
+            rel_path += 'index.html'
+        # Normalize to prevent directory traversal, as LiveReloadServer does
+        rel_path = posixpath.normpath('/' + rel_path).lstrip('/')
+        return os.path.join(self.root, rel_path)
+
+    @staticmethod
+    def _select(file_path, accept_encoding):
+        """
+        Pick what to send: (path, signature, encoding, body). body is None
+        when the file is sent as-is, or the decompressed bytes when the
+        client accepts none of the precompressed siblings of a missing file.
+        """
+        plain = file_signature(file_path)
+        siblings = {}
+        for name, suffix in ENCODINGS:
+            signature = file_signature(file_path + suffix)
+            if signature is not None:
+                siblings[name] = (file_path + suffix, signature)
+        for encoding in negotiate(accept_encoding):
+            if encoding in siblings:
+                return siblings[encoding] + (encoding, None)
+        if plain is not None:
+            return file_path, plain, None, None
+        for name, (path, signature) in siblings.items():
+            with open(path, 'rb') as f:
+                body = decompress(f.read(), name)
+            if body is not None:
+                return path, signature, None, body
+        return None
+
+    @staticmethod
+    async def _start(send, status, headers, body=None):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.encode('latin-1'), value.encode('latin-1')) for name, value in headers],
+        })
+        if body is not None:
+            await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+
+    async def _error(self, send, status):
+        body = f"{status} {REASONS[status]}".encode()
+        await self._start(send, status, [("Content-Type", "text/plain"),
+                                         ("Content-Length", str(len(body)))] + CORS_HEADERS, body=body)
+
+
+class AsyncAssetServer:
+    """
+    Run an ASGI app on a minimal keep-alive HTTP/1.1 server in a
+    background thread. Only GET/HEAD without request bodies are expected.
+    """
+
+    def __init__(self, app, host='127.0.0.1', port=0):
+        self.app = app
+        self.host = host
+        self.port = port
+        self._loop = None
+        self._server = None
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='pyswiftkit-asgi', daemon=True)
+        self._error = None
+
+    @property
+    def url(self):
+        host = f"[{self.host}]" if ':' in self.host else self.host
+        return f"http://{host}:{self.port}"
+
+    def start(self):
+        self._thread.start()
+        self._started.wait()
+        if self._error is not None:
+            raise self._error
+
+    def stop(self):
+        if self._loop is not None and self._server is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._server = self._loop.run_until_complete(
+                asyncio.start_server(self._handle, self.host, self.port, limit=MAX_HEADER_BYTES))
+            self.port = self._server.sockets[0].getsockname()[1]
+        except OSError as e:
+            self._error = e
+            self._started.set()
+            return
+        self._started.set()
+        try:
+            self._loop.run_until_complete(self._server.serve_forever())
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._loop.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            while await self._handle_request(reader, writer):
+                pass
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError,
+                ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _handle_request(self, reader, writer):
+        """Serve one request. Returns True if the connection stays open."""
+        head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE_TIMEOUT)
+        lines = head[:-4].split(b'\r\n')
+        try:
+            method, target, version = lines[0].decode('latin-1').split(' ')
+        except ValueError:
+            await self._write_error(writer, 400)
+            return False
+        headers = []
+        for line in lines[1:]:
+            name, _, value = line.partition(b':')
+            headers.append((name.strip().lower(), value.strip()))
+        header_map = dict(headers)
+
+        length = int(header_map.get(b'content-length', b'0') or 0)
+        if length:
+            await reader.readexactly(length)
+        connection = header_map.get(b'connection', b'').lower()
+        keep_alive = connection != b'close' if version == 'HTTP/1.1' else connection == b'keep-alive'
+
+        path, _, query = target.partition('?')
+        peer = writer.get_extra_info('peername')
+        scope = {
+            'type': 'http',
+            'asgi': {'version': '3.0', 'spec_version': '2.3'},
+            'http_version': version.partition('/')[2],
+            'method': method,
+            'scheme': 'http',
+            'path': unquote(path),
+            'raw_path': path.encode('latin-1'),
+            'query_string': query.encode('latin-1'),
+            'root_path': '',
+            'headers': headers,
+            'client': peer[:2] if peer else None,
+            'server': (self.host, self.port),
+            'extensions': {ZEROCOPY: {}},
+        }
+        loop = asyncio.get_running_loop()
+        state = {'chunked': False}
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response_headers = [(name.decode('latin-1'), value.decode('latin-1'))
+                                    for name, value in message.get('headers', [])]
+                names = {name.lower() for name, _ in response_headers}
+                if 'content-length' not in names and method != 'HEAD':
+                    response_headers.append(('Transfer-Encoding', 'chunked'))
+                    state['chunked'] = True
+                response_headers.append(('Connection', 'keep-alive' if keep_alive else 'close'))
+                status = message['status']
+                out = [f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"]
+                out += [f"{name}: {value}\r\n" for name, value in response_headers]
+                writer.write(''.join(out).encode('latin-1') + b'\r\n')
+            elif message['type'] == 'http.response.body':
+                body = message.get('body', b'')
+                if state['chunked']:
+                    if body:
+                        writer.write(b'%x\r\n%s\r\n' % (len(body), body))
+                    if not message.get('more_body'):
+                        writer.write(b'0\r\n\r\n')
+                elif body:
+                    writer.write(body)
+                await writer.drain()
+            elif message['type'] == ZEROCOPY:
+                await writer.drain()
+                await loop.sendfile(writer.transport, message['file'],
+                                    message.get('offset') or 0, message.get('count'))
+
+        await self.app(scope, receive, send)
+        await writer.drain()
+        return keep_alive
+
+    @staticmethod
+    async def _write_error(writer, status):
+        body = f"{status} {REASONS[status]}".encode()
+        writer.write(f"HTTP/1.1 {status} {REASONS[status]}\r\nContent-Length: {len(body)}\r\n"
+                     f"Connection: close\r\n\r\n".encode() + body)
+        await writer.drain()
@@ -0,0 +1,253 @@
+"""
+Build-time compression of demo assets.
+
+Writes `.gz`, `.br` and `.zst` variants next to every WASM/JS asset in the
+site output so static hosts (and the dev server, see serve.py) can send
+precompressed files. A `.wasm` shipped only as `.wasm.gz` by build.sh is
+left as it is: its loader fetches the `.gz` itself.
+
+Compressed outputs are stored in a content-addressed cache
+(`<cache_dir>/compressed/<sha256>.<encoding><level>`), so an unchanged
+input is never compressed twice; it is only linked back into the site.
+
+Levels default to ones that keep a cold build fast (brotli 9 and zstd 12
+are 20-40x faster than 11 and 19, for 5-10% larger files); MAX_LEVELS is
+for deploy builds (`compression_max`).
+
+A JSON size/ratio report is written for each demo. Its totals are per
+encoding, over the assets that have that variant: small files, files a
+codec can't shrink and gzip-only `.wasm.gz` bundles have no `.br`/`.zst`.
+"""
+
+import gzip
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from .serve import ENCODINGS, brotli, zstandard
+from .sync import format_size, place_file
+
+COMPRESSIBLE = ('.wasm', '.js')
+
+# Tiny files gain nothing from a compressed variant
+MIN_SIZE = 1024
+
+REPORT_NAME = 'compression-report.json'
+
+# encoding -> level
+LEVELS = {'gzip': 9, 'br': 9, 'zstd': 12}
+MAX_LEVELS = {'gzip': 9, 'br': 11, 'zstd': 19}
+
+
+def build_compress(data, encoding, level):
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=level)
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return None
+
+
+def supported_encodings(requested):
+    """Filter the configured formats down to the codecs that are installed."""
+    available = {'gzip', 'br' if brotli is not None else None, 'zstd' if zstandard is not None else None}
+    return [name for name, _ in ENCODINGS if name in requested and name in available]
+
+
+class AssetCompressor:
+    """
+    Compress the WASM/JS assets of one or more demo output directories.
+    Safe to share between threads; every asset is handled independently.
+    """
+
+    def __init__(self, cache_dir, manifest, encodings, use_links=True, levels=LEVELS):
+        self.cache_dir = Path(cache_dir) / 'compressed'
+        self.manifest = manifest
+        self.encodings = encodings
+        self.levels = levels
+        self.use_links = use_links
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def find_assets(self, root, exclude=()):
+        """
+        Return (asset_path, source_path, source_encoding) for every compressible asset.
+
+        An asset whose plain file is missing but has a `.gz` sibling (the
+        layout build.sh produces for `.wasm`) is reported with that sibling
+        as its source. Directories in `exclude` are skipped.
+        """
+        exclude = {os.path.normpath(path) for path in exclude}
+        assets = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = sorted(name for name in dirnames
+                                 if os.path.normpath(os.path.join(dirpath, name)) not in exclude)
+            names = set(filenames)
+            for name in sorted(filenames):
+                path = os.path.join(dirpath, name)
+                if name.endswith(COMPRESSIBLE):
+                    assets.append((path, path, None))
+                elif name.endswith(tuple(ext + '.gz' for ext in COMPRESSIBLE)) and name[:-3] not in names:
+                    assets.append((path[:-3], path, 'gzip'))
+        return assets
+
+    def compress_asset(self, asset_path, source_path, source_encoding):
+        """
+        Write every configured variant of one asset.
+        Returns (report_entry, cache_hits, cache_misses).
+        """
+        st = os.stat(source_path)
+        digest = self.manifest.digest(source_path, st)
+        original_size = self._original_size(source_path, source_encoding, st)
+        data = None
+        hits = misses = 0
+        variants = {}
+
+        for encoding, suffix in ENCODINGS:
+            if encoding not in self.encodings:
+                continue
+            if encoding == source_encoding:
+                # build.sh already produced this variant
+                variants[encoding] = st.st_size
+                continue
+            if source_encoding is not None:
+                # build.sh's loader fetches the .gz and inflates it in the
+                # browser, so other variants would never be requested
+                continue
+            if original_size < MIN_SIZE:
+                continue
+
+            name = f"{digest}.{encoding}{self.levels[encoding]}"
+            cached = self.cache_dir / name
+            if cached.exists():
+                hits += 1
+            else:
+                misses += 1
+                if data is None:
+                    data = Path(source_path).read_bytes()
+                tmp = self.cache_dir / f"{name}.{os.getpid()}-{threading.get_ident()}.tmp"
+                tmp.write_bytes(build_compress(data, encoding, self.levels[encoding]))
+                os.replace(tmp, cached)
+
+            size = cached.stat().st_size
+            if size >= original_size:
+                continue
+            place_file(str(cached), asset_path + suffix, self.use_links)
+            variants[encoding] = size
+
+        entry = {
+            'size': original_size,
+            'sha256': digest,
+            'variants': {
+                encoding: {
+                    'size': size,
+                    'ratio': round(size / original_size, 4) if original_size else 1.0,
+                }
+                for encoding, size in variants.items()
+            },
+        }
+        return entry, hits, misses
+
+    @staticmethod
+    def _original_size(source_path, source_encoding, st):
+        """Uncompressed size, read from the gzip trailer instead of inflating the file."""
+        if source_encoding != 'gzip':
+            return st.st_size
+        with open(source_path, 'rb') as f:
+            f.seek(-4, os.SEEK_END)
+            return int.from_bytes(f.read(4), 'little')
+
+
+def compress_demos(demos, compressor, workers=1):
+    """
+    Compress all assets of the given demos concurrently.
+
+    demos: list of (name, output_dir, exclude)
+    Returns {name: report}, where report is the JSON-serialisable
+    size/ratio report for that demo. Demos are reported in input order.
+    """
+    tasks = []
+    for name, output_dir, exclude in demos:
+        for asset in compressor.find_assets(output_dir, exclude):
+            tasks.append((name, output_dir, asset))
+
+    def run(task):
+        return compressor.compress_asset(*task[2])
+
+    if workers > 1 and len(tasks) > 1:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pyswiftkit-compress') as pool:
+            results = list(pool.map(run, tasks))
+    else:
+        results = [run(task) for task in tasks]
+
+    reports = {}
+    for name, output_dir, _ in demos:
+        reports[name] = {
+            'demo': name,
+            'encodings': list(compressor.encodings),
+            'assets': {},
+            'totals': {'original': 0, 'encodings': {}},
+            'cache': {'hits': 0, 'misses': 0},
+        }
+    suffixes = dict(ENCODINGS)
+    for (name, output_dir, asset), (entry, hits, misses) in zip(tasks, results):
+        report = reports[name]
+        rel_path = os.path.relpath(asset[0], output_dir)
+        # Keep the variants across incremental syncs of a staged demo
+        for encoding in entry['variants']:
+            if encoding != asset[2]:
+                compressor.manifest.record_output(output_dir, rel_path + suffixes[encoding], origin=rel_path)
+        rel_path = rel_path.replace(os.sep, '/')
+        report['assets'][rel_path] = entry
+        report['totals']['original'] += entry['size']
+        for encoding, variant in entry['variants'].items():
+            total = report['totals']['encodings'].setdefault(encoding, {'original': 0, 'size': 0})
+            total['original'] += entry['size']
+            total['size'] += variant['size']
+        report['cache']['hits'] += hits
+        report['cache']['misses'] += misses
+    for report in reports.values():
+        for total in report['totals']['encodings'].values():
+            total['ratio'] = round(total['size'] / total['original'], 4) if total['original'] else 1.0
+    return reports
+
+
+def write_report(report, output_dir, history_dir=None):
+    """
+    Write the report into the demo's output directory and return a one-line
+    summary. If history_dir is given, the previous build's report for the
+    demo is read from there to show the size change, and replaced.
+    """
+    output_path = Path(output_dir) / REPORT_NAME
+    output_path.write_text(json.dumps(report, indent=2, sort_keys=True))
+
+    totals = report['totals']
+    parts = [f"{format_size(totals['original'])} raw"]
+    previous = None
+    if history_dir is not None:
+        history_path = Path(history_dir) / f"{report['demo'].replace('/', '_')}.json"
+        if history_path.exists():
+            try:
+                previous = json.loads(history_path.read_text())['totals']['encodings']
+            except (OSError, ValueError, KeyError, TypeError):
+                previous = None
+        history_path.parent.mkdir(parents=True, exist_ok=True)
+        history_path.write_text(json.dumps(report, indent=2, sort_keys=True))
+
+    for encoding in report['encodings']:
+        total = totals['encodings'].get(encoding)
+        if total is None:
+            continue
+        part = f"{encoding} {format_size(total['size'])}"
+        if total['original'] != totals['original']:
+            part += f" of {format_size(total['original'])}"
+        part += f" ({total['ratio']:.1%})"
+        # History from before the per-encoding totals holds plain sizes
+        before = previous.get(encoding) if previous else None
+        if isinstance(before, dict) and before['size'] != total['size']:
+            delta = total['size'] - before['size']
+            part += f" {'+' if delta > 0 else '-'}{format_size(abs(delta))}"
+        parts.append(part)
+    return ', '.join(parts)
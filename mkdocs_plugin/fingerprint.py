@@ -0,0 +1,216 @@
+"""
+Content-hashed ("fingerprinted") file names for demo bundles.
+
+Renames the WASM/JS assets of a demo to `name.<hash>.ext` and rewrites
+every quoted reference to them in the bundle's HTML/JS/JSON files, so the
+renamed files can be served as immutable. Entry points (`index.html`,
+`index.js`) keep their names because pages link to them directly (e.g.
+`import(basePath + 'index.js')` in docs/demo.md); they are only rewritten.
+
+The plan is computed from the demo's source directory before pages are
+rendered, so the editor snippet can link the fingerprinted names, and is
+applied to the site output after staging. The incremental sync places
+files under their new names itself (see sync_tree's `renames`), so apply()
+only has to rename what a plain copy staged.
+"""
+
+import hashlib
+import json
+import os
+import posixpath
+import re
+from pathlib import Path
+
+ASSET_EXTS = ('.wasm.gz', '.wasm', '.js', '.mjs')
+TEXT_EXTS = ('.html', '.js', '.mjs', '.json')
+ENTRY_POINTS = ('index.html', 'index.js')
+
+HASH_LENGTH = 10
+
+MANIFEST_NAME = 'manifest.json'
+
+# Quoted relative references to an asset, e.g. './instantiate.js' or "X.wasm.gz"
+REFERENCE_RE = re.compile(r'''(["'`])((?:\.{1,2}/)?[\w@.\-/]+?\.(?:wasm\.gz|wasm|mjs|js))\1''')
+
+
+def split_ext(name):
+    """Like os.path.splitext, but keeps `.wasm.gz` together."""
+    if name.endswith('.wasm.gz'):
+        return name[:-8], '.wasm.gz'
+    return posixpath.splitext(name)
+
+
+def fingerprinted_name(rel_path, content):
+    stem, ext = split_ext(rel_path)
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:HASH_LENGTH]}{ext}"
+
+
+class FingerprintPlan:
+    """
+    Renames and rewritten contents for one demo bundle.
+
+    renames:  {rel_path: fingerprinted rel_path}
+    rewrites: {rel_path: new bytes} for files whose references changed
+    """
+
+    def __init__(self, renames, rewrites):
+        self.renames = renames
+        self.rewrites = rewrites
+
+    def url(self, rel_path):
+        """Fingerprinted location of rel_path (unchanged if it wasn't renamed)."""
+        return self.renames.get(rel_path, rel_path)
+
+    def apply(self, output_dir):
+        """
+        Rename and rewrite files in output_dir (a copy of the planned source,
+        possibly already under the new names). Returns the rel_paths of the
+        files it wrote; files already as planned are left alone.
+
+        Rewritten files are written to a new inode and renamed into place:
+        staged files may be hardlinks to the source tree, which must not change.
+        """
+        output_dir = Path(output_dir)
+        written = []
+        for rel_path in sorted(set(self.renames) | set(self.rewrites)):
+            src = output_dir / rel_path
+            dst = output_dir / self.renames.get(rel_path, rel_path)
+            if not src.exists():
+                src = dst
+                if not src.exists():
+                    continue
+            if rel_path in self.rewrites:
+                if dst.exists() and dst.read_bytes() == self.rewrites[rel_path]:
+                    if dst != src:
+                        src.unlink()
+                    continue
+                written.append(self.renames.get(rel_path, rel_path))
+                tmp = dst.with_name(dst.name + '.pyswiftkit-tmp')
+                tmp.write_bytes(self.rewrites[rel_path])
+                os.replace(tmp, dst)
+                if dst != src:
+                    src.unlink()
+            else:
+                os.replace(src, dst)
+
+        manifest = json.dumps(self.renames, indent=2, sort_keys=True)
+        manifest_path = output_dir / MANIFEST_NAME
+        if not manifest_path.exists() or manifest_path.read_text() != manifest:
+            manifest_path.write_text(manifest)
+            written.append(MANIFEST_NAME)
+        return written
+
+
+def _strongly_connected(graph):
+    """Tarjan's algorithm. Returns the set of nodes that are part of a cycle."""
+    index = {}
+    lowlink = {}
+    stack = []
+    on_stack = set()
+    cyclic = set()
+    counter = [0]
+
+    def visit(node):
+        index[node] = lowlink[node] = counter[0]
+        counter[0] += 1
+        stack.append(node)
+        on_stack.add(node)
+        for target in graph.get(node, ()):
+            if target not in index:
+                visit(target)
+                lowlink[node] = min(lowlink[node], lowlink[target])
+            elif target in on_stack:
+                lowlink[node] = min(lowlink[node], index[target])
+        if lowlink[node] == index[node]:
+            component = []
+            while True:
+                member = stack.pop()
+                on_stack.discard(member)
+                component.append(member)
+                if member == node:
+                    break
+            if len(component) > 1 or node in graph.get(node, ()):
+                cyclic.update(component)
+
+    for node in sorted(graph):
+        if node not in index:
+            visit(node)
+    return cyclic
+
+
+def plan_fingerprints(source_dir, entry_points=ENTRY_POINTS):
+    """
+    Compute the FingerprintPlan for a demo source directory.
+
+    Files are renamed in dependency order: an asset's hash covers its
+    rewritten content, so a changed WASM bundle also changes the name of
+    every JS file that references it. Modules that import each other in a
+    cycle can't be hashed that way and keep their names.
+    """
+    source_dir = Path(source_dir)
+    files = {}
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        dirnames.sort()
+        for name in sorted(filenames):
+            abs_path = os.path.join(dirpath, name)
+            files[Path(abs_path).relative_to(source_dir).as_posix()] = abs_path
+
+    contents = {}
+    references = {}
+    for rel_path in files:
+        if not rel_path.endswith(TEXT_EXTS):
+            continue
+        with open(files[rel_path], 'rb') as f:
+            contents[rel_path] = f.read()
+        text = contents[rel_path].decode('utf-8', 'replace')
+        base = posixpath.dirname(rel_path)
+        refs = []
+        for match in REFERENCE_RE.finditer(text):
+            literal = match.group(2)
+            target = posixpath.normpath(posixpath.join(base, literal))
+            if target in files and target.endswith(ASSET_EXTS) and target != rel_path:
+                refs.append((literal, target))
+        references[rel_path] = refs
+
+    graph = {rel_path: sorted({target for _, target in refs})
+             for rel_path, refs in references.items()}
+    pinned = _strongly_connected(graph) | set(entry_points)
+
+    final = {}
+    rewrites = {}
+
+    def resolve(rel_path):
+        if rel_path in final:
+            return final[rel_path]
+        content = contents.get(rel_path)
+        if content is not None:
+            new_content = content
+            for literal, target in references[rel_path]:
+                # Cycle members are pinned, so this recursion always terminates
+                new_target = resolve(target) if target not in pinned else target
+                if new_target != target:
+                    new_literal = literal[:len(literal) - len(posixpath.basename(target))]
+                    new_literal += posixpath.basename(new_target)
+                    new_content = re.sub(
+                        rb'(["\'`])' + re.escape(literal.encode()) + rb'\1',
+                        lambda m: m.group(1) + new_literal.encode() + m.group(1),
+                        new_content,
+                    )
+            if new_content != content:
+                rewrites[rel_path] = new_content
+            content = new_content
+
+        if rel_path in pinned or not rel_path.endswith(ASSET_EXTS):
+            final[rel_path] = rel_path
+        else:
+            if content is None:
+                with open(files[rel_path], 'rb') as f:
+                    content = f.read()
+            final[rel_path] = fingerprinted_name(rel_path, content)
+        return final[rel_path]
+
+    for rel_path in files:
+        resolve(rel_path)
+
+    renames = {rel_path: new for rel_path, new in final.items() if new != rel_path}
+    return FingerprintPlan(renames, rewrites)
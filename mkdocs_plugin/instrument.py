@@ -0,0 +1,203 @@
+"""
+Timing and I/O instrumentation for the plugin.
+
+Hooks, staging jobs and served requests are recorded as spans with wall
+time and counters (bytes read/written, files touched, cache hits/misses).
+Spans are written as a Chrome trace (load it in chrome://tracing or
+https://ui.perfetto.dev) whose `summary` key holds the per-span totals
+that are also printed as a table at the end of each build, so CI can diff
+two runs.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from .sync import format_size
+
+COUNTERS = ('bytes_read', 'bytes_written', 'files', 'cache_hits', 'cache_misses')
+
+# Keep long `mkdocs serve` sessions from growing the trace without bound
+MAX_EVENTS = 200000
+
+
+class Span:
+    """One timed region. Counters are added with add()."""
+
+    __slots__ = ('name', 'category', 'start', 'counters')
+
+    def __init__(self, name, category):
+        self.name = name
+        self.category = category
+        self.start = time.perf_counter()
+        self.counters = {}
+
+    def add(self, **counters):
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def add(self, **counters):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+
+
+class Tracer:
+    """
+    Collects spans from any thread. A disabled tracer records nothing and
+    costs one attribute check per span.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.origin = time.perf_counter()
+        self.events = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def span(self, name, category='plugin', **counters):
+        """Context manager timing a region; yields the Span to add counters to."""
+        if not self.enabled:
+            return NULL_SPAN
+        return _SpanContext(self, name, category, counters)
+
+    def add(self, **counters):
+        """Add counters to the innermost open span on this thread."""
+        stack = getattr(self._local, 'stack', None)
+        if stack:
+            stack[-1].add(**counters)
+
+    def mark(self):
+        """Position in the event list; summary(since=mark) covers what follows."""
+        with self._lock:
+            return len(self.events)
+
+    def _finish(self, span):
+        end = time.perf_counter()
+        event = {
+            'name': span.name,
+            'cat': span.category,
+            'ph': 'X',
+            'ts': round((span.start - self.origin) * 1e6, 1),
+            'dur': round((end - span.start) * 1e6, 1),
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'args': span.counters,
+        }
+        with self._lock:
+            if len(self.events) < MAX_EVENTS:
+                self.events.append(event)
+            else:
+                self.dropped += 1
+
+    def summary(self, since=0, categories=None, exclude=()):
+        """
+        {name: {calls, total_ms, max_ms, <counters>}} for events after
+        `since`, optionally only for (or excluding) some categories.
+        """
+        with self._lock:
+            events = self.events[since:]
+        totals = {}
+        for event in events:
+            if event['cat'] in exclude or (categories is not None and event['cat'] not in categories):
+                continue
+            row = totals.setdefault(event['name'], {
+                'category': event['cat'], 'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                **{name: 0 for name in COUNTERS},
+            })
+            ms = event['dur'] / 1000
+            row['calls'] += 1
+            row['total_ms'] += ms
+            row['max_ms'] = max(row['max_ms'], ms)
+            for name, value in event['args'].items():
+                if name in row:
+                    row[name] += value
+        for row in totals.values():
+            row['total_ms'] = round(row['total_ms'], 3)
+            row['max_ms'] = round(row['max_ms'], 3)
+        return totals
+
+    def format_summary(self, since=0, categories=None, exclude=(), limit=20):
+        """The summary as a fixed-width table, slowest first."""
+        rows = sorted(self.summary(since, categories, exclude).items(),
+                      key=lambda item: item[1]['total_ms'], reverse=True)
+        if not rows:
+            return []
+        width = max(len(name) for name, _ in rows[:limit])
+        lines = [f"   {'span':<{width}} {'calls':>6} {'total':>10} {'max':>10} "
+                 f"{'read':>9} {'written':>9} {'files':>6} {'hits':>6} {'misses':>6}"]
+        for name, row in rows[:limit]:
+            lines.append(
+                f"   {name:<{width}} {row['calls']:>6} {row['total_ms']:>8.1f}ms {row['max_ms']:>8.1f}ms "
+                f"{format_size(row['bytes_read']):>9} {format_size(row['bytes_written']):>9} "
+                f"{row['files']:>6} {row['cache_hits']:>6} {row['cache_misses']:>6}"
+            )
+        return lines
+
+    def write(self, path):
+        """Write the Chrome trace with the summary of all recorded spans."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            events = list(self.events)
+            dropped = self.dropped
+        tmp = path.with_name(path.name + '.tmp')
+        tmp.write_text(json.dumps({
+            'traceEvents': events,
+            'displayTimeUnit': 'ms',
+            'summary': self.summary(),
+            'droppedEvents': dropped,
+        }))
+        os.replace(tmp, path)
+
+
+class _SpanContext:
+    __slots__ = ('tracer', 'span')
+
+    def __init__(self, tracer, name, category, counters):
+        self.tracer = tracer
+        self.span = Span(name, category)
+        if counters:
+            self.span.add(**counters)
+
+    def __enter__(self):
+        local = self.tracer._local
+        if not hasattr(local, 'stack'):
+            local.stack = []
+        local.stack.append(self.span)
+        self.span.start = time.perf_counter()
+        return self.span
+
+    def __exit__(self, *exc_info):
+        self.tracer._local.stack.pop()
+        self.tracer._finish(self.span)
+        return False
+
+
+def traced(name, category='hook'):
+    """Decorator timing a plugin method with the plugin's `tracer`."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            tracer = getattr(self, 'tracer', None)
+            if tracer is None or not tracer.enabled:
+                return method(self, *args, **kwargs)
+            with tracer.span(name, category):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
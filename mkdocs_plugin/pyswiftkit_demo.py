@@ -4,13 +4,67 @@ PySwiftKit Demo Plugin for MkDocs
 This plugin integrates the Swift WASM Monaco Editor into MkDocs pages,
 allowing interactive demonstration of PySwiftKit decorators and Python API generation.
 
-Includes support for serving gzip-compressed WASM files for faster loading.
+Includes support for serving Brotli/Zstandard/gzip-compressed demo assets
+for faster loading (see serve.py).
+Demo bundles are staged incrementally: only files whose content changed since
+the previous build are copied (see sync.py).
+With `vendor_monaco`, the Monaco Editor is served from the site itself
+instead of the CDN (see vendor.py).
+Under `mkdocs serve`, a change to one demo restages only that demo and
+reloads only the pages that embed it (see watch.py), and `async_server`
+serves WASM downloads from an asyncio server next to it (see asgi.py).
+With `instrument`, every hook is traced to a Chrome trace file (see
+instrument.py).
 """
 
+import fnmatch
 import os
+import re
+import threading
+import time
 from pathlib import Path
 from mkdocs.plugins import BasePlugin
 from mkdocs.config import config_options
+from mkdocs.exceptions import PluginError
+
+from .asgi import AssetApp, AsyncAssetServer
+from .compression import (
+    LEVELS, MAX_LEVELS, REPORT_NAME, AssetCompressor, compress_demos, supported_encodings, write_report,
+)
+from .fingerprint import plan_fingerprints
+from .instrument import Tracer, traced
+from .serve import DemoAssetHandler
+from .sync import SyncManifest, SyncStats, format_size, sync_tree
+from .vendor import MonacoVendor
+from .watch import ChangeWatcher
+
+MONACO_CDN_ORIGIN = 'https://cdn.jsdelivr.net'
+MONACO_CDN = f'{MONACO_CDN_ORIGIN}/npm/monaco-editor@0.45.0'
+
+# Watcher scope of changes that need a full site rebuild
+FULL_REBUILD = '*'
+
+
+def compile_page_matcher(patterns):
+    """
+    Compile `enable_on` into a single predicate over page source paths.
+    
+    - "re:<regex>"  matches if the regex is found in the path
+    - globs (containing *, ? or [) must match the whole path, e.g. "guide/*.md"
+    - anything else matches as a substring, as before
+    """
+    parts = []
+    for pattern in patterns:
+        if pattern.startswith('re:'):
+            parts.append(pattern[3:])
+        elif any(char in pattern for char in '*?['):
+            parts.append('^' + fnmatch.translate(pattern))
+        else:
+            parts.append(re.escape(pattern))
+    if not parts:
+        return lambda page_path: False
+    search = re.compile('|'.join(f'(?:{part})' for part in parts)).search
+    return lambda page_path: search(page_path.replace(os.sep, '/')) is not None
 
 
 class PySwiftKitDemoPlugin(BasePlugin):
@@ -26,19 +80,66 @@ class PySwiftKitDemoPlugin(BasePlugin):
     config_scheme = (
         ('wasm_path', config_options.Type(str, default='assets/wasm')),
         ('enable_on', config_options.Type(list, default=['demo', 'playground'])),
+        ('incremental_sync', config_options.Type(bool, default=True)),
+        ('sync_links', config_options.Type(bool, default=True)),
+        ('cache_dir', config_options.Type(str, default='.cache/pyswiftkit')),
+        ('staging_workers', config_options.Type(int, default=0)),
+        ('compress_assets', config_options.Type(bool, default=True)),
+        ('compression_formats', config_options.Type(list, default=['gzip', 'br', 'zstd'])),
+        ('compression_max', config_options.Type(bool, default=False)),
+        ('serve_cache_mb', config_options.Type(int, default=256)),
+        ('fingerprint_assets', config_options.Type(bool, default=False)),
+        ('lazy_load', config_options.Type(bool, default=True)),
+        ('vendor_monaco', config_options.Type(bool, default=False)),
+        ('monaco_version', config_options.Type(str, default='0.45.0')),
+        ('monaco_source', config_options.Type(str, default='')),
+        ('monaco_languages', config_options.Type(list, default=['python', 'swift'])),
+        ('scoped_reload', config_options.Type(bool, default=True)),
+        ('watch_debounce_ms', config_options.Type(int, default=500)),
+        ('async_server', config_options.Type(bool, default=False)),
+        ('async_server_port', config_options.Type(int, default=0)),
+        ('instrument', config_options.Type(bool, default=False)),
+        ('trace_file', config_options.Type(str, default='')),
     )
     
     def __init__(self):
         self.wasm_files_copied = False
         self.plugin_dir = Path(__file__).parent
+        self._stats_lock = threading.Lock()
+        self.asset_handler = None
+        self.fingerprints = {}
+        self.watcher = None
+        self.async_server = None
+        self.demo_pages = {}
+        self.tracer = Tracer()
+        self._trace_mark = 0
+        # Held while demo files are staged into docs/ or the site
+        self._staging_lock = threading.Lock()
         
     def on_config(self, config):
         """
         Called once during MkDocs config phase.
         Set up paths and verify WASM files exist.
         """
+        # Under `mkdocs serve` the plugin (and its tracer) outlives a build
+        self.tracer.enabled = self.config['instrument']
+        self._trace_mark = self.tracer.mark()
+        with self.tracer.span('on_config', 'hook'):
+            return self._configure(config)
+    
+    def _configure(self, config):
         self.wasm_path = self.config['wasm_path']
         self.enable_on = self.config['enable_on']
+        self.page_matcher = compile_page_matcher(self.enable_on)
+        self._snippet_cache = {}
+        self.cache_dir = self.plugin_dir.parent / self.config['cache_dir']
+        self.trace_file = self.plugin_dir.parent / (self.config['trace_file'] or
+                                                    Path(self.config['cache_dir']) / 'trace.json')
+        self.vendor = None
+        if self.config['vendor_monaco']:
+            self.vendor = MonacoVendor(self.config['monaco_version'], self.cache_dir,
+                                       source=self.config['monaco_source'] or None,
+                                       languages=self.config['monaco_languages'])
         
         # Define all demo directories to watch
         self.demo_dirs = [
@@ -53,9 +154,10 @@ class PySwiftKitDemoPlugin(BasePlugin):
         ]
         
         # Add demo directories to watch list for live reload
+        # (with scoped_reload, on_serve watches them itself)
         for demo_path, _ in self.demo_dirs:
             demo_dir = self.plugin_dir.parent / demo_path
-            if demo_dir.exists():
+            if demo_dir.exists() and not self.config['scoped_reload']:
                 if 'watch' not in config:
                     config['watch'] = []
                 config['watch'].append(str(demo_dir))
@@ -64,13 +166,17 @@ class PySwiftKitDemoPlugin(BasePlugin):
         
         return config
     
+    @traced('on_pre_build')
     def on_pre_build(self, config):
         """
         Copy WASM files to docs directory before build.
         """
-        import shutil
+        self.page_timings = []
+        self.sync_stats = SyncStats()
+        self.sync_manifest = SyncManifest(self.cache_dir / 'sync-manifest.json')
         
         # Copy all demo directories to docs
+        jobs = []
         for demo_path, wasm_name in self.demo_dirs:
             source_dir = self.plugin_dir.parent / demo_path
             if not source_dir.exists():
@@ -82,18 +188,107 @@ class PySwiftKitDemoPlugin(BasePlugin):
             
             # Copy main demo to docs/demo
             docs_dir = Path(config['docs_dir']) / 'demo'
-            print(f"PySwiftKit Plugin: Copying {demo_path} to docs...")
-            if docs_dir.exists():
-                shutil.rmtree(docs_dir)
-            shutil.copytree(source_dir, docs_dir)
-            print(f"PySwiftKit Plugin: WASM files available at {docs_dir}")
-
+            jobs.append((demo_path, self._stage_to_docs, (demo_path, source_dir, docs_dir)))
+        
+        with self._staging_lock:
+            self._run_staging(jobs)
+        
+        # Plan content-hashed names now, so pages rendered in this build link them
+        self.fingerprints = {}
+        if self.config['fingerprint_assets']:
+            for demo_path, _ in self.demo_dirs:
+                source_dir = self.plugin_dir.parent / demo_path
+                if source_dir.exists():
+                    self.fingerprints[self._site_rel_path(demo_path)] = plan_fingerprints(source_dir)
+    
+    def _stage_to_docs(self, demo_path, source_dir, docs_dir):
+        """Staging job for on_pre_build. Returns the lines to print."""
+        lines = [f"PySwiftKit Plugin: Copying {demo_path} to docs..."]
+        lines += self._stage_dir(source_dir, docs_dir)
+        lines.append(f"PySwiftKit Plugin: WASM files available at {docs_dir}")
+        return lines
+    
+    def _stage_dir(self, source_dir, output_dir, renames=None):
+        """
+        Mirror source_dir into output_dir and return the lines to print.
+        Uses the incremental sync unless `incremental_sync` is disabled;
+        only the incremental sync applies `renames` itself.
+        """
+        import shutil
+        
+        if not self.config['incremental_sync']:
+            if output_dir.exists():
+                shutil.rmtree(output_dir)
+            shutil.copytree(source_dir, output_dir)
+            return []
+        
+        stats = sync_tree(source_dir, output_dir, self.sync_manifest,
+                          use_links=self.config['sync_links'], renames=renames)
+        with self._stats_lock:
+            self.sync_stats.add(stats)
+        self.tracer.add(bytes_read=stats.bytes_hashed + stats.bytes_copied,
+                        bytes_written=stats.bytes_copied, files=stats.files_touched,
+                        cache_hits=stats.files_skipped,
+                        cache_misses=stats.files_copied + stats.files_linked)
+        return [f"   {stats.summary()}"]
+    
+    def _run_staging(self, jobs):
+        """
+        Run staging jobs on a bounded thread pool.
+        
+        Each job is (label, func, args) and func returns a list of output
+        lines. Lines are printed in job order once every job has finished,
+        so the log is identical no matter which copy completes first.
+        A failing job does not stop the others; all failures are reported
+        per demo and then raised as a single PluginError.
+        """
+        from concurrent.futures import ThreadPoolExecutor
+        
+        workers = self._worker_count(len(jobs))
+        
+        if workers == 1:
+            outcomes = [self._run_job(label, func, args) for label, func, args in jobs]
+        else:
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='pyswiftkit-stage') as pool:
+                futures = [pool.submit(self._run_job, label, func, args) for label, func, args in jobs]
+                outcomes = [future.result() for future in futures]
+        
+        failures = []
+        for (label, _, _), (lines, error) in zip(jobs, outcomes):
+            for line in lines:
+                print(line)
+            if error is not None:
+                print(f"   ❌ {label}: {error}")
+                failures.append(label)
         
+        if failures:
+            if self.config['incremental_sync']:
+                self.sync_manifest.save()
+            raise PluginError(f"PySwiftKit Plugin: Failed to stage demos: {', '.join(failures)}")
+    
+    def _worker_count(self, num_jobs):
+        """Bounded pool size from `staging_workers` (0 = one per CPU, capped at 8)."""
+        workers = self.config['staging_workers'] or min(8, os.cpu_count() or 1)
+        return max(1, min(workers, num_jobs or 1))
+    
+    def _run_job(self, label, func, args):
+        try:
+            with self.tracer.span(f"{func.__name__.lstrip('_')} {label}", 'stage'):
+                return func(*args), None
+        except Exception as e:
+            return [], e
+    
+    @traced('on_files')
     def on_files(self, files, config):
         """
         Called after files are collected. Ensure WASM files are included.
         """
         print(f"PySwiftKit Plugin: Preparing WASM files...")
+        # The demo is staged under the fingerprinted names in on_post_build;
+        # copies under the old names would only be deleted again
+        renamed = {f"{rel_path}/{name}" for rel_path, plan in self.fingerprints.items() for name in plan.renames}
+        for file in [file for file in files if file.src_uri in renamed]:
+            files.remove(file)
         return files
     
     def on_post_build(self, config):
@@ -101,122 +296,416 @@ class PySwiftKitDemoPlugin(BasePlugin):
         Copy WASM files to the output directory after build.
         Also set up a custom server handler for gzip compression.
         """
-        import shutil
-        site_dir = Path(config['site_dir'])
-        
+        with self.tracer.span('on_post_build', 'hook'):
+            with self._staging_lock:
+                self._post_build(Path(config['site_dir']))
+        self._report_trace()
+    
+    def _post_build(self, site_dir):
         # Copy all demo directories to site output
+        jobs = []
         for demo_path, wasm_name in self.demo_dirs:
             source_dir = self.plugin_dir.parent / demo_path
             if not source_dir.exists():
                 continue
             
-            # Determine output path
-            if demo_path.startswith('docs/'):
-                # docs/swift-to-python -> site/swift-to-python
-                rel_path = demo_path[5:]  # Remove 'docs/' prefix
-                output_dir = site_dir / rel_path
-            else:
-                # demo -> site/demo
-                output_dir = site_dir / demo_path
-            
-            print(f"PySwiftKit Plugin: Copying {demo_path} to {output_dir}")
-            if output_dir.exists():
-                shutil.rmtree(output_dir)
-            shutil.copytree(source_dir, output_dir)
-            
-            # Check if gzip compressed version exists
-            wasm_gz = output_dir / f'{wasm_name}.wasm.gz'
-            if wasm_gz.exists():
-                size_mb = wasm_gz.stat().st_size / 1024 / 1024
-                print(f"   ✅ {wasm_name}: {size_mb:.1f}MB (gzip compressed)")
+            output_dir = site_dir / self._site_rel_path(demo_path)
+            jobs.append((demo_path, self._stage_to_site, (demo_path, wasm_name, source_dir, output_dir)))
+        
+        self._run_staging(jobs)
         
         print(f"PySwiftKit Plugin: All WASM files copied successfully")
+        if self.config['incremental_sync']:
+            print(f"PySwiftKit Plugin: Sync total: {self.sync_stats.summary()}")
+        
+        for rel_path, plan in self.fingerprints.items():
+            with self.tracer.span(f"fingerprint {rel_path}", 'post_build') as span:
+                self._apply_fingerprints(site_dir / rel_path, plan)
+                span.add(files=len(set(plan.renames) | set(plan.rewrites)),
+                         bytes_written=sum(len(content) for content in plan.rewrites.values()))
+            if plan.renames:
+                print(f"PySwiftKit Plugin: Fingerprinted {len(plan.renames)} assets in {rel_path}")
+        
+        if self.vendor is not None:
+            self._vendor_monaco(site_dir)
+        
+        if self.config['compress_assets']:
+            self._compress_site(site_dir)
+        with self.tracer.span('save manifest', 'post_build'):
+            self.sync_manifest.save()
+        
+        self._report_page_timings()
+        
+        # A rebuild under `mkdocs serve`: free cached bodies of changed files
+        if self.asset_handler is not None:
+            if self.watcher is not None:
+                self.demo_pages = self._find_demo_pages(site_dir)
+            evicted = self.asset_handler.on_rebuild()
+            if evicted:
+                print(f"PySwiftKit Plugin: Evicted {evicted} changed assets from the serve cache")
+    
+    @traced('vendor monaco', 'post_build')
+    def _vendor_monaco(self, site_dir):
+        """Stage the pinned Monaco build into the site and link pages to it."""
+        try:
+            stats = self.vendor.stage(self.plugin_dir.parent, site_dir, self.sync_manifest,
+                                      use_links=self.config['sync_links'])
+        except Exception as e:
+            raise PluginError(f"PySwiftKit Plugin: Failed to vendor monaco-editor "
+                              f"{self.vendor.version}: {e} (set monaco_source to a local copy)")
+        rewritten = self.vendor.rewrite_html(site_dir)
+        self.tracer.add(bytes_written=stats.bytes_copied, files=stats.files_touched + rewritten,
+                        cache_hits=stats.files_skipped)
+        print(f"PySwiftKit Plugin: Vendored monaco-editor {self.vendor.version} "
+              f"at {self.vendor.site_path} ({stats.summary()}), {rewritten} pages relinked")
+    
+    @traced('compress', 'post_build')
+    def _compress_site(self, site_dir, demo_paths=None):
+        """
+        Write .gz/.br/.zst variants of every WASM/JS asset in the site output
+        and a compression-report.json per demo. With `demo_paths`, only
+        those demos are compressed.
+        """
+        encodings = supported_encodings(self.config['compression_formats'])
+        missing = [name for name in self.config['compression_formats'] if name not in encodings]
+        if missing:
+            print(f"PySwiftKit Plugin: Skipping {', '.join(missing)} compression "
+                  f"(pip install brotli zstandard)")
+        if not encodings:
+            return
+        
+        demo_outputs = []
+        for demo_path, _ in self.demo_dirs:
+            output_dir = site_dir / self._site_rel_path(demo_path)
+            if output_dir.exists() and (demo_paths is None or demo_path in demo_paths):
+                demo_outputs.append((demo_path, output_dir, ()))
+        if demo_paths is None:
+            if self.vendor is not None:
+                demo_outputs.append(('monaco', site_dir / self.vendor.site_path, ()))
+            # Theme and page scripts outside the demo bundles
+            demo_outputs.append(('site', site_dir, [output_dir for _, output_dir, _ in demo_outputs]))
+        
+        compressor = AssetCompressor(self.cache_dir, self.sync_manifest, encodings,
+                                     use_links=self.config['sync_links'],
+                                     levels=MAX_LEVELS if self.config['compression_max'] else LEVELS)
+        reports = compress_demos(demo_outputs, compressor,
+                                 workers=self._worker_count(len(demo_outputs) * len(encodings)))
+        
+        history_dir = self.cache_dir / 'reports'
+        for name, output_dir, _ in demo_outputs:
+            report = reports[name]
+            self.tracer.add(
+                bytes_read=report['totals']['original'],
+                bytes_written=sum(total['size'] for total in report['totals']['encodings'].values()),
+                files=len(report['assets']),
+                cache_hits=report['cache']['hits'],
+                cache_misses=report['cache']['misses'],
+            )
+            if not report['assets']:
+                continue
+            summary = write_report(report, output_dir, history_dir)
+            self.sync_manifest.record_output(output_dir, REPORT_NAME)
+            cache = report['cache']
+            print(f"PySwiftKit Plugin: Compressed {name}: {summary} "
+                  f"(cache {cache['hits']} hits, {cache['misses']} misses)")
+    
+    @staticmethod
+    def _site_rel_path(demo_path):
+        """Location of a demo inside the site output."""
+        if demo_path.startswith('docs/'):
+            # docs/swift-to-python -> site/swift-to-python
+            return demo_path[5:]  # Remove 'docs/' prefix
+        # demo -> site/demo
+        return demo_path
+    
+    def _stage_to_site(self, demo_path, wasm_name, source_dir, output_dir):
+        """Staging job for on_post_build. Returns the lines to print."""
+        lines = [f"PySwiftKit Plugin: Copying {demo_path} to {output_dir}"]
+        plan = self.fingerprints.get(self._site_rel_path(demo_path))
+        lines += self._stage_dir(source_dir, output_dir, plan.renames if plan is not None else None)
+        
+        # Check if gzip compressed version exists
+        wasm_gz = output_dir / f'{wasm_name}.wasm.gz'
+        if wasm_gz.exists():
+            size_mb = wasm_gz.stat().st_size / 1024 / 1024
+            lines.append(f"   ✅ {wasm_name}: {size_mb:.1f}MB (gzip compressed)")
+        return lines
+
+    def _apply_fingerprints(self, output_dir, plan):
+        """Apply a fingerprint plan to a staged demo; what it writes is kept by the next sync."""
+        for rel_path in plan.apply(output_dir):
+            self.sync_manifest.record_output(output_dir, rel_path)
 
     
+    @traced('on_serve')
     def on_serve(self, server, config, builder):
         """
-        Hook into the development server to add Brotli support.
+        Hook into the development server to serve precompressed
+        (Brotli/Zstandard/gzip) demo assets.
         Also watch the demo directories for changes.
         """
-        # Watch all demo directories for changes
-        for demo_path, _ in self.demo_dirs:
-            demo_dir = self.plugin_dir.parent / demo_path
-            if demo_dir.exists():
+        if self.config['scoped_reload']:
+            self._start_watcher(server, config)
+        else:
+            # Watch all demo directories for changes
+            for demo_path, _ in self.demo_dirs:
+                demo_dir = self.plugin_dir.parent / demo_path
+                if demo_dir.exists():
+                    try:
+                        server.watch(str(demo_dir))
+                    except Exception as e:
+                        print(f"PySwiftKit Plugin: Failed to watch {demo_dir}: {e}")
+            
+            # Watch templates directory
+            templates_dir = self.plugin_dir.parent / 'templates'
+            if templates_dir.exists():
                 try:
-                    server.watch(str(demo_dir))
+                    server.watch(str(templates_dir))
                 except Exception as e:
-                    print(f"PySwiftKit Plugin: Failed to watch {demo_dir}: {e}")
+                    print(f"PySwiftKit Plugin: Failed to watch {templates_dir}: {e}")
+        
+        # Serve demo assets with Accept-Encoding negotiation (br/zstd/gzip),
+        # passing everything else to the original _serve_request method
+        self.asset_handler = DemoAssetHandler(
+            server,
+            server._serve_request,
+            demo_prefixes=[self._site_rel_path(demo_path) for demo_path, _ in self.demo_dirs],
+            cache_bytes=self.config['serve_cache_mb'] * 1024 * 1024,
+            scoped_reload=self.watcher is not None,
+            tracer=self.tracer,
+        )
+        server._serve_request = self.asset_handler
+        if self.config['async_server']:
+            self._start_async_server(server, config)
+        if self.watcher is not None:
+            self.demo_pages = self._find_demo_pages(Path(config['site_dir']))
+        
+        return server
+    
+    def _start_watcher(self, server, config):
+        """
+        Take over watching docs_dir, the demo directories and templates/
+        from LiveReloadServer, with debouncing and per-demo scoping.
+        """
+        docs_dir = os.path.abspath(config['docs_dir'])
+        if docs_dir in getattr(server, '_watched_paths', {}):
+            server.unwatch(docs_dir)
         
-        # Watch templates directory
+        demo_sources = []
+        roots = [docs_dir]
+        for demo_path, _ in self.demo_dirs:
+            demo_dir = os.path.abspath(self.plugin_dir.parent / demo_path)
+            if os.path.isdir(demo_dir):
+                demo_sources.append((demo_dir + os.sep, demo_path))
+                if not (demo_dir + os.sep).startswith(docs_dir + os.sep):
+                    roots.append(demo_dir)
         templates_dir = self.plugin_dir.parent / 'templates'
         if templates_dir.exists():
-            try:
-                server.watch(str(templates_dir))
-            except Exception as e:
-                print(f"PySwiftKit Plugin: Failed to watch {templates_dir}: {e}")
+            roots.append(str(templates_dir))
+        # Copies made by on_pre_build, not sources
+        staged = [os.path.join(docs_dir, 'demo') + os.sep]
         
-        # Store original _serve_request method
-        original_serve_request = server._serve_request
+        def classify(path):
+            if path.startswith(tuple(staged)):
+                return None
+            for prefix, demo_path in demo_sources:
+                if path.startswith(prefix):
+                    return demo_path
+            return FULL_REBUILD
         
-        def custom_serve_request(environ, start_response):
-            """Intercept .wasm requests and serve .wasm.gz if available."""
-            path = environ.get("PATH_INFO", "")
+        def on_change(scopes):
+            if FULL_REBUILD in scopes:
+                self._request_rebuild(server)
+            else:
+                self._update_demos(server, sorted(scopes))
+        
+        self.watcher = ChangeWatcher(roots, classify, on_change,
+                                     quiet=self.config['watch_debounce_ms'] / 1000)
+        self.watcher.start()
+    
+    def _start_async_server(self, server, config):
+        """
+        Serve the site from an asyncio server on `async_server_port`
+        (default: the port after the dev server) and send .wasm there.
+        """
+        host, port = config['dev_addr'].host, config['dev_addr'].port
+        app = AssetApp(server.root, server.mount_path, wait_ready=self.asset_handler._wait_for_build)
+        self.async_server = AsyncAssetServer(app, host, self.config['async_server_port'] or port + 1)
+        try:
+            self.async_server.start()
+        except OSError as e:
+            print(f"PySwiftKit Plugin: Async asset server not started: {e}")
+            self.async_server = None
+            return
+        self.asset_handler.redirect_base = self.async_server.url
+        print(f"PySwiftKit Plugin: Serving WASM assets from {self.async_server.url}")
+    
+    @staticmethod
+    def _request_rebuild(server):
+        """Have LiveReloadServer run a full rebuild, as its own watcher would."""
+        with server._rebuild_cond:
+            server._want_rebuild = True
+            server._rebuild_cond.notify_all()
+    
+    def _update_demos(self, server, demo_paths):
+        """
+        Restage only the changed demos into the served site and reload only
+        the pages that embed them. Anything that would change rendered pages
+        (a new fingerprinted name in the editor snippet) needs a full rebuild.
+        """
+        with self._staging_lock:
+            with server._rebuild_cond:
+                rebuild_pending = server._want_rebuild
+            epoch = None if rebuild_pending else self.asset_handler.begin_partial_update()
+            if epoch is None:
+                self._request_rebuild(server)
+                return
             
-            if path.endswith(".wasm"):
-                # Convert WSGI path to filesystem path
-                rel_path = path[len(server.mount_path):] if path.startswith(server.mount_path) else path.lstrip("/")
-                wasm_file = os.path.join(server.root, rel_path)
-                gz_file = wasm_file + ".gz"
-                
-                # If .wasm doesn't exist but .gz does, serve the gzip version
-                if not os.path.exists(wasm_file) and os.path.exists(gz_file):
-                    try:
-                        with open(gz_file, 'rb') as f:
-                            content = f.read()
-                        
-                        headers = [
-                            ("Content-Type", "application/wasm"),
-                            ("Content-Encoding", "gzip"),
-                            ("Content-Length", str(len(content))),
-                            ("Cross-Origin-Embedder-Policy", "require-corp"),
-                            ("Cross-Origin-Opener-Policy", "same-origin"),
-                        ]
-                        start_response("200 OK", headers)
-                        return [content]
-                    except Exception:
-                        # Fall through to 404
-                        pass
+            site_dir = Path(server.root)
+            pages = set()
+            try:
+                for demo_path in demo_paths:
+                    pages |= self._restage_demo(site_dir, demo_path)
+                self.sync_manifest.save()
+            except Exception as e:
+                print(f"PySwiftKit Plugin: Restaging {', '.join(demo_paths)} failed ({e}), rebuilding")
+                self.asset_handler.end_partial_update(epoch, ())
+                self._request_rebuild(server)
+                return
             
-            # Pass through to original handler for all other requests
-            return original_serve_request(environ, start_response)
+            self.asset_handler.end_partial_update(epoch, pages)
+            print(f"PySwiftKit Plugin: Restaged {', '.join(demo_paths)}, "
+                  f"reloading {len(pages)} pages")
+    
+    @traced('restage demo', 'serve')
+    def _restage_demo(self, site_dir, demo_path):
+        """Stage one demo into the site. Returns the pages that embed it."""
+        wasm_name = dict(self.demo_dirs)[demo_path]
+        source_dir = self.plugin_dir.parent / demo_path
+        rel_path = self._site_rel_path(demo_path)
+        output_dir = site_dir / rel_path
         
-        # Replace the _serve_request method
-        server._serve_request = custom_serve_request
+        if self.config['fingerprint_assets']:
+            plan = plan_fingerprints(source_dir)
+            old_url = self._asset_url('PySwiftKitDemo.js')
+            self.fingerprints[rel_path] = plan
+            if self._asset_url('PySwiftKitDemo.js') != old_url:
+                raise RuntimeError("the editor snippet links a new fingerprinted name")
         
-        return server
+        for line in self._stage_to_site(demo_path, wasm_name, source_dir, output_dir):
+            print(line)
+        if rel_path in self.fingerprints:
+            self._apply_fingerprints(output_dir, self.fingerprints[rel_path])
+        if self.vendor is not None:
+            self.vendor.rewrite_html(site_dir, output_dir)
+        if self.config['compress_assets']:
+            self._compress_site(site_dir, [demo_path])
+        return self.demo_pages.get(rel_path, set())
+    
+    def _find_demo_pages(self, site_dir):
+        """Map each demo's site path to the HTML files that embed or belong to it."""
+        demo_rels = [self._site_rel_path(demo_path) for demo_path, _ in self.demo_dirs]
+        pages = {rel_path: set() for rel_path in demo_rels}
+        # A quoted URL into the demo (iframe src, import base path); nav links don't count
+        embeds = {
+            rel_path: re.compile(rb'(?<!href=)["\'](?:[^"\'\s<>]*/)?' + re.escape(rel_path.encode()) + rb'/')
+            for rel_path in demo_rels
+        }
+        for html_path in site_dir.rglob('*.html'):
+            page = html_path.relative_to(site_dir).as_posix()
+            content = html_path.read_bytes()
+            for rel_path in demo_rels:
+                if page.startswith(rel_path + '/') or embeds[rel_path].search(content):
+                    pages[rel_path].add(page)
+        return pages
         
+    def on_shutdown(self):
+        """Report serve cache effectiveness when `mkdocs serve` exits."""
+        if self.watcher is not None:
+            self.watcher.stop()
+        if self.async_server is not None:
+            self.async_server.stop()
+        if self.asset_handler is not None:
+            stats = self.asset_handler.cache.stats()
+            print(f"PySwiftKit Plugin: Serve cache: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['evictions']} evictions, {format_size(stats['bytes'])} held")
+        if self.tracer.enabled:
+            lines = self.tracer.format_summary(categories=('serve',))
+            if lines:
+                print("PySwiftKit Plugin: Serve trace summary:")
+                for line in lines:
+                    print(line)
+            self.tracer.write(self.trace_file)
+    
+    def _report_trace(self):
+        """Print this build's span table and write the trace file."""
+        if not self.tracer.enabled:
+            return
+        print(f"PySwiftKit Plugin: Build trace summary:")
+        for line in self.tracer.format_summary(since=self._trace_mark, exclude=('serve',)):
+            print(line)
+        self.tracer.write(self.trace_file)
+        print(f"PySwiftKit Plugin: Trace written to {self.trace_file}")
+        
+    @traced('on_page_content')
     def on_page_content(self, html, page, config, files):
         """
         Inject Monaco Editor and WASM loader into specific pages.
         """
+        started = time.perf_counter()
+        size_in = len(html)
+        
         # Check if this page should have the editor
         page_path = page.file.src_path
-        should_inject = any(pattern in page_path for pattern in self.enable_on)
-        
-        if not should_inject:
-            return html
+        should_inject = self.page_matcher(page_path)
         
-        # Generate the editor HTML
-        editor_html = self._generate_editor_html()
-        
-        # Inject before closing body tag or append
-        if '</body>' in html:
-            html = html.replace('</body>', f'{editor_html}</body>')
-        else:
-            html += editor_html
+        if should_inject:
+            # Generate the editor HTML (memoized per configuration)
+            editor_html = self._editor_html()
+            
+            # Inject before the last closing body tag or append; one copy of the page
+            body_end = html.rfind('</body>')
+            if body_end != -1:
+                html = html[:body_end] + editor_html + html[body_end:]
+            else:
+                html += editor_html
         
+        self.page_timings.append((page_path, should_inject, time.perf_counter() - started))
+        self.tracer.add(bytes_read=size_in, bytes_written=len(html), files=1)
         return html
     
+    def _report_page_timings(self):
+        """Print the on_page_content cost for this build."""
+        if not self.page_timings:
+            return
+        total = sum(elapsed for _, _, elapsed in self.page_timings)
+        injected = sum(1 for _, inject, _ in self.page_timings if inject)
+        print(f"PySwiftKit Plugin: on_page_content: {len(self.page_timings)} pages, "
+              f"{injected} injected, {total * 1000:.2f}ms total")
+        slowest = sorted(self.page_timings, key=lambda timing: timing[2], reverse=True)[:3]
+        for page_path, inject, elapsed in slowest:
+            print(f"   {elapsed * 1000:.2f}ms {page_path}{' (injected)' if inject else ''}")
+    
+    def _editor_html(self):
+        """_generate_editor_html(), rendered once per distinct configuration."""
+        key = (self.wasm_path, self.config['lazy_load'], self.vendor is not None,
+               self._asset_url('PySwiftKitDemo.js'))
+        editor_html = self._snippet_cache.get(key)
+        if editor_html is None:
+            self.tracer.add(cache_misses=1)
+            editor_html = self._snippet_cache[key] = self._generate_editor_html()
+        else:
+            self.tracer.add(cache_hits=1)
+        return editor_html
+    
+    def _asset_url(self, name):
+        """URL of a file in the `wasm_path` bundle, fingerprinted if enabled."""
+        base = self.wasm_path.strip('/')
+        plan = self.fingerprints.get(base)
+        if plan is not None:
+            name = plan.url(name)
+        return f"/{base}/{name}"
+    
     def _generate_editor_html(self):
         """Generate the HTML/JS for the Monaco Editor integration."""
         return f"""
@@ -261,7 +750,7 @@ class PySwiftKitDemoPlugin(BasePlugin):
             </style>
             
             <div id="pyswiftkit-container">
-                <div id="pyswift-loading">Loading Monaco Editor...</div>
+                <div id="pyswift-loading" tabindex="0">{'Interactive demo loads when scrolled into view' if self.config['lazy_load'] else 'Loading Monaco Editor...'}</div>
                 <div class="pyswift-editor-panel" style="display:none;">
                     <div class="pyswift-panel-header">Swift with PySwiftKit Decorators</div>
                     <div id="swift-editor" class="pyswift-editor"></div>
@@ -273,26 +762,112 @@ class PySwiftKitDemoPlugin(BasePlugin):
             </div>
         </div>
         
-        <script src="https://cdn.jsdelivr.net/npm/monaco-editor@0.45.0/min/vs/loader.js"></script>
-        <script>
-            require.config({{ paths: {{ 'vs': 'https://cdn.jsdelivr.net/npm/monaco-editor@0.45.0/min/vs' }} }});
-            
-            require(['vs/editor/editor.main'], function() {{
-                document.getElementById('pyswift-loading').style.display = 'none';
-                document.querySelectorAll('.pyswift-editor-panel').forEach(el => el.style.display = 'flex');
+        {self._generate_loader_script()}
+        """
+    
+    def _generate_loader_script(self):
+        """
+        Script that loads Monaco and the Swift WASM module.
+        
+        Eager mode loads everything while the page parses. Lazy mode only
+        preconnects to the CDN: the scripts are preloaded when the demo comes
+        within ~1000px of the viewport and loaded when it is ~200px away or
+        the user interacts with the placeholder.
+        
+        The CDN URLs are rewritten to the vendored copy after the build when
+        `vendor_monaco` is on; editor.main is then part of the bundle that
+        replaces loader.js, so it is not preloaded separately.
+        """
+        monaco_base = f"{MONACO_CDN}/min/vs"
+        wasm_script = self._asset_url('PySwiftKitDemo.js')
+        load_editor = f"""
+            function pyswiftkitLoadEditor() {{
+                require.config({{ paths: {{ 'vs': '{monaco_base}' }} }});
                 
-                // Load WASM module
-                const script = document.createElement('script');
-                script.src = '/{self.wasm_path}/PySwiftKitDemo.js';
-                script.onload = async function() {{
-                    if (window.initSwiftWasm) {{
-                        await window.initSwiftWasm();
-                    }}
-                }};
-                document.head.appendChild(script);
-            }});
-        </script>
+                require(['vs/editor/editor.main'], function() {{
+                    document.getElementById('pyswift-loading').style.display = 'none';
+                    document.querySelectorAll('.pyswift-editor-panel').forEach(el => el.style.display = 'flex');
+                    
+                    // Load WASM module
+                    const script = document.createElement('script');
+                    script.src = '{wasm_script}';
+                    script.onload = async function() {{
+                        if (window.initSwiftWasm) {{
+                            await window.initSwiftWasm();
+                        }}
+                    }};
+                    document.head.appendChild(script);
+                }});
+            }}"""
+        
+        if not self.config['lazy_load']:
+            return f"""<script src="{monaco_base}/loader.js"></script>
+        <script>{load_editor}
+            pyswiftkitLoadEditor();
+        </script>"""
+        
+        # Scripts are fetched without CORS, so the hints must not set crossorigin
+        hints = '' if self.vendor is not None else f"""<link rel="preconnect" href="{MONACO_CDN_ORIGIN}">
+        <link rel="dns-prefetch" href="{MONACO_CDN_ORIGIN}">
         """
+        preload_main = '' if self.vendor is not None else f"preload('{monaco_base}/editor/editor.main.js');"
+        return f"""{hints}<script>
+        (function() {{
+            const container = document.getElementById('pyswiftkit-container');
+            const loading = document.getElementById('pyswift-loading');
+            let warmed = false;
+            let started = false;
+            {load_editor}
+            
+            function preload(href) {{
+                const link = document.createElement('link');
+                link.rel = 'preload';
+                link.as = 'script';
+                link.href = href;
+                document.head.appendChild(link);
+            }}
+            
+            function warm() {{
+                if (warmed) return;
+                warmed = true;
+                preload('{monaco_base}/loader.js');
+                {preload_main}
+                preload('{wasm_script}');
+            }}
+            
+            function start() {{
+                if (started) return;
+                started = true;
+                warm();
+                loading.textContent = 'Loading Monaco Editor...';
+                const loader = document.createElement('script');
+                loader.src = '{monaco_base}/loader.js';
+                loader.onload = pyswiftkitLoadEditor;
+                document.head.appendChild(loader);
+            }}
+            
+            ['pointerdown', 'focusin', 'keydown'].forEach(function(type) {{
+                container.addEventListener(type, start, {{ once: true }});
+            }});
+            
+            if (!('IntersectionObserver' in window)) {{
+                start();
+                return;
+            }}
+            
+            function observe(margin, callback) {{
+                const observer = new IntersectionObserver(function(entries) {{
+                    if (entries.some(entry => entry.isIntersecting)) {{
+                        observer.disconnect();
+                        callback();
+                    }}
+                }}, {{ rootMargin: margin }});
+                observer.observe(container);
+            }}
+            observe('1000px 0px', warm);
+            observe('200px 0px', start);
+        }})();
+        </script>"""
 
 
 def get_plugin():
@@ -0,0 +1,607 @@
+"""
+Demo asset handler for the MkDocs development server.
+
+Wraps LiveReloadServer._serve_request and answers requests for demo assets
+(.wasm, .js, .html) with content negotiation on Accept-Encoding:
+
+1. A precompressed sibling (`.br`, `.zst`, `.gz`) the client accepts.
+2. Otherwise an on-the-fly compressed copy, cached per file version.
+3. Otherwise the identity body, decompressed from a sibling if the plain
+   file does not exist (e.g. only `PySwiftKitDemo.wasm.gz` is on disk).
+
+All bodies are held in a size-bounded in-memory LRU keyed on path plus
+mtime/size/inode; hit and miss counters are served at STATS_PATH.
+
+Responses carry a strong ETag (hash of the bytes sent) and Last-Modified,
+answer conditional requests with 304 Not Modified and support single byte
+ranges. Fingerprinted file names are marked immutable.
+
+With `scoped_reload`, the handler also answers the livereload long-poll:
+a demo restaged outside a full rebuild (see watch.py) only reloads the
+pages that embed it, identified by the poll's Referer.
+
+With `redirect_base`, `.wasm` requests are redirected to the async asset
+server (see asgi.py). Each request is recorded as a span on the plugin's
+tracer (see instrument.py) when instrumentation is on.
+
+Brotli and Zstandard are optional: they are used when the `brotli` and
+`zstandard` packages are installed, gzip always works.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import stat
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote, unquote, urlsplit
+
+from .instrument import Tracer
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+
+CONTENT_TYPES = {
+    '.wasm': 'application/wasm',
+    '.js': 'application/javascript',
+    '.html': 'text/html; charset=utf-8',
+}
+
+# Content-Encoding token -> file suffix, in order of preference
+ENCODINGS = (
+    ('br', '.br'),
+    ('zstd', '.zst'),
+    ('gzip', '.gz'),
+)
+
+# Live cache counters for debugging `mkdocs serve`
+STATS_PATH = '/_pyswiftkit/stats'
+
+LIVERELOAD_RE = re.compile(r'/livereload/([0-9]+)/[0-9]+')
+
+# Content-hashed file names (e.g. PySwiftKitDemo.3f9a1c2b.wasm) never change
+FINGERPRINT_RE = re.compile(r'\.[0-9a-f]{8,}\.[^/]+$')
+IMMUTABLE = "public, max-age=31536000, immutable"
+# Everything else may be reused, but only after a (cheap, 304) revalidation
+REVALIDATE = "no-cache"
+
+# Headers a 304 response must not carry
+ENTITY_HEADERS = {"Content-Type", "Content-Encoding", "Content-Length", "Accept-Ranges"}
+
+RANGE_NOT_SATISFIABLE = object()
+
+CROSS_ORIGIN_HEADERS = [
+    ("Cross-Origin-Embedder-Policy", "require-corp"),
+    ("Cross-Origin-Opener-Policy", "same-origin"),
+]
+
+
+def compress(data, encoding):
+    """Compress data for the given Content-Encoding. Returns None if unsupported."""
+    if encoding == 'gzip':
+        return gzip.compress(data, compresslevel=9)
+    if encoding == 'br' and brotli is not None:
+        return brotli.compress(data, quality=9)
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdCompressor(level=12).compress(data)
+    return None
+
+
+def decompress(data, encoding):
+    """Inverse of compress(). Returns None if the codec is not available."""
+    if encoding == 'gzip':
+        return gzip.decompress(data)
+    if encoding == 'br' and brotli is not None:
+        return brotli.decompress(data)
+    if encoding == 'zstd' and zstandard is not None:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return None
+
+
+def available_encodings():
+    """Content-Encodings this process can produce on the fly."""
+    return [name for name, _ in ENCODINGS
+            if name == 'gzip'
+            or (name == 'br' and brotli is not None)
+            or (name == 'zstd' and zstandard is not None)]
+
+
+def parse_accept_encoding(header):
+    """
+    Parse an Accept-Encoding header into {coding: qvalue}.
+    A `*` entry applies to every coding that is not listed explicitly.
+    """
+    accepted = {}
+    for part in (header or '').split(','):
+        fields = part.strip().split(';')
+        coding = fields[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in fields[1:]:
+            name, _, value = param.strip().partition('=')
+            if name.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    wildcard = accepted.pop('*', None)
+    if wildcard is not None:
+        for name, _ in ENCODINGS:
+            accepted.setdefault(name, wildcard)
+    return accepted
+
+
+def negotiate(accept_encoding):
+    """Return the codings the client accepts, best first (q-value, then our preference)."""
+    accepted = parse_accept_encoding(accept_encoding)
+    ranked = [(accepted.get(name, 0.0), -index, name)
+              for index, (name, _) in enumerate(ENCODINGS)]
+    return [name for q, _, name in sorted(ranked, reverse=True) if q > 0]
+
+
+def not_modified(environ, etag, mtime_ns):
+    """
+    Evaluate If-None-Match / If-Modified-Since (RFC 9110 13.1).
+    If-Modified-Since is ignored when If-None-Match is present.
+    """
+    if_none_match = environ.get("HTTP_IF_NONE_MATCH")
+    if if_none_match is not None:
+        if if_none_match.strip() == '*':
+            return True
+        # Weak comparison: W/"x" matches "x"
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag == etag:
+                return True
+        return False
+
+    if_modified_since = environ.get("HTTP_IF_MODIFIED_SINCE")
+    if if_modified_since:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(mtime_ns / 1e9) <= since
+    return False
+
+
+def parse_range(environ, etag, mtime_ns, length):
+    """
+    Parse a single-range `Range: bytes=...` header.
+
+    Returns (start, end) with end exclusive, None to send the full body
+    (no Range, multiple ranges, or a failed If-Range), or
+    RANGE_NOT_SATISFIABLE.
+    """
+    header = environ.get("HTTP_RANGE", "")
+    if not header.startswith("bytes=") or ',' in header:
+        return None
+
+    if_range = environ.get("HTTP_IF_RANGE")
+    if if_range:
+        if if_range.startswith('"'):
+            if if_range != etag:
+                return None
+        else:
+            try:
+                if parsedate_to_datetime(if_range).timestamp() < int(mtime_ns / 1e9):
+                    return None
+            except (TypeError, ValueError):
+                return None
+
+    first, _, last = header[6:].strip().partition('-')
+    try:
+        if first:
+            start = int(first)
+            end = int(last) + 1 if last else length
+        else:
+            # Suffix range: the last N bytes
+            start = max(0, length - int(last))
+            end = length
+    except ValueError:
+        return None
+    end = min(end, length)
+    if start >= length or start >= end:
+        return RANGE_NOT_SATISFIABLE
+    return start, end
+
+
+def file_signature(path):
+    """(mtime_ns, size, inode) of a regular file, or None if it doesn't exist."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(st.st_mode):
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class CachedBody(namedtuple('CachedBody', 'body etag')):
+    """A response body with its strong ETag (a hash of the exact bytes sent)."""
+
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, body):
+        return cls(body, '"%s"' % hashlib.sha256(body).hexdigest()[:32])
+
+
+class ResponseCache:
+    """
+    Size-bounded LRU of response bodies (CachedBody).
+
+    Keys are (path, file_signature, variant): a file that is rewritten gets
+    a new signature, so a stale body can never be served. prune() drops the
+    bodies of files that changed so they stop taking up memory.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body):
+        """Store body under key and return it as a CachedBody."""
+        entry = CachedBody.create(body)
+        if len(body) > self.max_bytes:
+            return entry
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old.body)
+            self._entries[key] = entry
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+                self.evictions += 1
+        return entry
+
+    def prune(self, epoch=None):
+        """
+        Evict every body whose file changed or disappeared, and HTML bodies
+        injected for a livereload epoch other than `epoch`. Returns the count.
+        """
+        with self._lock:
+            keys = list(self._entries)
+        stale = [key for key in keys
+                 if file_signature(key[0]) != key[1]
+                 or (key[2] is not None and key[2][1] not in (None, epoch))]
+        with self._lock:
+            for key in stale:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self.size -= len(entry.body)
+                    self.evictions += 1
+        return len(stale)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.size,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+class DemoAssetHandler:
+    """
+    Serve demo assets from the live-reload server's site root with
+    Accept-Encoding negotiation. Requests it does not handle are passed to
+    the original `_serve_request`.
+
+    Bodies are kept in a ResponseCache and handed to the server as the
+    cached bytes object itself, so repeated requests neither touch the disk
+    nor allocate a new buffer.
+    """
+
+    def __init__(self, server, fallback, demo_prefixes=(), cache_bytes=256 * 1024 * 1024,
+                 scoped_reload=False, redirect_base=None, tracer=None):
+        self.server = server
+        self.fallback = fallback
+        self.demo_prefixes = tuple(prefix.strip('/') + '/' for prefix in demo_prefixes)
+        self.cache = ResponseCache(cache_bytes)
+        self.scoped_reload = scoped_reload
+        self.redirect_base = redirect_base
+        self.tracer = tracer or Tracer()
+        # Epoch of the last full rebuild, and [(epoch, pages)] of partial updates since
+        self.full_epoch = getattr(server, '_visible_epoch', 0)
+        self.partial_reloads = []
+
+    def __call__(self, environ, start_response):
+        path = environ.get("PATH_INFO", "")
+        if path == STATS_PATH:
+            return self._serve_stats(start_response)
+        if self.scoped_reload and path.startswith('/livereload/'):
+            match = LIVERELOAD_RE.fullmatch(path)
+            if match:
+                return self._serve_livereload(environ, start_response, int(match[1]))
+        if path.startswith('/livereload/'):
+            # A long-poll; timing it would only measure the wait for a rebuild
+            return self.fallback(environ, start_response)
+
+        if not self.tracer.enabled:
+            return self._serve(environ, start_response, path)
+        with self.tracer.span(f"serve {posixpath.splitext(path)[1] or 'page'}", 'serve') as span:
+            result = self._serve(environ, start_response, path)
+            if isinstance(result, list):
+                span.add(bytes_written=sum(len(chunk) for chunk in result), files=1)
+            return result
+
+    def _serve(self, environ, start_response, path):
+        """Answer an asset request, or hand it to the original handler."""
+
+        ext = posixpath.splitext(path)[1]
+        if ext not in CONTENT_TYPES:
+            return self.fallback(environ, start_response)
+
+        rel_path = self._relative_path(path)
+        if rel_path is None:
+            return self.fallback(environ, start_response)
+
+        # .wasm is always ours; .js/.html only inside demo bundles
+        if ext != '.wasm' and not rel_path.startswith(self.demo_prefixes):
+            return self.fallback(environ, start_response)
+
+        if ext == '.wasm' and self.redirect_base:
+            query = environ.get("QUERY_STRING")
+            location = self.redirect_base + quote(path) + (f"?{query}" if query else "")
+            start_response("307 Temporary Redirect", [("Location", location), ("Content-Length", "0"),
+                                                      ("Cache-Control", "no-store")])
+            return []
+
+        self._wait_for_build()
+        file_path = os.path.join(self.server.root, rel_path)
+        try:
+            response = self._respond(file_path, ext, environ.get("HTTP_ACCEPT_ENCODING", ""))
+        except OSError:
+            response = None
+        if response is None:
+            return self.fallback(environ, start_response)
+
+        entry, encoding, mtime_ns = response
+        headers = self._headers(ext, encoding) + [
+            ("ETag", entry.etag),
+            ("Last-Modified", formatdate(mtime_ns / 1e9, usegmt=True)),
+            ("Cache-Control", IMMUTABLE if FINGERPRINT_RE.search(rel_path) else REVALIDATE),
+            ("Accept-Ranges", "bytes"),
+        ]
+        head = environ.get("REQUEST_METHOD") == "HEAD"
+
+        if not_modified(environ, entry.etag, mtime_ns):
+            start_response("304 Not Modified", [h for h in headers if h[0] not in ENTITY_HEADERS])
+            return []
+
+        body = entry.body
+        status = "200 OK"
+        byte_range = parse_range(environ, entry.etag, mtime_ns, len(body))
+        if byte_range is RANGE_NOT_SATISFIABLE:
+            start_response("416 Range Not Satisfiable",
+                           headers + [("Content-Range", f"bytes */{len(body)}"), ("Content-Length", "0")])
+            return []
+        if byte_range is not None:
+            start, end = byte_range
+            status = "206 Partial Content"
+            headers.append(("Content-Range", f"bytes {start}-{end - 1}/{len(body)}"))
+            body = body[start:end]
+
+        headers.insert(1, ("Content-Length", str(len(body))))
+        start_response(status, headers)
+        return [] if head else [body]
+
+    def on_rebuild(self):
+        """Called after every site rebuild: drop bodies of files that changed."""
+        wanted = getattr(self.server, '_wanted_epoch', None)
+        if wanted is not None:
+            with self.server._epoch_cond:
+                # Every page reloads for a full rebuild; older partial updates are moot
+                self.full_epoch = wanted
+                self.partial_reloads = [(epoch, pages) for epoch, pages in self.partial_reloads
+                                        if epoch > wanted]
+        return self.cache.prune(getattr(self.server, '_visible_epoch', None))
+
+    def begin_partial_update(self):
+        """
+        Mark the site as being updated outside a full rebuild, so requests
+        wait for it like they wait for a build. Returns the new epoch, or
+        None if a full rebuild is running.
+        """
+        with self.server._epoch_cond:
+            if self.server._visible_epoch != self.server._wanted_epoch:
+                return None
+            epoch = max(round(time.monotonic() * 1000), self.server._visible_epoch + 1)
+            self.server._wanted_epoch = epoch
+            return epoch
+
+    def end_partial_update(self, epoch, pages):
+        """
+        Publish a partial update: the site-relative HTML files in `pages`
+        reload, all other pages keep their state.
+        """
+        with self.server._epoch_cond:
+            if pages:
+                self.partial_reloads.append((epoch, frozenset(pages)))
+            # A full rebuild that started meanwhile publishes its own epoch
+            if self.server._wanted_epoch == epoch:
+                self.server._visible_epoch = epoch
+            self.server._epoch_cond.notify_all()
+        self.cache.prune(epoch)
+
+    def _serve_livereload(self, environ, start_response, epoch):
+        """
+        Long-poll like LiveReloadServer does, but only report a newer epoch
+        (which makes the page reload) for a full rebuild or a partial update
+        that touched the polling page.
+        """
+        page = self._referring_page(environ.get("HTTP_REFERER"))
+
+        def latest():
+            newest = self.full_epoch
+            for update_epoch, pages in self.partial_reloads:
+                if update_epoch > newest and page in pages:
+                    newest = update_epoch
+            return newest
+
+        start_response("200 OK", [("Content-Type", "text/plain")])
+        with self.server._epoch_cond:
+            self.server._epoch_cond.wait_for(lambda: latest() > epoch,
+                                             timeout=getattr(self.server, 'poll_response_timeout', 60))
+            return [b"%d" % max(epoch, latest())]
+
+    def _referring_page(self, referer):
+        """Site-relative HTML file of the page that sent a request."""
+        if not referer:
+            return None
+        path = urlsplit(referer).path
+        if path.endswith('/'):
+            path += 'index.html'
+        return self._relative_path(unquote(path))
+
+    def _serve_stats(self, start_response):
+        body = json.dumps(self.cache.stats()).encode()
+        start_response("200 OK", [("Content-Type", "application/json"),
+                                  ("Content-Length", str(len(body))),
+                                  ("Cache-Control", "no-store")])
+        return [body]
+
+    def _relative_path(self, path):
+        mount_path = getattr(self.server, 'mount_path', '/')
+        if not (path + '/').startswith(mount_path):
+            return None
+        # Normalize to prevent directory traversal, as LiveReloadServer does
+        return posixpath.normpath('/' + path[len(mount_path):]).lstrip('/')
+
+    def _wait_for_build(self):
+        """Don't serve a half-built site: wait for an ongoing rebuild to finish."""
+        cond = getattr(self.server, '_epoch_cond', None)
+        if cond is None:
+            return
+        with cond:
+            cond.wait_for(lambda: self.server._visible_epoch == self.server._wanted_epoch)
+
+    def _livereload_epoch(self, ext):
+        """Epoch to inject into HTML, or None when the page should be served as-is."""
+        if ext != '.html' or not getattr(self.server, '_watched_paths', None):
+            return None
+        return self.server._visible_epoch
+
+    def _respond(self, file_path, ext, accept_encoding):
+        """
+        Pick the representation to send: (cache entry, content encoding or
+        None, mtime of the file it came from), or None if there is no file.
+        """
+        plain = file_signature(file_path)
+        siblings = {}
+        for name, suffix in ENCODINGS:
+            signature = file_signature(file_path + suffix)
+            if signature is not None:
+                siblings[name] = (file_path + suffix, signature)
+        if plain is None and not siblings:
+            return None
+
+        # The file every derived body is produced from
+        if plain is not None:
+            origin = (file_path, plain, None)
+        else:
+            name, (path, signature) = next(iter(siblings.items()))
+            origin = (path, signature, name)
+
+        epoch = self._livereload_epoch(ext)
+        for encoding in negotiate(accept_encoding):
+            # Precompressed HTML can't carry the livereload script
+            if encoding in siblings and epoch is None:
+                path, signature = siblings[encoding]
+                return self._read(path, signature), encoding, signature[0]
+            if encoding in available_encodings():
+                entry = self._derived(origin, encoding, epoch)
+                if entry is not None:
+                    return entry, encoding, origin[1][0]
+
+        entry = self._derived(origin, None, epoch)
+        if entry is None:
+            return None
+        return entry, None, origin[1][0]
+
+    def _read(self, path, signature):
+        """File contents, from the cache when the file is unchanged."""
+        key = (path, signature, None)
+        entry = self.cache.get(key)
+        if entry is None:
+            with open(path, 'rb') as f:
+                entry = self.cache.put(key, f.read())
+            self.tracer.add(cache_misses=1, bytes_read=len(entry.body))
+        else:
+            self.tracer.add(cache_hits=1)
+        return entry
+
+    def _derived(self, origin, encoding, epoch):
+        """
+        Body for `encoding` (None = identity) derived from the origin file:
+        decompressed, livereload-injected and/or compressed on the fly.
+        """
+        path, signature, origin_encoding = origin
+        if encoding == origin_encoding and epoch is None:
+            return self._read(path, signature)
+
+        key = (path, signature, (encoding, epoch))
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.tracer.add(cache_hits=1)
+            return entry
+        self.tracer.add(cache_misses=1)
+
+        body = self._read(path, signature).body
+        if origin_encoding is not None:
+            body = decompress(body, origin_encoding)
+            if body is None:
+                return None
+        if epoch is not None:
+            body = self.server._inject_js_into_html(body, epoch)
+        if encoding is not None:
+            body = compress(body, encoding)
+            if body is None:
+                return None
+        return self.cache.put(key, body)
+
+    @staticmethod
+    def _headers(ext, encoding):
+        headers = [("Content-Type", CONTENT_TYPES[ext])]
+        if encoding:
+            headers.append(("Content-Encoding", encoding))
+        headers.append(("Vary", "Accept-Encoding"))
+        return headers + CROSS_ORIGIN_HEADERS
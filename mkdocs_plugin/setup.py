@@ -12,6 +12,9 @@ setup(
     install_requires=[
         'mkdocs>=1.4.0',
     ],
+    extras_require={
+        'compression': ['brotli>=1.0', 'zstandard>=0.19'],
+    },
     packages=find_packages(),
     entry_points={
         'mkdocs.plugins': [
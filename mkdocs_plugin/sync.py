@@ -0,0 +1,326 @@
+"""
+Incremental directory sync for PySwiftKit demo bundles.
+
+Replaces the rmtree + copytree staging of demo directories with a sync that
+only touches files whose content changed. A persistent manifest records the
+size, mtime and content hash of every source file (so unchanged sources are
+never re-hashed) together with the stat of the file we placed at the
+destination (so a destination we already wrote is recognised without reading
+it back).
+
+Files are placed with a hardlink when source and destination share a
+filesystem, a reflink (copy-on-write clone) where the filesystem supports it,
+and a plain copy otherwise.
+
+Steps that write into a synced directory afterwards (fingerprinting,
+compression) register their outputs with record_output(), so the next sync
+keeps them instead of deleting them as stale.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+from pathlib import Path
+
+MANIFEST_VERSION = 2
+
+# Linux ioctl request for a copy-on-write clone (btrfs, XFS, overlayfs, ...)
+FICLONE = 0x40049409
+
+HASH_CHUNK = 1024 * 1024
+
+
+class SyncStats:
+    """Byte and file counters for one sync run."""
+
+    def __init__(self):
+        self.bytes_hashed = 0
+        self.bytes_copied = 0
+        self.bytes_linked = 0
+        self.bytes_skipped = 0
+        self.files_copied = 0
+        self.files_linked = 0
+        self.files_skipped = 0
+        self.files_removed = 0
+
+    def add(self, other):
+        for name, value in vars(other).items():
+            setattr(self, name, getattr(self, name) + value)
+        return self
+
+    @property
+    def files_touched(self):
+        return self.files_copied + self.files_linked + self.files_removed
+
+    def summary(self):
+        return (
+            f"copied {format_size(self.bytes_copied)} ({self.files_copied} files), "
+            f"linked {format_size(self.bytes_linked)} ({self.files_linked} files), "
+            f"skipped {format_size(self.bytes_skipped)} ({self.files_skipped} files), "
+            f"removed {self.files_removed} stale"
+        )
+
+
+def format_size(num_bytes):
+    """Human readable size used in the plugin's console output."""
+    if num_bytes >= 1024 * 1024:
+        return f"{num_bytes / 1024 / 1024:.1f}MB"
+    if num_bytes >= 1024:
+        return f"{num_bytes / 1024:.1f}KB"
+    return f"{num_bytes}B"
+
+
+def file_digest(path):
+    """Return the sha256 hex digest of a file, read in 1MB chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class SyncManifest:
+    """
+    Persistent record of source digests and placed destination files.
+
+    Layout on disk (JSON):
+        {"version": 2,
+         "sources": {abs_path: [size, mtime_ns, sha256]},
+         "targets": {dest_dir: {rel_path: [size, mtime_ns, inode, sha256]
+                                         | [size, mtime_ns, inode, sha256, origin]}}}
+
+    Five-element records are generated outputs: `origin` is the placed file
+    they were made from (None if none in particular) and `sha256` that
+    file's source digest when they were made.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self.sources = {}
+        self.targets = {}
+        if self.path and self.path.exists():
+            try:
+                data = json.loads(self.path.read_text())
+                if data.get('version') == MANIFEST_VERSION:
+                    self.sources = data.get('sources', {})
+                    self.targets = data.get('targets', {})
+            except (OSError, ValueError):
+                # A corrupt manifest only costs us one full re-hash
+                pass
+
+    def digest(self, path, st, stats=None):
+        """
+        Return the content hash of ``path``, reusing the cached one if its
+        stat is unchanged. Bytes actually hashed are counted in ``stats``.
+        """
+        key = str(path)
+        cached = self.sources.get(key)
+        if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+            return cached[2]
+        if stats is not None:
+            stats.bytes_hashed += st.st_size
+        digest = file_digest(path)
+        self.sources[key] = [st.st_size, st.st_mtime_ns, digest]
+        return digest
+
+    def record_output(self, dest_dir, rel_path, origin=None):
+        """
+        Register a file written into a synced dest_dir after the sync, so the
+        next sync keeps it. A placed file rewritten in place only has its new
+        stat recorded. Otherwise the file is kept until it changes on disk or,
+        with `origin` (the rel_path of the placed file it was made from),
+        until that file's source changes or goes away. No-op if dest_dir is
+        not synced.
+        """
+        placed = self.targets.get(str(Path(dest_dir).resolve()))
+        if placed is None:
+            return
+        rel_path = os.path.normpath(rel_path)
+        origin = os.path.normpath(origin) if origin is not None else None
+        st = os.stat(os.path.join(dest_dir, rel_path))
+        record = placed.get(rel_path)
+        if record is not None and len(record) == 4:
+            placed[rel_path] = [st.st_size, st.st_mtime_ns, st.st_ino, record[3]]
+            return
+        source = placed.get(origin) if origin is not None else None
+        placed[rel_path] = [st.st_size, st.st_mtime_ns, st.st_ino, source[3] if source else None, origin]
+
+    def save(self):
+        if not self.path:
+            return
+        # Forget destinations that no longer exist (e.g. old `mkdocs serve` temp dirs)
+        self.targets = {k: v for k, v in self.targets.items() if os.path.isdir(k)}
+        self.sources = {k: v for k, v in self.sources.items() if os.path.exists(k)}
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix('.tmp')
+        tmp.write_text(json.dumps({
+            'version': MANIFEST_VERSION,
+            'sources': self.sources,
+            'targets': self.targets,
+        }))
+        os.replace(tmp, self.path)
+
+
+def _walk_files(root):
+    """Yield (rel_path, abs_path) for every regular file below root, in sorted order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            abs_path = os.path.join(dirpath, name)
+            yield os.path.relpath(abs_path, root), abs_path
+
+
+def _reflink(src, dst):
+    """Clone src into dst with FICLONE. Returns False if unsupported."""
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        import fcntl
+    except ImportError:
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except OSError:
+        try:
+            os.unlink(dst)
+        except OSError:
+            pass
+        return False
+
+
+def place_file(src, dst, use_links):
+    """
+    Put a copy of src at dst, replacing any existing file atomically.
+    Returns True if no bytes had to be copied (hardlink or reflink).
+    """
+    tmp = f"{dst}.pyswiftkit-tmp"
+    if os.path.lexists(tmp):
+        os.unlink(tmp)
+
+    if use_links:
+        try:
+            if os.path.samefile(src, dst):
+                # Already linked; replacing a link with itself would leave tmp behind
+                return True
+        except OSError:
+            pass
+
+    if use_links:
+        try:
+            os.link(src, tmp)
+            os.replace(tmp, dst)
+            return True
+        except OSError:
+            pass
+        if _reflink(src, tmp):
+            os.replace(tmp, dst)
+            return True
+
+    shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+    return False
+
+
+def _output_is_current(record, path, placed):
+    """Whether a generated output is as recorded and made from what is placed now."""
+    st = os.stat(path)
+    if [st.st_size, st.st_mtime_ns, st.st_ino] != record[:3]:
+        return False
+    origin = record[4]
+    return origin is None or (origin in placed and placed[origin][3] == record[3])
+
+
+def _prune_empty_dirs(root):
+    for dirpath, dirnames, filenames in os.walk(root, topdown=False):
+        if dirpath != str(root) and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+
+def sync_tree(source_dir, dest_dir, manifest, use_links=True, renames=None):
+    """
+    Make dest_dir an exact mirror of source_dir, touching only what changed.
+
+    Files are compared by content hash; a destination is trusted without
+    reading it when its stat still matches what we recorded when placing it.
+    `renames` ({rel_path: dest rel_path}) places files under other names.
+    Files in dest_dir that no longer exist in source_dir are deleted, except
+    outputs registered with record_output() that are still current.
+
+    Returns a SyncStats for the run. The manifest is updated in place but
+    not saved.
+    """
+    source_dir = Path(source_dir)
+    dest_dir = Path(dest_dir)
+    stats = SyncStats()
+
+    if dest_dir.exists() and not dest_dir.is_dir():
+        dest_dir.unlink()
+    dest_dir.mkdir(parents=True, exist_ok=True)
+
+    key = str(dest_dir.resolve())
+    previous = manifest.targets.get(key, {})
+    placed = {}
+
+    for source_rel_path, src in _walk_files(source_dir):
+        rel_path = source_rel_path
+        if renames:
+            rel_path = os.path.normpath(renames.get(Path(source_rel_path).as_posix(), source_rel_path))
+        dst = dest_dir / rel_path
+        src_stat = os.stat(src)
+        digest = manifest.digest(src, src_stat, stats)
+
+        try:
+            dst_stat = os.stat(dst)
+        except FileNotFoundError:
+            dst_stat = None
+
+        record = previous.get(rel_path)
+        up_to_date = dst_stat is not None and (
+            (src_stat.st_ino == dst_stat.st_ino and src_stat.st_dev == dst_stat.st_dev)
+            or (
+                record is not None
+                and record[3] == digest
+                and record[0] == dst_stat.st_size
+                and record[1] == dst_stat.st_mtime_ns
+                and record[2] == dst_stat.st_ino
+            )
+        )
+
+        if up_to_date:
+            stats.bytes_skipped += src_stat.st_size
+            stats.files_skipped += 1
+        else:
+            if dst_stat is not None and os.path.isdir(dst):
+                shutil.rmtree(dst)
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            if place_file(src, dst, use_links):
+                stats.bytes_linked += src_stat.st_size
+                stats.files_linked += 1
+            else:
+                stats.bytes_copied += src_stat.st_size
+                stats.files_copied += 1
+            dst_stat = os.stat(dst)
+
+        placed[rel_path] = [dst_stat.st_size, dst_stat.st_mtime_ns, dst_stat.st_ino, digest]
+
+    # Remove stale files that are no longer part of the source tree
+    outputs = {}
+    for rel_path, dst in list(_walk_files(dest_dir)):
+        if rel_path in placed:
+            continue
+        record = previous.get(rel_path)
+        if record is not None and len(record) == 5 and _output_is_current(record, dst, placed):
+            outputs[rel_path] = record
+            continue
+        os.unlink(dst)
+        stats.files_removed += 1
+    placed.update(outputs)
+    _prune_empty_dirs(dest_dir)
+
+    manifest.targets[key] = placed
+    return stats
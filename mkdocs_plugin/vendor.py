@@ -0,0 +1,185 @@
+"""
+Self-hosted Monaco Editor for the demo pages.
+
+Vendors a pinned `monaco-editor` build into the site output so the demos
+work on networks without access to the CDN, and pages don't wait on
+third-party DNS/TLS and dozens of AMD module requests:
+
+- the package comes from a local `monaco-editor` directory or tarball, or
+  is downloaded once from the npm registry into the plugin cache;
+- `min/vs` is staged under `_vendor/monaco-editor@<version>/vs`;
+- the AMD loader plus the modules the editors actually use (editor core,
+  its NLS strings and the configured basic languages) are concatenated
+  into one `monaco.bundle.js`, which the compression stage then
+  precompresses like any other script;
+- CDN references in the built HTML are rewritten to the vendored copy.
+"""
+
+import io
+import json
+import os
+import re
+import shutil
+import tarfile
+import urllib.request
+from pathlib import Path
+
+from .sync import place_file, sync_tree
+
+REGISTRY_URL = 'https://registry.npmjs.org/monaco-editor/-/monaco-editor-{version}.tgz'
+
+# Monaco on the CDN, any version: pages are relinked to the pinned copy
+CDN_RE = re.compile(rb'https://cdn\.jsdelivr\.net/npm/monaco-editor@[\w.\-]+/min/vs(/loader\.js)?')
+
+VENDOR_DIR = '_vendor'
+
+BUNDLE_NAME = 'monaco.bundle.js'
+
+# Modules loaded by `require(['vs/editor/editor.main'])`, in load order
+CORE_MODULES = ('vs/editor/editor.main.nls', 'vs/editor/editor.main')
+
+ANONYMOUS_DEFINE_RE = re.compile(r'\bdefine\(\s*(?=[\[{f(])')
+
+
+class MonacoVendor:
+    """Locate, stage and bundle one pinned Monaco version."""
+
+    def __init__(self, version, cache_dir, source=None, languages=('python', 'swift')):
+        self.version = version
+        self.cache_dir = Path(cache_dir) / 'monaco'
+        self.source = Path(source) if source else None
+        self.languages = tuple(languages)
+
+    @property
+    def site_path(self):
+        """Location of the vendored copy inside the site output."""
+        return f"{VENDOR_DIR}/monaco-editor@{self.version}"
+
+    def package_dir(self, project_dir):
+        """
+        Return the `min/vs` directory of the pinned Monaco build.
+
+        Looks at the configured source, then node_modules, then the cache;
+        downloads the tarball from the npm registry as a last resort.
+        """
+        candidates = []
+        if self.source is not None:
+            source = self.source if self.source.is_absolute() else Path(project_dir) / self.source
+            if source.suffix in ('.tgz', '.gz'):
+                return self._extract(source.read_bytes())
+            candidates.append(source)
+        candidates.append(Path(project_dir) / 'node_modules' / 'monaco-editor')
+        candidates.append(self.cache_dir / self.version)
+
+        for candidate in candidates:
+            vs_dir = candidate / 'min' / 'vs'
+            if vs_dir.is_dir() and self._version_of(candidate) == self.version:
+                return vs_dir
+
+        url = REGISTRY_URL.format(version=self.version)
+        print(f"PySwiftKit Plugin: Downloading monaco-editor {self.version} from {url}")
+        with urllib.request.urlopen(url, timeout=60) as response:
+            return self._extract(response.read())
+
+    @staticmethod
+    def _version_of(package_dir):
+        try:
+            return json.loads((package_dir / 'package.json').read_text())['version']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _extract(self, tarball):
+        """Unpack package.json and min/vs from an npm tarball into the cache."""
+        target = self.cache_dir / self.version
+        tmp = self.cache_dir / f"{self.version}.tmp"
+        if tmp.exists():
+            shutil.rmtree(tmp)
+        with tarfile.open(fileobj=io.BytesIO(tarball), mode='r:gz') as archive:
+            for member in archive.getmembers():
+                name = member.name.split('/', 1)[-1]
+                if not (name == 'package.json' or name.startswith('min/vs/')):
+                    continue
+                if not member.isfile() or '..' in name.split('/'):
+                    continue
+                dest = tmp / name
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                with archive.extractfile(member) as src, open(dest, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+        if self._version_of(tmp) != self.version:
+            shutil.rmtree(tmp)
+            raise ValueError(f"tarball does not contain monaco-editor {self.version}")
+        if target.exists():
+            shutil.rmtree(target)
+        os.replace(tmp, target)
+        return target / 'min' / 'vs'
+
+    def bundle_modules(self):
+        """AMD module ids pre-bundled into monaco.bundle.js."""
+        languages = tuple(f"vs/basic-languages/{name}/{name}" for name in self.languages)
+        return CORE_MODULES + languages
+
+    def build_bundle(self, vs_dir):
+        """Concatenate the loader and the used modules into one script."""
+        parts = [(vs_dir / 'loader.js').read_text(encoding='utf-8')]
+        for module_id in self.bundle_modules():
+            path = vs_dir.parent / f"{module_id}.js"
+            if not path.exists():
+                print(f"PySwiftKit Plugin: Monaco module {module_id} not found, loading it on demand")
+                continue
+            source = path.read_text(encoding='utf-8')
+            # Give anonymous modules their id so they can live in a shared file
+            if f'define("{module_id}"' not in source and f"define('{module_id}'" not in source:
+                source = ANONYMOUS_DEFINE_RE.sub(f'define("{module_id}", ', source, count=1)
+            parts.append(source)
+        return ';\n'.join(parts) + '\n'
+
+    def stage(self, project_dir, site_dir, manifest, use_links=True):
+        """
+        Copy min/vs into the site and write monaco.bundle.js.
+        Returns the SyncStats of the copy.
+        """
+        vs_dir = self.package_dir(project_dir)
+        output_dir = Path(site_dir) / self.site_path
+        stats = sync_tree(vs_dir, output_dir / 'vs', manifest, use_links=use_links)
+
+        bundle = output_dir / BUNDLE_NAME
+        cached_bundle = self.cache_dir / f"{self.version}-{'-'.join(self.languages)}.bundle.js"
+        if not cached_bundle.exists():
+            tmp = cached_bundle.with_name(cached_bundle.name + '.tmp')
+            tmp.write_text(self.build_bundle(vs_dir), encoding='utf-8')
+            os.replace(tmp, cached_bundle)
+        place_file(str(cached_bundle), str(bundle), use_links)
+        return stats
+
+    def rewrite_html(self, site_dir, root=None):
+        """
+        Point every built HTML file (below `root`, default the whole site)
+        at the vendored copy instead of the CDN. URLs are made relative to
+        each file, so the site works under any mount path. Returns the
+        number of files rewritten.
+        """
+        site_dir = Path(site_dir)
+        rewritten = 0
+        for dirpath, dirnames, filenames in os.walk(root or site_dir):
+            if os.path.relpath(dirpath, site_dir).split(os.sep)[0] == VENDOR_DIR:
+                dirnames[:] = []
+                continue
+            for name in filenames:
+                if not name.endswith('.html'):
+                    continue
+                path = Path(dirpath) / name
+                content = path.read_bytes()
+                if b'monaco-editor@' not in content:
+                    continue
+                base = os.path.relpath(site_dir / self.site_path, dirpath).replace(os.sep, '/')
+                bundle_url = f"{base}/{BUNDLE_NAME}".encode()
+                vs_url = f"{base}/vs".encode()
+                content, count = CDN_RE.subn(lambda m: bundle_url if m.group(1) else vs_url, content)
+                if not count:
+                    continue
+                # Staged files may be hardlinks into the source tree: write a new inode
+                tmp = path.with_name(name + '.pyswiftkit-tmp')
+                tmp.write_bytes(content)
+                os.replace(tmp, path)
+                rewritten += 1
+        return rewritten
@@ -0,0 +1,159 @@
+"""
+Debounced file watcher for `mkdocs serve`.
+
+LiveReloadServer polls every watched tree twice a second and rebuilds the
+whole site 0.1s after the last change it saw, so `./build.sh` rewriting
+eight WASM bundles fires several full rebuilds, some of them while a
+`.wasm.gz` is still half written.
+
+ChangeWatcher uses watchdog's native observer (inotify on Linux, FSEvents
+on macOS, ReadDirectoryChangesW on Windows) and:
+
+- waits for a quiet period with no events before acting;
+- holds back a batch while any `.gz`/`.wasm` file in it is incomplete (a
+  truncated gzip stream or a missing WASM header), up to a timeout;
+- ignores editor/atomic-write temporaries;
+- hands the batch to a callback grouped by scope (e.g. the demo a file
+  belongs to), so the plugin can restage one demo instead of the site.
+"""
+
+import os
+import threading
+import time
+import zlib
+
+import watchdog.events
+import watchdog.observers
+
+# Events caused by reading files (including our own completeness checks)
+IGNORED_EVENTS = ('opened', 'closed_no_write')
+
+TEMPORARY_SUFFIXES = ('.pyswiftkit-tmp', '.tmp', '.swp', '.swx', '.part', '.crdownload', '~')
+
+WASM_MAGIC = b'\0asm'
+
+READ_CHUNK = 1024 * 1024
+
+
+def is_temporary(path):
+    """Scratch files written by editors, downloads and atomic writers."""
+    name = os.path.basename(path)
+    return name.startswith('.#') or name.endswith(TEMPORARY_SUFFIXES)
+
+
+def is_complete(path):
+    """
+    False if path is a gzip stream without its end, or a WASM module
+    without its header: the writer is still busy with it.
+    """
+    try:
+        if path.endswith('.gz'):
+            inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(READ_CHUNK), b''):
+                    inflater.decompress(chunk)
+                    if inflater.eof:
+                        return True
+            return inflater.eof
+        if path.endswith('.wasm'):
+            with open(path, 'rb') as f:
+                return f.read(4) == WASM_MAGIC
+    except FileNotFoundError:
+        # Deleted again; the deletion is the change
+        return True
+    except (OSError, zlib.error):
+        return False
+    return True
+
+
+class ChangeWatcher:
+    """
+    Watch directory trees and report settled batches of changes.
+
+    classify(path) returns the scope of a changed file, or None to ignore
+    it. on_change({scope: [paths]}) runs on the watcher's own thread.
+    """
+
+    def __init__(self, roots, classify, on_change, quiet=0.5, settle_timeout=30.0):
+        self.roots = [os.path.abspath(root) for root in roots]
+        self.classify = classify
+        self.on_change = on_change
+        self.quiet = quiet
+        self.settle_timeout = settle_timeout
+        self._pending = {}
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._waiting_on = None
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._observer = watchdog.observers.Observer()
+        self._thread = threading.Thread(target=self._run, name='pyswiftkit-watch', daemon=True)
+
+    def start(self):
+        handler = watchdog.events.FileSystemEventHandler()
+        handler.on_any_event = self._on_event
+        for root in self.roots:
+            self._observer.schedule(handler, root, recursive=True)
+        self._observer.start()
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        self._observer.stop()
+
+    def _on_event(self, event):
+        if event.is_directory or event.event_type in IGNORED_EVENTS:
+            return
+        paths = [event.src_path, getattr(event, 'dest_path', '')]
+        changed = {}
+        for path in paths:
+            if not path or is_temporary(path):
+                continue
+            scope = self.classify(os.fsdecode(path))
+            if scope is not None:
+                changed[os.fsdecode(path)] = scope
+        if not changed:
+            return
+        with self._cond:
+            if not self._pending:
+                self._first_event = time.monotonic()
+            self._pending.update(changed)
+            self._last_event = time.monotonic()
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending or self._stopped)
+                if self._stopped:
+                    return
+                # Debounce: wait until nothing changed for `quiet` seconds
+                while not self._stopped:
+                    remaining = self._last_event + self.quiet - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch, self._pending = self._pending, {}
+                started = self._first_event
+
+            incomplete = [path for path in batch if not is_complete(path)]
+            if incomplete and time.monotonic() - started < self.settle_timeout:
+                with self._cond:
+                    self._first_event = min(started, self._first_event) if self._pending else started
+                    self._pending = {**batch, **self._pending}
+                    self._last_event = time.monotonic()
+                if self._waiting_on != incomplete[0]:
+                    self._waiting_on = incomplete[0]
+                    print(f"PySwiftKit Plugin: Waiting for half-written {incomplete[0]}")
+                continue
+            self._waiting_on = None
+
+            scopes = {}
+            for path, scope in sorted(batch.items()):
+                scopes.setdefault(scope, []).append(path)
+            try:
+                self.on_change(scopes)
+            except Exception as e:
+                print(f"PySwiftKit Plugin: Error handling file changes: {e}")